@@ -13,10 +13,14 @@ from .db import upgrade_table
 from .email_client import EmailClient
 from .events import NatsPublisher
 from .flow import Flow
+from .flow_sync import FlowSync
 from .flow_utils import FlowUtils
+from .flow_watcher import FlowWatcher
+from .http_session import OutboundSession
 from .menu import MenuClient
 from .repository.middlewares import EmailServer
 from .server import MenuFlowServer
+from .utils.circuit_breaker import CircuitBreakers
 from .version import version
 from .web.management_api import ManagementAPI
 
@@ -55,6 +59,8 @@ class MenuFlow(Program):
         self.prepare_db()
         MenuClient.init_cls(self)
         NatsPublisher.init_cls(self.config)
+        CircuitBreakers.init_cls(self.config)
+        EmailClient.init_cls(self.config)
         self.flow_utils = FlowUtils()
         self.management_api = ManagementAPI(
             config=self.config,
@@ -101,7 +107,13 @@ class MenuFlow(Program):
 
     async def start(self) -> None:
         await self.start_db()
+        self.active_tag_listener = asyncio.create_task(
+            FlowSync.listen_active_tag(self.config["menuflow.database"])
+        )
         await asyncio.gather(*[menu.start() async for menu in MenuClient.all()])
+        flow_watcher = FlowWatcher(self.config)
+        if flow_watcher.enabled:
+            self.flow_watcher = asyncio.create_task(flow_watcher.watch())
         await super().start()
         await self.server.start()
         await NatsPublisher.get_connection()
@@ -110,7 +122,14 @@ class MenuFlow(Program):
             asyncio.create_task(self.start_email_connections())
 
     async def stop(self) -> None:
+        # The queued emails report their delivery as node events, so they are sent before
+        # closing the NATS connection
+        await EmailClient.stop_all()
         await NatsPublisher.close_connection()
+        if getattr(self, "active_tag_listener", None):
+            self.active_tag_listener.cancel()
+        if getattr(self, "flow_watcher", None):
+            self.flow_watcher.cancel()
         self.add_shutdown_actions(*(menu.stop() for menu in MenuClient.cache.values()))
         await super().stop()
         self.log.debug("Stopping server")
@@ -119,6 +138,7 @@ class MenuFlow(Program):
         except asyncio.TimeoutError:
             self.log.warning("Stopping server timed out")
         await self.db.stop()
+        await OutboundSession.close()
 
 
 MenuFlow().run()
@@ -20,11 +20,18 @@ class Config(BaseFileConfig):
         copy("menuflow.sync.room_event_filter")
         copy("menuflow.timeouts.http_request")
         copy("menuflow.timeouts.middlewares")
+        copy_dict("menuflow.http_client")
+        copy_dict("menuflow.circuit_breaker")
+        copy_dict("menuflow.media_cache")
+        copy_dict("menuflow.media")
+        copy_dict("menuflow.email")
         copy("menuflow.typing_notification")
         copy("menuflow.send_events")
         copy("menuflow.load_flow_from")
         copy("menuflow.message_rate_limit")
         copy("menuflow.backup_limit")
+        copy("menuflow.active_tag_cache_ttl")
+        copy("menuflow.flows_watch_interval")
         copy("menuflow.webhook_queue.time_to_live")
         copy_dict("menuflow.regex")
         copy("menuflow.mautrix_state_key")
@@ -39,6 +46,8 @@ class Config(BaseFileConfig):
         copy("menuflow.route_keep_vars")
         copy("menuflow.inactivity_options.recreate_on_startup")
         copy("menuflow.enqueue_messages")
+        copy("menuflow.message_queue.persist")
+        copy("menuflow.message_queue.flush_interval")
         copy("menuflow.join_wait_timeout")
         copy_dict("menuflow.legacy_route_var_aliases")
         copy("menuflow.clean_up_route_on_leave")
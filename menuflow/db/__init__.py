@@ -3,6 +3,8 @@ from mautrix.util.async_db import Database
 from .client import Client
 from .flow import Flow
 from .flow_backup import FlowBackup
+from .media_cache import MediaCache
+from .message_queue import MessageQueue
 from .migrations import upgrade_table
 from .module import Module
 from .room import Room
@@ -14,7 +16,20 @@ from .webhook_queue import WebhookQueue
 
 
 def init(db: Database) -> None:
-    for table in (Room, User, Client, Route, Flow, FlowBackup, Webhook, Module, WebhookQueue, Tag):
+    for table in (
+        Room,
+        User,
+        Client,
+        Route,
+        Flow,
+        FlowBackup,
+        Webhook,
+        Module,
+        WebhookQueue,
+        Tag,
+        MessageQueue,
+        MediaCache,
+    ):
         table.db = db
 
 
@@ -30,4 +45,6 @@ __all__ = [
     "Module",
     "WebhookQueue",
     "Tag",
+    "MessageQueue",
+    "MediaCache",
 ]
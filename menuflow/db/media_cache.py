@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+from time import time
+from typing import TYPE_CHECKING, ClassVar
+
+from asyncpg import Record
+from attr import dataclass, ib
+from mautrix.types import ContentURI
+from mautrix.util.async_db import Database
+
+fake_db = Database.create("") if TYPE_CHECKING else None
+
+
+def now_ms() -> int:
+    return int(time() * 1000)
+
+
+@dataclass
+class MediaCache:
+    """A media uploaded to the homeserver, by the URL it was downloaded from.
+
+    The content hash allows reusing the upload of the same content from another URL.
+    """
+
+    db: ClassVar[Database] = fake_db
+
+    url: str
+    content_hash: str
+    mxc: ContentURI
+    etag: str | None = ib(default=None)
+    last_modified: str | None = ib(default=None)
+    # Mimetype, size and dimensions of the media
+    info: dict = ib(factory=dict)
+    validated_at: int = ib(factory=now_ms)
+    last_used: int = ib(factory=now_ms)
+
+    @classmethod
+    def _from_row(cls, row: Record) -> MediaCache | None:
+        if not row:
+            return None
+        data = {**row}
+        info = data.pop("info")
+        return cls(info=json.loads(info) if isinstance(info, str) else info, **data)
+
+    @property
+    def values(self) -> tuple:
+        return (
+            self.url,
+            self.content_hash,
+            self.mxc,
+            self.etag,
+            self.last_modified,
+            json.dumps(self.info),
+            self.validated_at,
+            self.last_used,
+        )
+
+    _columns = "url, content_hash, mxc, etag, last_modified, info, validated_at, last_used"
+
+    @property
+    def conditional_headers(self) -> dict[str, str]:
+        """Headers to download the media only if it changed since it was cached."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def is_fresh(self, revalidate_after: int) -> bool:
+        """Check if the media can be used without checking its URL again."""
+        return now_ms() - self.validated_at < revalidate_after * 1000
+
+    async def upsert(self) -> None:
+        q = (
+            f"INSERT INTO media_cache ({self._columns}) VALUES ($1, $2, $3, $4, $5, $6, $7, $8) "
+            "ON CONFLICT (url) DO UPDATE SET content_hash = $2, mxc = $3, etag = $4, "
+            "last_modified = $5, info = $6, validated_at = $7, last_used = $8"
+        )
+        await self.db.execute(q, *self.values)
+
+    async def touch(self, validated: bool = False) -> None:
+        self.last_used = now_ms()
+        if validated:
+            self.validated_at = self.last_used
+        q = "UPDATE media_cache SET last_used = $2, validated_at = $3 WHERE url = $1"
+        await self.db.execute(q, self.url, self.last_used, self.validated_at)
+
+    @classmethod
+    async def get_by_url(cls, url: str) -> MediaCache | None:
+        q = f"SELECT {cls._columns} FROM media_cache WHERE url = $1"
+        return cls._from_row(await cls.db.fetchrow(q, url))
+
+    @classmethod
+    async def get_by_content_hash(cls, content_hash: str) -> MediaCache | None:
+        q = (
+            f"SELECT {cls._columns} FROM media_cache WHERE content_hash = $1 "
+            "ORDER BY last_used DESC LIMIT 1"
+        )
+        return cls._from_row(await cls.db.fetchrow(q, content_hash))
+
+    @classmethod
+    async def evict(cls, max_entries: int) -> None:
+        """Delete the least recently used media beyond `max_entries`."""
+        q = (
+            "DELETE FROM media_cache WHERE url IN "
+            "(SELECT url FROM media_cache ORDER BY last_used DESC OFFSET $1)"
+        )
+        await cls.db.execute(q, max_entries)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+from time import time
+from typing import TYPE_CHECKING, ClassVar
+
+from asyncpg import Record
+from attr import dataclass, ib
+from mautrix.types import EventID, RoomID, UserID
+from mautrix.util.async_db import Database
+
+fake_db = Database.create("") if TYPE_CHECKING else None
+
+
+@dataclass
+class MessageQueue:
+    """A message of a room queue that is waiting to be consumed by an input node."""
+
+    db: ClassVar[Database] = fake_db
+
+    room_id: RoomID
+    bot_mxid: UserID
+    event_id: EventID
+    event: dict = ib(factory=dict)
+    id: int | None = ib(default=None)
+    creation_time: int = ib(factory=lambda: int(time() * 1000))
+
+    @classmethod
+    def _from_row(cls, row: Record) -> MessageQueue | None:
+        data = {**row}
+        event = data.pop("event")
+        return cls(event=json.loads(event) if isinstance(event, str) else event, **data)
+
+    @property
+    def values(self) -> tuple:
+        return (
+            self.room_id,
+            self.bot_mxid,
+            self.event_id,
+            json.dumps(self.event),
+            self.creation_time,
+        )
+
+    _columns = "room_id, bot_mxid, event_id, event, creation_time"
+
+    @classmethod
+    async def insert_many(cls, messages: list[MessageQueue]) -> None:
+        q = (
+            f"INSERT INTO message_queue ({cls._columns}) VALUES ($1, $2, $3, $4, $5) "
+            "ON CONFLICT (bot_mxid, room_id, event_id) DO NOTHING"
+        )
+        await cls.db.executemany(q, [message.values for message in messages])
+
+    @classmethod
+    async def delete_many(cls, bot_mxid: UserID, events: list[tuple[RoomID, EventID]]) -> None:
+        q = "DELETE FROM message_queue WHERE bot_mxid = $1 AND room_id = $2 AND event_id = $3"
+        await cls.db.executemany(
+            q, [(bot_mxid, room_id, event_id) for room_id, event_id in events]
+        )
+
+    @classmethod
+    async def delete_by_rooms(cls, bot_mxid: UserID, room_ids: list[RoomID]) -> None:
+        q = "DELETE FROM message_queue WHERE bot_mxid = $1 AND room_id = ANY($2::text[])"
+        await cls.db.execute(q, bot_mxid, room_ids)
+
+    @classmethod
+    async def delete_by_bot_mxid(cls, bot_mxid: UserID) -> None:
+        q = "DELETE FROM message_queue WHERE bot_mxid = $1"
+        await cls.db.execute(q, bot_mxid)
+
+    @classmethod
+    async def get_by_bot_mxid(cls, bot_mxid: UserID) -> list[MessageQueue]:
+        q = f"SELECT id, {cls._columns} FROM message_queue WHERE bot_mxid = $1 ORDER BY id"
+        rows = await cls.db.fetch(q, bot_mxid)
+        return [cls._from_row(row) for row in rows]
@@ -359,3 +359,71 @@ async def upgrade_v19(conn: Connection) -> None:
             WHERE COALESCE(variables->'room'->>'current_bot_mxid', variables->>'current_bot_mxid') IS NOT NULL
         """
     )
+
+
+@upgrade_table.register(description="Add message_queue table")
+async def upgrade_v20(conn: Connection) -> None:
+    await conn.execute(
+        """CREATE TABLE message_queue (
+            id          BIGSERIAL PRIMARY KEY,
+            room_id     TEXT NOT NULL,
+            bot_mxid    TEXT NOT NULL,
+            event_id    TEXT NOT NULL,
+            event       JSONB NOT NULL,
+            creation_time BIGINT NOT NULL DEFAULT (EXTRACT(EPOCH FROM NOW()) * 1000),
+            UNIQUE (room_id, event_id)
+        )"""
+    )
+    await conn.execute("CREATE INDEX idx_message_queue_bot_mxid ON message_queue (bot_mxid)")
+
+
+@upgrade_table.register(description="Add nodes_hash column to module table")
+async def upgrade_v21(conn: Connection) -> None:
+    # The jsonb text is normalized, so modules with the same nodes have the same hash,
+    # also when they are copied to another tag
+    await conn.execute(
+        """ALTER TABLE module
+            ADD COLUMN nodes_hash TEXT GENERATED ALWAYS AS (md5(nodes::text)) STORED
+        """
+    )
+
+
+@upgrade_table.register(description="Add wake_at column to route table")
+async def upgrade_v22(conn: Connection) -> None:
+    await conn.execute("ALTER TABLE route ADD COLUMN wake_at BIGINT")
+    await conn.execute(
+        "CREATE INDEX idx_route_wake_at ON route (client, wake_at) WHERE wake_at IS NOT NULL"
+    )
+
+
+@upgrade_table.register(description="Add media_cache table")
+async def upgrade_v23(conn: Connection) -> None:
+    await conn.execute(
+        """CREATE TABLE media_cache (
+            url             TEXT PRIMARY KEY,
+            content_hash    TEXT NOT NULL,
+            mxc             TEXT NOT NULL,
+            etag            TEXT,
+            last_modified   TEXT,
+            info            JSONB NOT NULL DEFAULT '{}'::jsonb,
+            validated_at    BIGINT NOT NULL,
+            last_used       BIGINT NOT NULL
+        )"""
+    )
+    await conn.execute("CREATE INDEX idx_media_cache_content_hash ON media_cache (content_hash)")
+    await conn.execute("CREATE INDEX idx_media_cache_last_used ON media_cache (last_used)")
+
+
+@upgrade_table.register(description="Add bot_mxid to the unique key of message_queue")
+async def upgrade_v24(conn: Connection) -> None:
+    # A room can have several bots, each one keeps its own copy of the messages
+    await conn.execute(
+        "ALTER TABLE message_queue DROP CONSTRAINT IF EXISTS message_queue_room_id_event_id_key"
+    )
+    await conn.execute(
+        """ALTER TABLE message_queue ADD CONSTRAINT message_queue_bot_mxid_room_id_event_id_key
+            UNIQUE (bot_mxid, room_id, event_id)
+        """
+    )
+    # The unique key starts with bot_mxid, it replaces the index of the column
+    await conn.execute("DROP INDEX IF EXISTS idx_message_queue_bot_mxid")
@@ -109,6 +109,21 @@ class Module(SerializableAttrs):
 
         return [cls._from_row(row) for row in rows] if rows else []
 
+    @classmethod
+    async def get_tag_module_hashes(cls, tag_id: int) -> list[tuple[int, str]]:
+        """Get the id and the nodes hash of the modules of a tag, without their nodes."""
+        q = "SELECT id, nodes_hash FROM module WHERE tag_id=$1 ORDER BY id ASC"
+        rows = await cls.db.fetch(q, tag_id)
+
+        return [(row["id"], row["nodes_hash"]) for row in rows] if rows else []
+
+    @classmethod
+    async def get_by_ids(cls, ids: list[int]) -> list[Module]:
+        q = f"SELECT id, {cls._columns} FROM module WHERE id = ANY($1::int[]) ORDER BY id ASC"
+        rows = await cls.db.fetch(q, ids)
+
+        return [cls._from_row(row) for row in rows] if rows else []
+
     @classmethod
     async def get_all_module_names(cls, flow_id: int) -> set[str]:
         current_tag = await cls.get_current_tag(flow_id)
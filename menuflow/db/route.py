@@ -21,6 +21,7 @@ class RouteState(SerializableEnum):
     INVITE = "invite_user"
     ERROR = "error"
     TIMEOUT = "timeout"
+    DELAY = "delay"
 
 
 log: TraceLogger = getLogger("menuflow.db.route")
@@ -37,6 +38,8 @@ class Route:
     state: RouteState = ib(default=RouteState.START)
     variables: dict = ib(factory=lambda: {"route": {}})
     stack: str = ib(default="{}")
+    # Time in milliseconds when the flow stopped in a delay node must be resumed
+    wake_at: int = ib(default=None)
 
     @staticmethod
     def _parse_jsonb(value: str | dict | None) -> dict:
@@ -71,9 +74,10 @@ class Route:
             self.state.value if self.state else None,
             json.dumps(self.variables),
             self.stack,
+            self.wake_at,
         )
 
-    _columns = "room, client, node_id, state, variables, stack"
+    _columns = "room, client, node_id, state, variables, stack, wake_at"
 
     @property
     def _variables(self) -> dict:
@@ -107,12 +111,12 @@ class Route:
         return cls._from_row(row) if row else route
 
     async def insert(self) -> str:
-        q = f"INSERT INTO route ({self._columns}) VALUES ($1, $2, $3, $4, $5, $6)"
+        q = f"INSERT INTO route ({self._columns}) VALUES ($1, $2, $3, $4, $5, $6, $7)"
         await self.db.execute(q, *self.values)
 
     async def update(self) -> None:
         q = """
-            UPDATE route SET node_id = $3, state = $4, variables = $5, stack = $6
+            UPDATE route SET node_id = $3, state = $4, variables = $5, stack = $6, wake_at = $7
             WHERE room = $1 and client = $2
         """
         await self.db.execute(q, *self.values)
@@ -130,6 +134,7 @@ class Route:
             self.state = RouteState.START
         self.node_id = "start"
         self.variables["route"] = {}
+        self.wake_at = None
 
         self.stack = json.dumps({self.client: []})
         await self.update()
@@ -137,3 +142,15 @@ class Route:
     async def update_variables(self) -> None:
         q = "UPDATE route SET variables = $3 WHERE room = $1 and client = $2"
         await self.db.execute(q, self.room, self.client, json.dumps(self.variables))
+
+    @classmethod
+    async def get_delayed(cls, client: UserID) -> list[tuple[str, int]]:
+        """Get the room ID and the wake up time of the routes of a client stopped in a delay node."""
+        q = """
+            SELECT ro.room_id, rt.wake_at
+            FROM route AS rt
+            JOIN room AS ro ON rt.room = ro.id
+            WHERE rt.client = $1 AND rt.wake_at IS NOT NULL AND rt.state = $2
+        """
+        rows = await cls.db.fetch(q, client, RouteState.DELAY.value)
+        return [(row["room_id"], row["wake_at"]) for row in rows] if rows else []
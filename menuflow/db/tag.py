@@ -119,6 +119,12 @@ class Tag(SerializableAttrs):
 
         return result
 
+    @classmethod
+    async def notify_active_tag(cls, channel: str, flow_id: int, tag_id: int | None) -> None:
+        """Notify the listeners of the channel that the active tag of the flow changed."""
+        q = "SELECT pg_notify($1, $2)"
+        await cls.db.execute(q, channel, json.dumps({"flow_id": flow_id, "tag_id": tag_id}))
+
     @classmethod
     async def deactivate_tags(cls, flow_id: int) -> None:
         q = "UPDATE tag SET active=false WHERE flow_id=$1 AND active=true"
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+from logging import getLogger
+from time import time
+from typing import Awaitable, Callable
+
+from mautrix.types import RoomID, UserID
+from mautrix.util import background_task
+from mautrix.util.logging import TraceLogger
+
+from .db.route import Route
+
+log: TraceLogger = getLogger("menuflow.delay_scheduler")
+
+
+def now_ms() -> int:
+    return int(time() * 1000)
+
+
+class DelayScheduler:
+    """Resume the flows stopped in a delay node when their wake up time is reached.
+
+    The delay nodes write the wake up time in the route of the room and release it, so a
+    waiting room costs a heap entry instead of a running coroutine. A single task waits for
+    the nearest wake up time. The pending wake ups are loaded from the routes on startup,
+    so they survive restarts.
+    """
+
+    def __init__(self, bot_mxid: UserID, resume: Callable[[RoomID], Awaitable[None]]) -> None:
+        self.bot_mxid = bot_mxid
+        self.resume = resume
+        self.log = log.getChild(bot_mxid) if bot_mxid else log
+
+        self.heap: list[tuple[int, RoomID]] = []
+        # Current wake up time of each room, the heap entries that don't match it are stale
+        self.wake_ups: dict[RoomID, int] = {}
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def schedule(self, room_id: RoomID, wake_at: int) -> None:
+        """Resume the flow of a room at `wake_at` (milliseconds), replacing its previous wake up."""
+        self.wake_ups[room_id] = wake_at
+        heapq.heappush(self.heap, (wake_at, room_id))
+        if self.heap[0] == (wake_at, room_id):
+            self._changed.set()
+
+    def cancel(self, room_id: RoomID) -> None:
+        self.wake_ups.pop(room_id, None)
+
+    async def load(self) -> None:
+        """Schedule the wake ups written in the routes of the bot."""
+        delayed = await Route.get_delayed(client=self.bot_mxid)
+        for room_id, wake_at in delayed:
+            self.schedule(room_id, wake_at)
+
+        if delayed:
+            self.log.info(f"{len(delayed)} delayed flows have been scheduled")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _pop_stale(self) -> None:
+        while self.heap and self.wake_ups.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    async def _run(self) -> None:
+        while True:
+            self._pop_stale()
+            self._changed.clear()
+
+            if not self.heap:
+                await self._changed.wait()
+                continue
+
+            wake_at, room_id = self.heap[0]
+            timeout = (wake_at - now_ms()) / 1000
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            del self.wake_ups[room_id]
+            background_task.create(self._resume(room_id))
+
+    async def _resume(self, room_id: RoomID) -> None:
+        try:
+            await self.resume(room_id)
+        except Exception as e:
+            self.log.exception(f"[{room_id}] Error resuming the delayed flow: {e}")
@@ -1,23 +1,102 @@
 from __future__ import annotations
 
+import asyncio
 import mimetypes
 import os
+import random
+from collections import OrderedDict
 from email.encoders import encode_base64
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from logging import getLogger
-from typing import Dict, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
-from aiohttp import ClientSession
+from aiohttp import ClientResponseError, ClientSession
 from aiosmtplib import SMTP
 from aiosmtplib.errors import (
     SMTPAuthenticationError,
     SMTPConnectTimeoutError,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
     SMTPServerDisconnected,
 )
 from mautrix.util.logging import TraceLogger
 
+from .config import Config
+from .http_session import OutboundSession
+
+# Called with the result of the delivery of an email: sent, attempts and error
+DeliveryCallback = Callable[[bool, int, Optional[str]], Awaitable[None]]
+
+
+class EmailOptions:
+    """The options of `menuflow.email`."""
+
+    __slots__ = (
+        "pool_size",
+        "batch_size",
+        "max_queue",
+        "max_retries",
+        "retry_backoff",
+        "idle_timeout",
+        "attachment_cache_size",
+    )
+
+    def __init__(self, options: dict) -> None:
+        # Maximum number of SMTP connections of each server, each one with its own sender
+        self.pool_size: int = max(options.get("pool_size", 2), 1)
+        # Maximum number of queued emails sent in a row over the same connection
+        self.batch_size: int = max(options.get("batch_size", 10), 1)
+        self.max_queue: int = options.get("max_queue", 1000)
+        self.max_retries: int = options.get("max_retries", 3)
+        self.retry_backoff: float = options.get("retry_backoff", 2)
+        # Seconds to keep an idle SMTP connection open
+        self.idle_timeout: float = options.get("idle_timeout", 60)
+        self.attachment_cache_size: int = options.get("attachment_cache_size", 50 * 1024 * 1024)
+
+
+class Attachment:
+    __slots__ = ("payload", "content_type")
+
+    def __init__(self, payload: bytes, content_type: str) -> None:
+        self.payload = payload
+        self.content_type = content_type
+
+
+class AttachmentCache:
+    """The attachments of the emails by URL, the least recently used ones are removed
+    when their size reaches `max_bytes`."""
+
+    max_bytes: int = 50 * 1024 * 1024
+    entries: OrderedDict[str, Attachment] = OrderedDict()
+    size: int = 0
+
+    @classmethod
+    def get(cls, url: str) -> Attachment | None:
+        attachment = cls.entries.get(url)
+        if attachment:
+            cls.entries.move_to_end(url)
+        return attachment
+
+    @classmethod
+    def put(cls, url: str, attachment: Attachment) -> None:
+        if len(attachment.payload) > cls.max_bytes:
+            return
+
+        if url in cls.entries:
+            cls.size -= len(cls.entries.pop(url).payload)
+        cls.entries[url] = attachment
+        cls.size += len(attachment.payload)
+        while cls.size > cls.max_bytes:
+            _, removed = cls.entries.popitem(last=False)
+            cls.size -= len(removed.payload)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls.entries = OrderedDict()
+        cls.size = 0
+
 
 class Email:
     def __init__(
@@ -28,11 +107,13 @@ class Email:
         attachments: List[str] = [],
         format: str = "html",
         encode_type: str = "utf-8",
+        on_delivery: Optional[DeliveryCallback] = None,
     ) -> None:
         self.subject = subject
         self.text = MIMEText(text, format, encode_type)
         self.recipients = recipients
         self.attachments = attachments
+        self.on_delivery = on_delivery
 
     @property
     def message(self) -> MIMEMultipart:
@@ -41,13 +122,37 @@ class Email:
         message.attach(self.text)
         return message
 
-    async def attach_files(self, message: MIMEMultipart) -> MIMEMultipart:
-        """This function takes a MIMEMultipart object and attaches files to it
+    @staticmethod
+    async def fetch_attachment(http_session: ClientSession, file_url: str) -> Attachment:
+        """Download an attachment, the attachments already downloaded are taken from the cache.
+
+        Raises
+        ------
+        ClientResponseError
+            If the attachment could not be downloaded.
+        """
+        attachment = AttachmentCache.get(file_url)
+        if attachment:
+            return attachment
+
+        async with http_session.get(file_url, raise_for_status=True) as resp:
+            attachment = Attachment(await resp.read(), resp.content_type)
+
+        AttachmentCache.put(file_url, attachment)
+        return attachment
+
+    async def attach_files(
+        self, message: MIMEMultipart, http_session: ClientSession
+    ) -> MIMEMultipart:
+        """This function takes a MIMEMultipart object and attaches files to it,
+        the files are downloaded in parallel
 
         Parameters
         ----------
         message : MIMEMultipart
             The message to be sent.
+        http_session : ClientSession
+            The session used to download the files.
 
         Returns
         -------
@@ -55,27 +160,38 @@ class Email:
 
         """
 
-        async with ClientSession() as http_session:
-            for file_url in self.attachments:
-                part = MIMEBase("application", "octet-stream")
-                resp = await http_session.get(file_url)
-                part.set_payload(await resp.read())
-                encode_base64(part)
-                basename = os.path.basename(file_url)
-                filename = (
-                    f"{basename}{mimetypes.guess_extension(resp.content_type) or ''}"
-                    if not os.path.splitext(basename)[1]
-                    else basename
-                )
-                part.add_header("Content-Disposition", f'attachment; filename="{filename}"')
-                message.attach(part)
+        attachments = await asyncio.gather(
+            *(self.fetch_attachment(http_session, file_url) for file_url in self.attachments)
+        )
+        for file_url, attachment in zip(self.attachments, attachments):
+            part = MIMEBase("application", "octet-stream")
+            part.set_payload(attachment.payload)
+            encode_base64(part)
+            basename = os.path.basename(file_url)
+            filename = (
+                f"{basename}{mimetypes.guess_extension(attachment.content_type) or ''}"
+                if not os.path.splitext(basename)[1]
+                else basename
+            )
+            part.add_header("Content-Disposition", f'attachment; filename="{filename}"')
+            message.attach(part)
 
         return message
 
+    async def build(self, http_session: ClientSession) -> str:
+        """Build the message to be sent, with its attachments."""
+        # Checking if there are any attachments in the email object.
+        # If there are, it will call the attach_files method.
+        if self.attachments:
+            message = await self.attach_files(self.message, http_session)
+        else:
+            message = self.message
+        return message.as_string()
+
 
 class EmailClient:
-    session: SMTP = None
-    http_session: ClientSession = None
+    config: Config = None
+    options: EmailOptions = EmailOptions({})
 
     servers: Dict[str, "EmailClient"] = {}
     log: TraceLogger = getLogger("menuflow.email_client")
@@ -95,23 +211,44 @@ class EmailClient:
         self.username = username
         self.password = password
         self.start_tls = start_tls
+        self.queue: asyncio.Queue[Email] = asyncio.Queue(maxsize=self.options.max_queue)
+        self.senders: List[asyncio.Task] = []
+        self.connections_opened = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    @classmethod
+    def init_cls(cls, config: Config) -> None:
+        cls.config = config
+        cls.options = EmailOptions(config["menuflow.email"] or {})
+        AttachmentCache.max_bytes = cls.options.attachment_cache_size
+
+    @property
+    def http_session(self) -> ClientSession:
+        return OutboundSession.get(self.config)
 
     def _add_to_cache(self):
         self.servers[self.server_id] = self
 
-    async def login(self):
+    async def connect(self) -> SMTP:
         """It connects to the mail server and logs in"""
-        self.session = SMTP(
+        session = SMTP(
             hostname=self.host,
             port=self.port,
             username=self.username,
             password=self.password,
             start_tls=self.start_tls,
         )
+        await session.connect()
+        await session.ehlo()
+        return session
 
+    async def login(self):
+        """It checks the connection to the mail server and starts the senders of the queue"""
         try:
-            await self.session.connect()
-            await self.session.ehlo()
+            session = await self.connect()
+            await session.quit()
             self.log.debug(f"The connection to the mail server {self.server_id} was successful")
         except SMTPConnectTimeoutError as e:
             self.log.error(e)
@@ -120,8 +257,15 @@ class EmailClient:
         except Exception as e:
             self.log.exception(e)
 
+        # The senders are started anyway, the emails are retried until the server is reachable
+        self.senders = [
+            asyncio.create_task(self._sender(), name=f"email-sender-{self.server_id}-{i}")
+            for i in range(self.options.pool_size)
+        ]
+
     async def send_email(self, email: Email):
-        """If the email fails to send, log the error and try again
+        """Queue the email to be sent in the background, it never waits for the queue.
+        If the queue is full, the email is dropped and its delivery is reported as failed
 
         Parameters
         ----------
@@ -129,27 +273,151 @@ class EmailClient:
             Email - This is the email object that we created earlier.
 
         """
+        try:
+            self.queue.put_nowait(email)
+        except asyncio.QueueFull:
+            error = f"The email queue of {self.server_id} is full ({self.queue.maxsize} emails)"
+            self.log.error(f"ERROR SENDING EMAIL to {email.recipients}: {error}")
+            self.failed += 1
+            await self._report(email, False, 0, error)
 
-        if not self.session.is_connected:
-            await self.login()
+    async def _sender(self) -> None:
+        """Send the queued emails over a connection of the pool.
 
-        # Checking if there are any attachments in the email object.
-        # If there are, it will call the attach_files method.
-        if email.attachments:
-            message = await email.attach_files(email.message)
-        else:
-            message = email.message
+        The connection is opened when there are emails to send and it is closed when it
+        has been idle for `idle_timeout`. The queued emails are taken in batches, their
+        attachments are downloaded in parallel and they are sent in a row.
+        """
+        session: SMTP | None = None
+        try:
+            while True:
+                try:
+                    batch = [await asyncio.wait_for(self.queue.get(), self.options.idle_timeout)]
+                except asyncio.TimeoutError:
+                    session = await self._close(session)
+                    continue
+
+                while len(batch) < self.options.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+
+                messages = await asyncio.gather(
+                    *(email.build(self.http_session) for email in batch), return_exceptions=True
+                )
+                for email, message in zip(batch, messages):
+                    try:
+                        session = await self._deliver(session, email, message)
+                    finally:
+                        self.queue.task_done()
+        finally:
+            await self._close(session)
+
+    async def _deliver(self, session: SMTP | None, email: Email, message: Any) -> SMTP | None:
+        """Send an email, the failed sends are retried with a jittered backoff.
+
+        Returns
+        -------
+            The connection to reuse for the next email, None if it was closed.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if isinstance(message, BaseException):
+                    raise message
+
+                if session is None or not session.is_connected:
+                    session = await self.connect()
+                    self.connections_opened += 1
+                await session.sendmail(self.username, email.recipients, message)
+            except Exception as error:
+                if isinstance(error, (SMTPServerDisconnected, OSError)):
+                    session = None
+                elif session is not None and not isinstance(error, SMTPResponseException):
+                    session = await self._close(session)
+
+                if not self.is_retryable(error) or attempt > self.options.max_retries:
+                    self.log.error(
+                        f"ERROR SENDING EMAIL to {email.recipients} "
+                        f"after {attempt} attempts: {error}"
+                    )
+                    self.failed += 1
+                    await self._report(email, False, attempt, str(error))
+                    return session
+
+                self.retries += 1
+                delay = random.uniform(0, self.options.retry_backoff * 2 ** (attempt - 1))
+                self.log.warning(
+                    f"ERROR SENDING EMAIL: {error} - Trying again in {delay:.1f}s ({attempt})"
+                )
+                await asyncio.sleep(delay)
+                if isinstance(message, BaseException):
+                    message = await self._build(email)
+                continue
 
+            self.sent += 1
+            await self._report(email, True, attempt, None)
+            return session
+
+    async def _build(self, email: Email) -> str | BaseException:
         try:
-            await self.session.sendmail(self.username, email.recipients, message.as_string())
-        except SMTPServerDisconnected as disconnected_error:
-            self.log.error(
-                f"ERROR SENDING EMAIL - DISCONNECTED: {disconnected_error} - Trying again ..."
+            return await email.build(self.http_session)
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """The rejected recipients, the permanent SMTP errors (5xx) and the attachments
+        that do not exist are not retried."""
+        if isinstance(error, SMTPRecipientsRefused):
+            return False
+        if isinstance(error, ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        if isinstance(error, SMTPResponseException):
+            return error.code < 500
+        return True
+
+    async def _report(self, email: Email, sent: bool, attempts: int, error: str | None) -> None:
+        if not email.on_delivery:
+            return
+        try:
+            await email.on_delivery(sent, attempts, error)
+        except Exception as e:
+            self.log.exception(f"Error reporting the delivery of the email: {e}")
+
+    async def _close(self, session: SMTP | None) -> None:
+        """Close a connection, it always returns None to discard the connection."""
+        if session is not None and session.is_connected:
+            try:
+                await session.quit()
+            except Exception:
+                session.close()
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Wait for the queued emails to be sent, then close the connections."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self.log.warning(
+                f"{self.queue.qsize()} emails of {self.server_id} were not sent before stopping"
             )
-            await self.login()
-            await self.session.sendmail(self.username, email.recipients, message.as_string())
-        except Exception as error:
-            self.log.exception(f"ERROR SENDING EMAIL: {error}")
+        for sender in self.senders:
+            sender.cancel()
+        await asyncio.gather(*self.senders, return_exceptions=True)
+        self.senders = []
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self.queue.qsize(),
+            "senders": len(self.senders),
+            "connections_opened": self.connections_opened,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    @classmethod
+    async def stop_all(cls) -> None:
+        await asyncio.gather(*(server.stop() for server in cls.servers.values()))
 
     @classmethod
     def get_by_server_id(cls, server_name: str) -> EmailClient:
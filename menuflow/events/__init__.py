@@ -2,4 +2,4 @@ from .base_event import BaseEvent
 from .event_generator import send_node_event
 from .event_types import MenuflowEventTypes, MenuflowNodeEvents
 from .nats_publisher import NatsPublisher
-from .node_events import NodeEntry, NodeInputData, NodeInputTimeout
+from .node_events import EmailDelivery, NodeEntry, NodeInputData, NodeInputTimeout
@@ -6,7 +6,7 @@ from typing import Optional
 
 from ..config import Config
 from .event_types import MenuflowEventTypes, MenuflowNodeEvents
-from .node_events import NodeEntry, NodeInputData, NodeInputTimeout
+from .node_events import EmailDelivery, NodeEntry, NodeInputData, NodeInputTimeout
 
 log = getLogger()
 
@@ -56,5 +56,20 @@ async def send_node_event(
             variables=kwargs.get("variables"),
             conversation_uuid=kwargs.get("conversation_uuid"),
         )
+    elif event_type == MenuflowNodeEvents.EmailDelivery:
+        event = EmailDelivery(
+            event_type=MenuflowEventTypes.NODE,
+            event=MenuflowNodeEvents.EmailDelivery,
+            timestamp=datetime.now(timezone.utc).timestamp(),
+            room_id=kwargs.get("room_id"),
+            sender=kwargs.get("sender"),
+            node_id=kwargs.get("node_id"),
+            server_id=kwargs.get("server_id"),
+            recipients=kwargs.get("recipients"),
+            sent=kwargs.get("sent"),
+            attempts=kwargs.get("attempts"),
+            error=kwargs.get("error"),
+            conversation_uuid=kwargs.get("conversation_uuid"),
+        )
 
     await event.send(config=config)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Dict
+from typing import Dict, List
 
 from attr import dataclass, ib
 
@@ -33,3 +33,15 @@ class NodeInputTimeout(BaseEvent):
     o_connection: str = ib(factory=str)
     variables: Dict = ib(factory=dict)
     conversation_uuid: str | None = ib(default=None)
+
+
+@dataclass
+class EmailDelivery(BaseEvent):
+    room_id: str = ib(factory=str)
+    node_id: str = ib(factory=str)
+    server_id: str = ib(factory=str)
+    recipients: List[str] = ib(factory=list)
+    sent: bool = ib(default=False)
+    attempts: int = ib(default=0)
+    error: str | None = ib(default=None)
+    conversation_uuid: str | None = ib(default=None)
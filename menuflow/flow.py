@@ -6,8 +6,10 @@ from typing import Dict, List, Optional, Union
 from mautrix.util.logging import TraceLogger
 
 from .config import Config
+from .flow_graph import FlowGraph, MiddlewareSpec
+from .flow_registry import CompiledFlow, FlowRegistry
 from .flow_utils import FlowUtils
-from .middlewares import ASRMiddleware, HTTPMiddleware, IRMMiddleware, LLMMiddleware, TTMMiddleware
+from .middlewares import ASRMiddleware, HTTPMiddleware, IRMMiddleware
 from .nodes import (
     CheckHoliday,
     CheckTime,
@@ -31,9 +33,9 @@ from .nodes import (
 )
 from .repository import Flow as FlowModel
 from .room import Room
-from .utils import Middlewares, Util
 
 Node = Union[
+    CheckHoliday,
     CheckTime,
     Email,
     HTTPRequest,
@@ -56,13 +58,23 @@ Node = Union[
 
 
 class Flow:
-    flow_utils: FlowUtils
+    flow_utils: FlowUtils | None = None
     log: TraceLogger = logging.getLogger("menuflow.flow")
 
     def __init__(self) -> None:
-        self.data: Flow = None
-        self.nodes: List[Dict] = []
-        self.nodes_by_id: Dict[str, Dict] = {}
+        self.compiled: CompiledFlow | None = None
+
+    @property
+    def data(self) -> FlowModel | None:
+        return self.compiled.data if self.compiled else None
+
+    @property
+    def nodes(self) -> List[Dict]:
+        return (self.compiled.data.nodes or []) if self.compiled else []
+
+    @property
+    def graph(self) -> FlowGraph:
+        return self.compiled.graph if self.compiled else FlowGraph(())
 
     @property
     def flow_variables(self) -> Dict:
@@ -77,16 +89,48 @@ class Flow:
         flow_mxid: Optional[str] = None,
         content: Optional[Dict] = None,
         config: Optional[Config] = None,
+        reload: bool = True,
     ) -> Flow:
-        self.data = await FlowModel.load_flow(flow_mxid=flow_mxid, content=content, config=config)
-        self.nodes = self.data.nodes or []
-        self.nodes_by_id: Dict[str, Dict] = {}
+        """Load the flow from its content or from the source of the client flow.
+
+        The compiled flow is shared with the other clients that use the same tag.
+        If `reload` is False, the compiled flow of the tag is reused if it is already loaded.
+        """
+        get_middleware = self.flow_utils.get_middleware_by_id if self.flow_utils else None
+        if content:
+            compiled = FlowRegistry.from_content(content, get_middleware=get_middleware)
+        else:
+            compiled = await FlowRegistry.load(
+                flow_mxid=flow_mxid, config=config, get_middleware=get_middleware, reload=reload
+            )
+
+        self.set_compiled(compiled)
 
-    def _add_node_to_cache(self, node_data: Dict):
-        self.nodes_by_id[node_data.get("id")] = node_data
+    def set_compiled(self, compiled: CompiledFlow) -> None:
+        """Swap the compiled flow used by the client."""
+        if compiled is self.compiled:
+            return
+
+        previous, self.compiled = self.compiled, FlowRegistry.acquire(compiled)
+        FlowRegistry.release(previous)
+
+    def snapshot(self) -> Flow:
+        """Get a flow that keeps using the current compiled flow, even if the client swaps it.
+
+        It doesn't hold a reference in the registry, the compiled flow is only kept alive
+        while the snapshot is in use.
+        """
+        flow = Flow()
+        flow.compiled = self.compiled
+        return flow
+
+    def release(self) -> None:
+        """Stop using the compiled flow, so it can be released when no other client uses it."""
+        FlowRegistry.release(self.compiled)
+        self.compiled = None
 
     def get_node_by_id(self, node_id: str) -> Dict | None:
-        """This function returns a node from a cache or a list of nodes based on its ID.
+        """This function returns a node from the compiled flow graph based on its ID.
 
         Parameters
         ----------
@@ -99,165 +143,47 @@ class Flow:
             if the node with the given ID is not found.
 
         """
+        spec = self.graph.get(node_id)
+        return spec.data if spec else None
 
-        try:
-            return self.nodes_by_id[node_id]
-        except KeyError:
-            pass
-
-        for node in self.nodes:
-            if node_id == node.get("id", ""):
-                self._add_node_to_cache(node)
-                return node
+    def is_pure_node(self, node_id: str) -> bool:
+        """Check if a node is pure, without external I/O or waits,
+        so the route changes it makes don't have to be written before the next node runs.
+        """
+        spec = self.graph.get(node_id)
+        return spec.pure if spec else False
 
     def middleware(
         self, middleware_id: str, room: Room
     ) -> HTTPMiddleware | IRMMiddleware | ASRMiddleware | None:
-        middleware_model = self.flow_utils.get_middleware_by_id(middleware_id=middleware_id)
-        try:
-            middleware_type = Middlewares(middleware_model.type)
-        except ValueError:
-            self.log.warning(f"Middleware type {middleware_model.type} not found")
-            return
-
-        if not middleware_model:
+        middleware_spec = MiddlewareSpec.resolve(
+            middleware_id, get_middleware=self.flow_utils.get_middleware_by_id
+        )
+        if not middleware_spec:
             return
 
-        if middleware_type in (Middlewares.JWT, Middlewares.BASIC, Middlewares.BASE):
-            middleware_initialized = HTTPMiddleware(
-                http_middleware_data=middleware_model,
-                room=room,
-                default_variables=self.flow_variables,
-            )
-        elif middleware_type == Middlewares.IRM:
-            middleware_initialized = IRMMiddleware(
-                irm_data=middleware_model, room=room, default_variables=self.flow_variables
-            )
-        elif middleware_type == Middlewares.LLM:
-            middleware_initialized = LLMMiddleware(
-                llm_data=middleware_model, room=room, default_variables=self.flow_variables
-            )
-        elif middleware_type == Middlewares.ASR:
-            middleware_initialized = ASRMiddleware(
-                asr_middleware_content=middleware_model,
-                room=room,
-                default_variables=self.flow_variables,
-            )
-        elif middleware_type == Middlewares.TTM:
-            middleware_initialized = TTMMiddleware(
-                ttm_data=middleware_model, room=room, default_variables=self.flow_variables
-            )
-
-        return middleware_initialized
+        return middleware_spec.create(room=room, default_variables=self.flow_variables)
 
     def node(self, room: Room) -> Node | None:
-        node_data = self.get_node_by_id(node_id=room.route.node_id)
+        spec = self.graph.get(room.route.node_id)
 
-        if not node_data:
+        if not spec or not spec.cls:
             return
 
-        if node_data.get("type") == "message":
-            node_initialized = Message(
-                message_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "media":
-            node_initialized = Media(
-                media_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-            if node_data.get("middleware"):
-                middleware = self.middleware(node_data.get("middleware"), room)
-                node_initialized.middleware = middleware
-        elif node_data.get("type") == "email":
-            node_initialized = Email(
-                email_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "location":
-            node_initialized = Location(
-                location_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "switch":
-            node_initialized = Switch(
-                switch_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "input":
-            node_initialized = Input(
-                input_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-            if node_data.get("middlewares"):
-                middlewares = []
-                for middleware in node_data.get("middlewares"):
-                    middlewares.append(self.middleware(middleware, room=room))
-                node_initialized.middlewares = middlewares
-        elif node_data.get("type") == "check_time":
-            node_initialized = CheckTime(
-                check_time_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "check_holiday":
-            node_initialized = CheckHoliday(
-                check_holiday_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "http_request":
-            node_initialized = HTTPRequest(
-                http_request_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-
-            if node_data.get("middleware"):
-                middleware = self.middleware(node_data.get("middleware"), room)
-                node_initialized.middleware = middleware
-        elif node_data.get("type") in ("interactive_input", "interactive_form_input"):
-            node_initialized = InteractiveInput(
-                interactive_input_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "leave":
-            node_initialized = Leave(
-                leave_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "set_vars":
-            node_initialized = SetVars(
-                set_vars_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "invite_user":
-            node_initialized = InviteUser(
-                invite_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "subroutine":
-            node_initialized = Subroutine(
-                subroutine_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "delay":
-            node_initialized = Delay(
-                delay_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "gpt_assistant":
-            node_initialized = None
-            if GPTAssistant.assistant_cache.get((room.room_id, room.route.id)):
-                node_initialized = GPTAssistant.assistant_cache.get((room.room_id, room.route.id))
-            else:
+        if spec.cls is GPTAssistant:
+            node_initialized = GPTAssistant.assistant_cache.get((room.room_id, room.route.id))
+            if not node_initialized:
                 node_initialized = GPTAssistant(
-                    gpt_assistant_node_data=node_data,
+                    gpt_assistant_node_data=spec.data,
                     room=room,
                     default_variables=self.flow_variables,
                 )
+                node_initialized.compiled = spec.compiled
                 GPTAssistant.assistant_cache[(room.room_id, room.route.id)] = node_initialized
 
-            if node_data.get("middlewares"):
-                middlewares = []
-                for middleware in node_data.get("middlewares"):
-                    middlewares.append(self.middleware(middleware, room=room))
-                node_initialized.middlewares = middlewares
-        elif node_data.get("type") == "form":
-            node_initialized = FormInput(
-                form_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        elif node_data.get("type") == "webhook":
-            node_initialized = Webhook(
-                webhook_data=node_data, room=room, default_variables=self.flow_variables
+            spec.set_middlewares(
+                node_initialized, room=room, default_variables=self.flow_variables
             )
-        elif node_data.get("type") == "debug":
-            node_initialized = Debug(
-                debug_node_data=node_data, room=room, default_variables=self.flow_variables
-            )
-        else:
-            return
+            return node_initialized
 
-        return node_initialized
+        return spec.create(room=room, default_variables=self.flow_variables)
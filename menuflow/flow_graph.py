@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import logging
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Type
+
+from mautrix.util.logging import TraceLogger
+
+from .middlewares import ASRMiddleware, HTTPMiddleware, IRMMiddleware, LLMMiddleware, TTMMiddleware
+from .nodes import (
+    Base,
+    CheckHoliday,
+    CheckTime,
+    Debug,
+    Delay,
+    Email,
+    FormInput,
+    GPTAssistant,
+    HTTPRequest,
+    Input,
+    InteractiveInput,
+    InviteUser,
+    Leave,
+    Location,
+    Media,
+    Message,
+    SetVars,
+    Subroutine,
+    Switch,
+    Webhook,
+)
+from .utils import Middlewares
+
+log: TraceLogger = logging.getLogger("menuflow.flow_graph")
+
+# Node class of each node type
+NODE_TYPES: Mapping[str, Type[Base]] = MappingProxyType(
+    {
+        "message": Message,
+        "media": Media,
+        "email": Email,
+        "location": Location,
+        "switch": Switch,
+        "input": Input,
+        "check_time": CheckTime,
+        "check_holiday": CheckHoliday,
+        "http_request": HTTPRequest,
+        "interactive_input": InteractiveInput,
+        "interactive_form_input": InteractiveInput,
+        "leave": Leave,
+        "set_vars": SetVars,
+        "invite_user": InviteUser,
+        "subroutine": Subroutine,
+        "delay": Delay,
+        "gpt_assistant": GPTAssistant,
+        "form": FormInput,
+        "webhook": Webhook,
+        "debug": Debug,
+    }
+)
+
+# Node types that use a single middleware (`middleware`) or a list of them (`middlewares`)
+SINGLE_MIDDLEWARE_TYPES = frozenset({"media", "http_request"})
+MULTIPLE_MIDDLEWARE_TYPES = frozenset({"input", "gpt_assistant"})
+
+# Node types without external I/O or waits, their route changes can be written with the next ones.
+# The node events don't read the route, so they don't make a node effectful.
+PURE_NODE_TYPES = frozenset({"switch", "check_time", "check_holiday", "set_vars", "debug"})
+
+# Middleware class of each middleware type and the name of its data argument
+MIDDLEWARE_TYPES: Mapping[Middlewares, Tuple[type, str]] = MappingProxyType(
+    {
+        Middlewares.JWT: (HTTPMiddleware, "http_middleware_data"),
+        Middlewares.BASIC: (HTTPMiddleware, "http_middleware_data"),
+        Middlewares.BASE: (HTTPMiddleware, "http_middleware_data"),
+        Middlewares.IRM: (IRMMiddleware, "irm_data"),
+        Middlewares.LLM: (LLMMiddleware, "llm_data"),
+        Middlewares.ASR: (ASRMiddleware, "asr_middleware_content"),
+        Middlewares.TTM: (TTMMiddleware, "ttm_data"),
+    }
+)
+
+
+class MiddlewareSpec:
+    """A middleware of the flow utils resolved with its class."""
+
+    __slots__ = ("id", "cls", "data_arg", "model")
+
+    def __init__(self, middleware_id: str, cls: type, data_arg: str, model: Any) -> None:
+        self.id = middleware_id
+        self.cls = cls
+        self.data_arg = data_arg
+        self.model = model
+
+    @classmethod
+    def resolve(
+        cls, middleware_id: str, get_middleware: Callable[[str], Any]
+    ) -> Optional[MiddlewareSpec]:
+        middleware_model = get_middleware(middleware_id)
+        if not middleware_model:
+            log.warning(f"Middleware {middleware_id} not found")
+            return
+
+        try:
+            middleware_cls, data_arg = MIDDLEWARE_TYPES[Middlewares(middleware_model.type)]
+        except ValueError:
+            log.warning(f"Middleware type {middleware_model.type} not found")
+            return
+
+        return cls(middleware_id, middleware_cls, data_arg, middleware_model)
+
+    def create(self, room, default_variables: Dict) -> Any:
+        return self.cls(
+            **{self.data_arg: self.model}, room=room, default_variables=default_variables
+        )
+
+
+class NodeSpec:
+    """The static part of a node, extracted once when the flow is loaded.
+
+    The node instances created for a room share the node data of the spec.
+    """
+
+    __slots__ = ("id", "type", "cls", "data", "compiled", "pure", "middleware", "middlewares")
+
+    def __init__(
+        self,
+        node_data: Dict,
+        cls: Optional[Type[Base]],
+        middleware: Optional[MiddlewareSpec] = None,
+        middlewares: Tuple[Optional[MiddlewareSpec], ...] = (),
+    ) -> None:
+        self.id: str = node_data.get("id")
+        self.type: str = node_data.get("type")
+        self.cls = cls
+        self.data = node_data
+        self.compiled: Optional[Dict] = cls.compile_content(node_data) if cls else None
+        self.pure: bool = self.type in PURE_NODE_TYPES
+        self.middleware = middleware
+        self.middlewares = middlewares
+
+    def create(self, room, default_variables: Dict) -> Base:
+        node = self.cls(self.data, room=room, default_variables=default_variables)
+        node.compiled = self.compiled
+        self.set_middlewares(node, room=room, default_variables=default_variables)
+        return node
+
+    def set_middlewares(self, node: Base, room, default_variables: Dict) -> None:
+        if self.type in SINGLE_MIDDLEWARE_TYPES and self.middleware:
+            node.middleware = self.middleware.create(room, default_variables)
+        elif self.type in MULTIPLE_MIDDLEWARE_TYPES and self.middlewares:
+            node.middlewares = [
+                middleware.create(room, default_variables) if middleware else None
+                for middleware in self.middlewares
+            ]
+
+
+class FlowGraph:
+    """The nodes of a flow compiled into an immutable index of node specs."""
+
+    __slots__ = ("specs", "by_id")
+
+    def __init__(self, specs: Tuple[NodeSpec, ...]) -> None:
+        self.specs = specs
+        by_id: Dict[str, NodeSpec] = {}
+        for spec in specs:
+            # The first node with a repeated ID is the one used, as in the node list
+            by_id.setdefault(spec.id, spec)
+        self.by_id: Mapping[str, NodeSpec] = MappingProxyType(by_id)
+
+    @staticmethod
+    def middleware_resolver(
+        get_middleware: Optional[Callable[[str], Any]],
+    ) -> Callable[[str], Optional[MiddlewareSpec]]:
+        """Get a function that resolves the middlewares by their ID, each one is resolved once."""
+        middlewares_by_id: Dict[str, Optional[MiddlewareSpec]] = {}
+
+        def resolve(middleware_id: str) -> Optional[MiddlewareSpec]:
+            if get_middleware is None:
+                return
+            if middleware_id not in middlewares_by_id:
+                middlewares_by_id[middleware_id] = MiddlewareSpec.resolve(
+                    middleware_id, get_middleware
+                )
+            return middlewares_by_id[middleware_id]
+
+        return resolve
+
+    @staticmethod
+    def compile_specs(
+        nodes: list[Dict], resolve: Callable[[str], Optional[MiddlewareSpec]]
+    ) -> Tuple[NodeSpec, ...]:
+        """Compile a list of nodes into node specs, keeping their order."""
+        specs = []
+        for node_data in nodes:
+            node_type = node_data.get("type")
+            node_cls = NODE_TYPES.get(node_type)
+            if node_cls is None:
+                log.warning(f"Node {node_data.get('id')} has an unknown type: {node_type}")
+
+            middleware = None
+            middlewares = ()
+            if node_type in SINGLE_MIDDLEWARE_TYPES and node_data.get("middleware"):
+                middleware = resolve(node_data["middleware"])
+            elif node_type in MULTIPLE_MIDDLEWARE_TYPES and node_data.get("middlewares"):
+                middlewares = tuple(resolve(_id) for _id in node_data["middlewares"])
+
+            specs.append(NodeSpec(node_data, node_cls, middleware, middlewares))
+
+        return tuple(specs)
+
+    @classmethod
+    def compile(
+        cls, nodes: list[Dict], get_middleware: Optional[Callable[[str], Any]] = None
+    ) -> FlowGraph:
+        """Compile the node list of a flow.
+
+        Parameters
+        ----------
+        nodes : list[Dict]
+            The nodes of the flow.
+        get_middleware : Callable[[str], Any], optional
+            The function used to get a middleware of the flow utils by its ID.
+
+        Returns
+        -------
+            The compiled flow graph. The nodes with an unknown type have no node class.
+        """
+        return cls(cls.compile_specs(nodes, cls.middleware_resolver(get_middleware)))
+
+    def get(self, node_id: str) -> Optional[NodeSpec]:
+        return self.by_id.get(node_id)
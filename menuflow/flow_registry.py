@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mautrix.util.logging import TraceLogger
+
+from .config import Config
+from .db import Module as DBModule
+from .db import Tag as TagDB
+from .flow_graph import FlowGraph, NodeSpec
+from .repository import Flow as FlowModel
+
+log: TraceLogger = logging.getLogger("menuflow.flow_registry")
+
+# (flow_id, tag_id)
+FlowKey = Tuple[int, int]
+
+
+class CompiledModule:
+    """The nodes of a module compiled into node specs.
+
+    The next loads of the flow reuse it while the nodes hash of the module doesn't change.
+    """
+
+    __slots__ = ("id", "nodes_hash", "nodes", "specs")
+
+    def __init__(
+        self, module_id: int, nodes_hash: Optional[str], nodes: List[Dict], specs: Tuple[NodeSpec]
+    ) -> None:
+        self.id = module_id
+        self.nodes_hash = nodes_hash
+        self.nodes = nodes
+        self.specs = specs
+
+
+class CompiledFlow:
+    """A loaded flow with its compiled graph.
+
+    It is shared by all the clients that use the same tag of a flow, so it must not be
+    modified: a reload creates a new compiled flow and the clients swap their reference.
+    """
+
+    __slots__ = ("key", "data", "graph", "modules", "get_middleware", "refs")
+
+    def __init__(
+        self,
+        key: Optional[FlowKey],
+        data: FlowModel,
+        graph: FlowGraph,
+        modules: Tuple[CompiledModule, ...] = (),
+        get_middleware: Optional[Callable[[str], Any]] = None,
+    ) -> None:
+        self.key = key
+        self.data = data
+        self.graph = graph
+        # Compiled modules of the flows loaded from the database
+        self.modules = modules
+        # Function used to resolve the middlewares of the node specs
+        self.get_middleware = get_middleware
+        # Number of clients using the compiled flow
+        self.refs = 0
+
+    @classmethod
+    def compile(
+        cls, data: FlowModel, get_middleware: Optional[Callable[[str], Any]] = None
+    ) -> CompiledFlow:
+        key = FlowRegistry.key_of(data.loaded_metadata)
+        graph = FlowGraph.compile(data.nodes or [], get_middleware=get_middleware)
+        return cls(key, data, graph, get_middleware=get_middleware)
+
+
+class FlowRegistry:
+    """The compiled flows of the loaded tags, shared across the clients.
+
+    A tag is loaded and compiled only once, the clients of the same flow get the same
+    compiled flow. It is released when the last client using it stops using it.
+    The flows loaded from YAML files are not shared, they are compiled per client.
+    """
+
+    flows: Dict[FlowKey, CompiledFlow] = {}
+    _loading: Dict[FlowKey, asyncio.Future] = {}
+
+    @staticmethod
+    def key_of(loaded_metadata: Optional[Dict]) -> Optional[FlowKey]:
+        tag_info: Dict = (loaded_metadata or {}).get("tag_info") or {}
+        flow_id, tag_id = tag_info.get("flow_id"), tag_info.get("id")
+        if flow_id is None or tag_id is None:
+            return None
+
+        return flow_id, tag_id
+
+    @classmethod
+    def register(cls, compiled: CompiledFlow) -> CompiledFlow:
+        """Make a compiled flow the shared one of its tag, replacing the previous one."""
+        if compiled.key is not None:
+            cls.flows[compiled.key] = compiled
+        return compiled
+
+    @classmethod
+    def acquire(cls, compiled: CompiledFlow) -> CompiledFlow:
+        compiled.refs += 1
+        return compiled
+
+    @classmethod
+    def release(cls, compiled: Optional[CompiledFlow]) -> None:
+        if compiled is None:
+            return
+
+        compiled.refs -= 1
+        if compiled.refs <= 0 and cls.flows.get(compiled.key) is compiled:
+            log.debug(f"Releasing the compiled flow {compiled.key}")
+            del cls.flows[compiled.key]
+
+    @classmethod
+    def from_content(
+        cls, content: Dict, get_middleware: Optional[Callable[[str], Any]] = None
+    ) -> CompiledFlow:
+        """Compile the content of a flow and make it the shared one of its tag."""
+        data = FlowModel(
+            flow_variables=content["flow_variables"],
+            nodes=content["nodes"],
+            loaded_metadata=content["loaded_metadata"],
+        )
+        return cls.register(CompiledFlow.compile(data, get_middleware=get_middleware))
+
+    @classmethod
+    async def load(
+        cls,
+        flow_mxid: str,
+        config: Config,
+        get_middleware: Optional[Callable[[str], Any]] = None,
+        reload: bool = True,
+    ) -> CompiledFlow:
+        """Load the flow of a client.
+
+        Parameters
+        ----------
+        flow_mxid : str
+            The mxid of the client.
+        config : Config
+            The config, used to know the source of the flow.
+        get_middleware : Callable[[str], Any], optional
+            The function used to get a middleware of the flow utils by its ID.
+        reload : bool, optional
+            If False, the compiled flow of the active tag is reused if it is already loaded.
+            Otherwise, the tag is loaded again and replaces the shared compiled flow.
+
+        Returns
+        -------
+            The compiled flow.
+        """
+        if config["menuflow.load_flow_from"] != "database":
+            data = await FlowModel.load_flow(flow_mxid=flow_mxid, config=config)
+            return CompiledFlow.compile(data, get_middleware=get_middleware)
+
+        tag_db = await FlowModel.get_active_tag(flow_mxid)
+        key: FlowKey = (tag_db.flow_id, tag_db.id)
+
+        if not reload and key in cls.flows:
+            return cls.flows[key]
+
+        return await cls.load_tag(tag_db, get_middleware=get_middleware)
+
+    @classmethod
+    def latest(cls, flow_id: int) -> Optional[CompiledFlow]:
+        """Get the last registered compiled flow of a flow, of any of its tags."""
+        for key in reversed(cls.flows):
+            if key[0] == flow_id:
+                return cls.flows[key]
+
+    @classmethod
+    async def load_tag(
+        cls, tag_db: TagDB, get_middleware: Optional[Callable[[str], Any]] = None
+    ) -> CompiledFlow:
+        """Load a tag and make it the shared compiled flow of the tag.
+
+        Only the modules whose nodes changed since the last compiled flow of the same flow
+        are fetched and compiled, the others are reused. The new compiled flow is built apart
+        and then registered, so the clients keep using the previous one until they swap it.
+
+        Parameters
+        ----------
+        tag_db : TagDB
+            The tag to load.
+        get_middleware : Callable[[str], Any], optional
+            The function used to get a middleware of the flow utils by its ID.
+
+        Returns
+        -------
+            The compiled flow.
+        """
+        key: FlowKey = (tag_db.flow_id, tag_db.id)
+
+        # Clients of the same tag loading at the same time wait for a single load
+        if future := cls._loading.get(key):
+            return await asyncio.shield(future)
+
+        future = cls._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            log.info(f"Loading tag {tag_db.id} of flow {tag_db.flow_id}")
+            compiled = cls.register(await cls._compile_tag(tag_db, get_middleware))
+            future.set_result(compiled)
+            return compiled
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid "exception never retrieved" warnings when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            cls._loading.pop(key, None)
+
+    @classmethod
+    async def _compile_tag(
+        cls, tag_db: TagDB, get_middleware: Optional[Callable[[str], Any]]
+    ) -> CompiledFlow:
+        # The node specs can only be reused if their middlewares are resolved the same way
+        previous = cls.flows.get((tag_db.flow_id, tag_db.id)) or cls.latest(tag_db.flow_id)
+        reusable: Dict[str, CompiledModule] = {}
+        if previous and previous.get_middleware == get_middleware:
+            reusable = {module.nodes_hash: module for module in previous.modules}
+
+        module_hashes = await DBModule.get_tag_module_hashes(tag_db.id)
+        changed_ids = [
+            module_id
+            for module_id, nodes_hash in module_hashes
+            if nodes_hash is None or nodes_hash not in reusable
+        ]
+        changed = {}
+        if changed_ids:
+            changed = {module.id: module for module in await DBModule.get_by_ids(changed_ids)}
+
+        resolve = FlowGraph.middleware_resolver(get_middleware)
+        modules: List[CompiledModule] = []
+        for module_id, nodes_hash in module_hashes:
+            if module := changed.get(module_id):
+                specs = FlowGraph.compile_specs(module.nodes, resolve)
+                modules.append(CompiledModule(module_id, nodes_hash, module.nodes, specs))
+            elif reused := reusable.get(nodes_hash):
+                modules.append(CompiledModule(module_id, nodes_hash, reused.nodes, reused.specs))
+            # Otherwise the module was deleted after the hashes were read
+
+        log.debug(
+            f"Tag {tag_db.id} of flow {tag_db.flow_id}: compiled {len(changed)} modules, "
+            f"reused {len(modules) - len(changed)}"
+        )
+
+        data = FlowModel(
+            flow_variables=tag_db.flow_vars,
+            nodes=[node for module in modules for node in module.nodes],
+            loaded_metadata=FlowModel.tag_metadata(tag_db, [module.id for module in modules]),
+        )
+        graph = FlowGraph(tuple(chain.from_iterable(module.specs for module in modules)))
+        return CompiledFlow(
+            (tag_db.flow_id, tag_db.id), data, graph, tuple(modules), get_middleware
+        )
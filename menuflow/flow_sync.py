@@ -1,52 +1,66 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from logging import getLogger
+from time import monotonic
 
+import asyncpg
 from mautrix.types import RoomID, UserID
 
 from menuflow.config import Config
 from menuflow.db.client import Client as DBClient
 from menuflow.db.flow import Flow as DBFlow
-from menuflow.db.module import Module as DBModule
 from menuflow.db.tag import Tag as DBTag
+from menuflow.flow_registry import CompiledFlow, FlowRegistry
 
 log = getLogger("menuflow.flow_sync")
 
 
 class FlowSync:
+    # Channel of the notifications sent when the active tag of a flow changes
+    NOTIFY_CHANNEL = "menuflow_active_tag"
+
+    # Cached flow id, active tag id and load time of each client
+    active_tags: dict[UserID, tuple[int, int | None, float]] = {}
+    # Seconds to keep the cached active tags if no notification is received
+    ttl: float = 30
+    # Seconds to wait before reconnecting the notification listener
+    reconnect_delay: float = 5
+
     def __init__(self, config: Config):
         self.config = config
+        FlowSync.ttl = config.get("menuflow.active_tag_cache_ttl", 30)
 
     @staticmethod
-    async def build_active_tag_content(tag_id: int) -> dict:
-        """Build the content of the active tag.
+    async def compile_active_tag(tag_id: int) -> CompiledFlow:
+        """Compile the active tag.
+
+        Only the modules that changed since the last load of the flow are fetched and compiled.
 
         Args:
-            tag_id (int): The id of the tag to build the content for.
+            tag_id (int): The id of the tag to compile.
 
         Returns:
-            dict: The content of the active tag.
+            CompiledFlow: The compiled flow of the active tag.
         """
-        tag_obj = await DBTag.get_by_id(tag_id)
-        modules = await DBModule.get_tag_modules(tag_obj.id)
+        from menuflow.flow import Flow
 
-        return {
-            "flow_variables": tag_obj.flow_vars,
-            "nodes": [node for module in modules for node in module.get("nodes", [])],
-            "loaded_metadata": {
-                "tag_info": {"name": tag_obj.name, "id": tag_obj.id},
-                "loaded_modules_ids": [module.id for module in modules],
-            },
-        }
+        tag_obj = await DBTag.get_by_id(tag_id)
+        get_middleware = Flow.flow_utils.get_middleware_by_id if Flow.flow_utils else None
+        return await FlowRegistry.load_tag(tag_obj, get_middleware=get_middleware)
 
     async def update_flow_db_clients(
-        self, flow_id: int, content: dict, uuid: str | None = None
+        self, flow_id: int, compiled: CompiledFlow, uuid: str | None = None
     ) -> None:
         """Update the flow of the db clients.
 
+        The compiled flow is swapped in each client, the algorithm runs already in progress
+        finish with the flow they started with.
+
         Args:
             flow_id (int): The id of the flow to update.
-            content (dict): The content of the flow to update.
+            compiled (CompiledFlow): The compiled flow shared by the clients.
             uuid (str | None): The uuid of the operation.
         """
         from menuflow.menu import MenuClient
@@ -56,27 +70,155 @@ class FlowSync:
 
         for db_client in db_clients:
             client = MenuClient.cache[db_client.id]
-            await client.flow_cls.load_flow(flow_mxid=client.id, content=content)
+            client.flow_cls.set_compiled(compiled)
+
+    async def reload_active_tag(self, flow_id: int, tag_id: int, uuid: str | None = None) -> None:
+        """Compile the active tag of a flow and update the flow of its db clients.
+
+        Args:
+            flow_id (int): The id of the flow.
+            tag_id (int): The id of the active tag.
+            uuid (str | None): The uuid of the operation.
+        """
+        compiled = await self.compile_active_tag(tag_id)
+        await self.update_flow_db_clients(flow_id, compiled, uuid)
+
+    @classmethod
+    def get_cached_active_tag(cls, mxid: UserID) -> tuple[int, int] | None:
+        """Get the flow id and the active tag id of a client from the cache,
+        if they were loaded less than `ttl` seconds ago."""
+        try:
+            flow_id, tag_id, loaded_at = cls.active_tags[mxid]
+        except KeyError:
+            return None
+
+        if monotonic() - loaded_at > cls.ttl:
+            return None
+
+        return flow_id, tag_id
+
+    @classmethod
+    async def get_active_tag(cls, mxid: UserID) -> tuple[int, int | None]:
+        """Get the flow id and the active tag id of a client, using the cache.
+
+        Args:
+            mxid (UserID): The mxid of the client.
+
+        Returns:
+            tuple[int, int | None]: The flow id and the active tag id.
+        """
+        if cached := cls.get_cached_active_tag(mxid):
+            return cached
+
+        flow_db = await DBFlow.get_by_mxid(mxid)
+        active_tag = await DBTag.get_active_tag(flow_db.id)
+        tag_id = active_tag.id if active_tag else None
+        cls.active_tags[mxid] = (flow_db.id, tag_id, monotonic())
+
+        return flow_db.id, tag_id
+
+    @classmethod
+    def set_active_tag(cls, flow_id: int, tag_id: int | None) -> None:
+        """Update the cached active tag of the clients of a flow.
+
+        Args:
+            flow_id (int): The id of the flow.
+            tag_id (int | None): The id of the new active tag, None to invalidate the cache.
+        """
+        for mxid, (_flow_id, _, _) in list(cls.active_tags.items()):
+            if _flow_id != flow_id:
+                continue
+
+            if tag_id is None:
+                del cls.active_tags[mxid]
+            else:
+                cls.active_tags[mxid] = (flow_id, tag_id, monotonic())
+
+    @classmethod
+    async def notify_active_tag(cls, flow_id: int, tag_id: int | None = None) -> None:
+        """Notify all the menuflow instances that the active tag of a flow changed.
+
+        Args:
+            flow_id (int): The id of the flow.
+            tag_id (int | None): The id of the new active tag, None if it is unknown.
+        """
+        cls.set_active_tag(flow_id, tag_id)
+        try:
+            await DBTag.notify_active_tag(cls.NOTIFY_CHANNEL, flow_id, tag_id)
+        except Exception as e:
+            log.error(f"Error notifying the active tag {tag_id} of flow {flow_id}: {e}")
+
+    @classmethod
+    def _on_active_tag_notification(cls, _conn, _pid: int, _channel: str, payload: str) -> None:
+        try:
+            data: dict = json.loads(payload)
+            flow_id, tag_id = int(data["flow_id"]), data.get("tag_id")
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(f"Invalid active tag notification {payload!r}: {e}")
+            return
+
+        log.debug(f"Active tag of flow {flow_id} changed to {tag_id}")
+        cls.set_active_tag(flow_id, int(tag_id) if tag_id is not None else None)
+
+    @classmethod
+    async def listen_active_tag(cls, database_url: str) -> None:
+        """Listen to the active tag notifications of the other menuflow instances.
+
+        The listener has its own connection, out of the pool of the database, because it is
+        kept open while menuflow runs. The cache is cleared while the listener is disconnected,
+        because the notifications sent in the meantime are lost.
+        """
+        if not database_url.startswith(("postgres://", "postgresql://")):
+            log.warning(f"{cls.NOTIFY_CHANNEL} notifications are only supported in PostgreSQL")
+            return
+
+        while True:
+            conn: asyncpg.Connection | None = None
+            try:
+                conn = await asyncpg.connect(database_url)
+                closed = asyncio.get_running_loop().create_future()
+                conn.add_termination_listener(
+                    lambda _conn: closed.done() or closed.set_result(None)
+                )
+                await conn.add_listener(cls.NOTIFY_CHANNEL, cls._on_active_tag_notification)
+                log.debug(f"Listening to {cls.NOTIFY_CHANNEL} notifications")
+                await closed
+                log.warning(f"The connection listening to {cls.NOTIFY_CHANNEL} was closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Error listening to {cls.NOTIFY_CHANNEL} notifications: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+            cls.active_tags.clear()
+            await asyncio.sleep(cls.reconnect_delay)
 
     async def check_active_tag(self, room_id: RoomID, mxid: UserID, loaded_metadata: dict) -> None:
         """Check if the active tag is the same as the loaded tag.
 
+        The active tag is taken from the cache, which is updated by the tag notifications,
+        so the database is only queried when the cached value is older than the TTL.
+
         Args:
             room_id (RoomID): The id of the room to check.
             mxid (str): The mxid of the flow to check.
             flow (RuntimeFlow): The flow to check.
         """
-        flow_db = await DBFlow.get_by_mxid(mxid)
-        active_tag = await DBTag.get_active_tag(flow_db.id)
+        flow_id, active_tag_id = await self.get_active_tag(mxid)
         loaded_tag_id = loaded_metadata.get("tag_info", {}).get("id")
 
-        if active_tag.id == loaded_tag_id:
+        if active_tag_id == loaded_tag_id:
+            return
+
+        if active_tag_id is None:
+            log.warning(f"[{room_id}] The flow {flow_id} doesn't have an active tag")
             return
 
         log.critical(
             f"[{room_id}] Danger! The active tag is not the same as the loaded tag. "
-            f"Cached data: {loaded_metadata}. Active tag db: {active_tag.id}"
+            f"Cached data: {loaded_metadata}. Active tag db: {active_tag_id}"
         )
 
-        content = await self.build_active_tag_content(active_tag.id)
-        await self.update_flow_db_clients(flow_db.id, content)
+        await self.reload_active_tag(flow_id, active_tag_id)
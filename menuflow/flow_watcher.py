@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+from logging import getLogger
+
+from .config import Config
+from .repository import Flow as FlowModel
+
+log = getLogger("menuflow.flow_watcher")
+
+
+class FlowWatcher:
+    """Reload the flows of the clients when their YAML files change.
+
+    The files are polled, so it works on any file system, including mounted volumes.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self.interval: float = config.get("menuflow.flows_watch_interval", 0) or 0
+        # Modification time of the flow file of each client, when it was last seen
+        self.mtimes: dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and self.config["menuflow.load_flow_from"] == "yaml"
+
+    async def check(self) -> None:
+        """Reload the flows whose files changed since the last check."""
+        from .menu import MenuClient
+
+        for client in list(MenuClient.cache.values()):
+            try:
+                mtime = FlowModel.yaml_path(client.id).stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            last_mtime = self.mtimes.get(client.id)
+            self.mtimes[client.id] = mtime
+            if last_mtime is None or last_mtime == mtime:
+                continue
+
+            log.info(f"The flow file of {client.id} changed, reloading it")
+            try:
+                await client.flow_cls.load_flow(flow_mxid=client.id, config=self.config)
+            except Exception as e:
+                log.error(f"Error reloading the flow of {client.id}: {e}")
+
+    async def watch(self) -> None:
+        # The first check only records the modification times of the loaded flows
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                log.exception(f"Error checking the flow files: {e}")
+            await asyncio.sleep(self.interval)
@@ -8,6 +8,7 @@ from typing import TYPE_CHECKING, Dict
 from aiohttp import ClientSession, TraceRequestEndParams, TraceRequestStartParams
 from mautrix.util.logging import TraceLogger
 
+from .middlewares.token_cache import CachedToken, TokenCache
 from .room import Room
 
 if TYPE_CHECKING:
@@ -53,17 +54,18 @@ async def start_auth_middleware(
 
     token_str: str = ""
     if middleware.type == "jwt":
-        room: Room = await Room.get_by_room_id(
-            room_id=context_params.get("customer_room_id"), bot_mxid=context_params.get("bot_mxid")
-        )
-        room_variables: Dict = middleware.auth.get("variables", {})
-        token_key: str = list(room_variables.keys())[0]
-
-        if not await room.get_variable(token_key):
-            await middleware.auth_request()
-
+        token: CachedToken = await TokenCache.get_token(middleware)
         token_type: str = middleware.token_type if middleware.token_type is not None else "Bearer"
-        token_str = await room.get_variable(variable_id=token_key)
+        if token:
+            token_str = token.token
+            trace_config_ctx.token_generation = token.generation
+            # The flows can use the middleware variables, they are kept in the room
+            room: Room = await Room.get_by_room_id(
+                room_id=context_params.get("customer_room_id"),
+                bot_mxid=context_params.get("bot_mxid"),
+            )
+            if room and await room.get_variable(middleware.token_variable) != token_str:
+                await room.set_variables(variables=token.variables)
     elif middleware.type == "basic":
         log.info(f"middleware: {middleware.id} type: {middleware.type} executing ...")
         auth_str = f"{middleware.basic_auth['login']}:{middleware.basic_auth['password']}".encode(
@@ -116,4 +118,6 @@ async def end_auth_middleware(
 
         if middleware.type == "jwt":
             log.info("Token expired, refreshing token ...")
-            await middleware.auth_request()
+            await TokenCache.invalidate(
+                middleware, getattr(trace_config_ctx, "token_generation", None)
+            )
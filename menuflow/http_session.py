@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from logging import getLogger
+from types import SimpleNamespace
+from typing import Any
+
+from aiohttp import (
+    ClientSession,
+    TCPConnector,
+    TraceConfig,
+    TraceRequestEndParams,
+    TraceRequestExceptionParams,
+    TraceRequestStartParams,
+)
+from mautrix.util.logging import TraceLogger
+
+from .config import Config
+from .http_middlewares import end_auth_middleware, start_auth_middleware
+
+log: TraceLogger = getLogger("menuflow.http_session")
+
+
+class HostStats:
+    """Usage of the connection pool of an upstream host."""
+
+    __slots__ = (
+        "in_flight",
+        "max_in_flight",
+        "requests",
+        "errors",
+        "queued",
+        "connections_created",
+        "connections_reused",
+    )
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        # Requests that had to wait for a free connection of the pool
+        self.queued = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def serialize(self, limit_per_host: int) -> dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["utilization"] = round(self.in_flight / limit_per_host, 3) if limit_per_host else None
+        return data
+
+
+class OutboundSession:
+    """The HTTP session of the requests sent to the external services by the nodes
+    and the middlewares.
+
+    It is shared by all the clients and is independent of the sessions used to talk to the
+    homeserver, so the integrations don't compete with the Matrix traffic for connections.
+    The connector limits, DNS cache and keep-alive are configured in `menuflow.http_client`.
+    """
+
+    session: ClientSession | None = None
+    limit_per_host: int = 0
+    stats: dict[str, HostStats] = {}
+
+    @classmethod
+    def get(cls, config: Config) -> ClientSession:
+        """Get the outbound session, it is created the first time."""
+        if cls.session is None or cls.session.closed:
+            cls.session = cls.create(config)
+        return cls.session
+
+    @classmethod
+    def create(cls, config: Config) -> ClientSession:
+        options: dict = config["menuflow.http_client"] or {}
+        cls.limit_per_host = options.get("limit_per_host", 0)
+        connector = TCPConnector(
+            limit=options.get("limit", 100),
+            limit_per_host=cls.limit_per_host,
+            use_dns_cache=options.get("dns_cache_ttl", 0) > 0,
+            ttl_dns_cache=options.get("dns_cache_ttl") or None,
+            keepalive_timeout=options.get("keepalive_timeout", 15),
+            enable_cleanup_closed=True,
+        )
+
+        auth_trace_config = TraceConfig()
+        auth_trace_config.on_request_start.append(start_auth_middleware)
+        auth_trace_config.on_request_end.append(end_auth_middleware)
+
+        log.debug(
+            f"Creating the outbound HTTP session [limit: {connector.limit}] "
+            f"[limit_per_host: {connector.limit_per_host}]"
+        )
+        return ClientSession(
+            connector=connector, trace_configs=[auth_trace_config, cls.stats_trace_config()]
+        )
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls.session and not cls.session.closed:
+            await cls.session.close()
+        cls.session = None
+
+    @classmethod
+    def pool_stats(cls) -> dict[str, Any]:
+        """Get the limits of the connection pool and the usage of each upstream host."""
+        connector = cls.session.connector if cls.session else None
+        return {
+            "limit": connector.limit if connector else None,
+            "limit_per_host": connector.limit_per_host if connector else None,
+            "hosts": {
+                host: stats.serialize(cls.limit_per_host) for host, stats in cls.stats.items()
+            },
+        }
+
+    @classmethod
+    def _host_stats(cls, trace_config_ctx: SimpleNamespace) -> HostStats | None:
+        host = getattr(trace_config_ctx, "host", None)
+        return cls.stats.get(host) if host else None
+
+    @classmethod
+    def stats_trace_config(cls) -> TraceConfig:
+        async def on_request_start(
+            session: ClientSession, ctx: SimpleNamespace, params: TraceRequestStartParams
+        ) -> None:
+            ctx.host = f"{params.url.host}:{params.url.port}"
+            stats = cls.stats.setdefault(ctx.host, HostStats())
+            stats.requests += 1
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+
+        async def on_request_end(
+            session: ClientSession, ctx: SimpleNamespace, params: TraceRequestEndParams
+        ) -> None:
+            if stats := cls._host_stats(ctx):
+                stats.in_flight -= 1
+
+        async def on_request_exception(
+            session: ClientSession, ctx: SimpleNamespace, params: TraceRequestExceptionParams
+        ) -> None:
+            if stats := cls._host_stats(ctx):
+                stats.in_flight -= 1
+                stats.errors += 1
+
+        async def on_connection_queued_start(session, ctx: SimpleNamespace, params) -> None:
+            if stats := cls._host_stats(ctx):
+                stats.queued += 1
+
+        async def on_connection_create_end(session, ctx: SimpleNamespace, params) -> None:
+            if stats := cls._host_stats(ctx):
+                stats.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx: SimpleNamespace, params) -> None:
+            if stats := cls._host_stats(ctx):
+                stats.connections_reused += 1
+
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
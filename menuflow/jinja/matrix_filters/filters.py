@@ -1,4 +1,4 @@
-from re import match
+from menuflow.utils.matchers import compile_pattern
 
 
 def user_bridge_info(user_id: str) -> tuple[str, str]:
@@ -6,7 +6,7 @@ def user_bridge_info(user_id: str) -> tuple[str, str]:
 
     config = get_config()
     pattern = config.get("menuflow.customer_pattern", "") or ""
-    user_bridge_match = match(pattern, user_id)
+    user_bridge_match = compile_pattern(pattern).match(user_id)
 
     if not user_bridge_match:
         return "", ""
@@ -20,14 +20,20 @@ from mautrix.types import (
     StrippedStateEvent,
     UserID,
 )
+from mautrix.util import background_task
 
 from .config import Config
 from .db.room import Room as DBRoom
 from .db.route import RouteState
+from .delay_scheduler import DelayScheduler, now_ms
 from .flow_sync import FlowSync
+from .http_session import OutboundSession
+from .message_store import MessageStore
 from .nodes import Base, FormInput, GPTAssistant, Input, InteractiveInput, Message, Webhook
 from .repository.room_events import RoomEvents
 from .room import Room
+from .room_dispatcher import RoomDispatcher
+from .room_state_cache import RoomStateCache
 from .room_sync_primitives import PrimitiveType, RoomSyncPrimitives
 from .user import User
 from .utils import Util
@@ -51,14 +57,30 @@ class MatrixHandler(MatrixClient):
         self.LAST_JOIN_EVENT: dict[RoomID, StrippedStateEvent] = {}
         self.QUEUE_MESSAGE: dict[RoomID, asyncio.Queue] = {}
         self.flow_sync = FlowSync(config=self.config)
+        self.room_dispatcher = RoomDispatcher(log=self.log.getChild("room_dispatcher"))
+        self.message_store = MessageStore(
+            bot_mxid=self.mxid,
+            enabled=self.config["menuflow.message_queue.persist"],
+            flush_interval=self.config["menuflow.message_queue.flush_interval"],
+        )
+        self.delay_scheduler = DelayScheduler(bot_mxid=self.mxid, resume=self.resume_delayed_flow)
         self.MAX_NODE_ATTEMPTS = self.config.get("menuflow.max_node_attempts", 255)
-        Base.init_cls(config=self.config, session=self.api.session)
+        Base.init_cls(config=self.config, session=OutboundSession.get(self.config))
 
     def handle_sync(self, data: dict) -> list[asyncio.Task]:
         # This is a way to remove duplicate events from the sync
         try:
+            self.room_dispatcher.start_batch(next_batch=data.get("next_batch"))
+
+            # The rooms left by the bot stop receiving state updates in the sync
+            for room_id in data.get("rooms", {}).get("leave", {}):
+                RoomStateCache.clear(room_id)
+
             rooms = data.get("rooms", {}).get("join", {})
             for room_id, room_data in rooms.items():
+                # Keep the room state cache updated with the state events of the sync
+                RoomStateCache.handle_sync_room(room_id=room_id, room_data=room_data)
+
                 last_join_evt = self.LAST_JOIN_EVENT.get(room_id, {})
                 events = room_data.get("timeline", {}).get("events", [])
                 for evt in events:
@@ -327,7 +349,9 @@ class MatrixHandler(MatrixClient):
             # Signal the join event to the message handler
             room_sync.set()
 
-        await self.algorithm(room=room, state_event=evt)
+        # The flow runs outside the room dispatcher, so the next events of the room are handled
+        # in order while it waits for inputs or slow nodes.
+        background_task.create(self.algorithm(room=room, state_event=evt))
 
     async def handle_message(self, message: MessageEvent) -> None:
         _event_id, _room_id = message.event_id, message.room_id
@@ -422,7 +446,7 @@ class MatrixHandler(MatrixClient):
 
         # TODO: Review this logic
         if not queue:
-            await self.algorithm(room=room, evt=message)
+            background_task.create(self.algorithm(room=room, evt=message))
 
     async def enqueue_message(
         self, message: MessageEvent | QueueSignal, room: Room
@@ -449,6 +473,7 @@ class MatrixHandler(MatrixClient):
 
         queue.put_nowait(message)
         if isinstance(message, MessageEvent):
+            self.message_store.append(room_id=room.room_id, message=message)
             self.log.info(f"[{room.room_id}] Message ({message.event_id}) enqueued")
             await self.update_room_events(room=room, evt=message)
 
@@ -531,6 +556,20 @@ class MatrixHandler(MatrixClient):
 
         self.lock_room(room_id=room.room_id, evt=evt)
 
+        if room.route.state == RouteState.DELAY:
+            if room.route.wake_at and room.route.wake_at > now_ms():
+                _event_id = getattr(evt, "event_id", "unknown")
+                self.log.warning(
+                    f"[{room.room_id}] The flow is delayed until {room.route.wake_at}, "
+                    f"skipping event ({_event_id})."
+                )
+                self.unlock_room(room_id=room.room_id, evt=evt)
+                return
+
+            # The delay has ended, the flow continues in the next node
+            self.delay_scheduler.cancel(room_id=room.room_id)
+            await room.update_menu(node_id=room.route.node_id, update_node_vars=False)
+
         if evt and run_input_node:
             await self.update_room_events(room=room, evt=evt)
 
@@ -538,83 +577,103 @@ class MatrixHandler(MatrixClient):
             room_id=room.room_id, mxid=self.mxid, loaded_metadata=self.flow.data.loaded_metadata
         )
 
-        while (
-            (node := self.flow.node(room=room))
-            and room.route.state != RouteState.END
-            and not room.room_events.leave
-            and room.reentry_node_attempts <= self.MAX_NODE_ATTEMPTS
-        ):
-            if self.log.isEnabledFor(logging.DEBUG):
-                trigger_evt = evt if evt is not None else state_event
-                event_id, sender, timestamp, event_type = self._get_event_info(evt=trigger_evt)
-
-                self.log.debug(
-                    f"[{room.room_id}] Executing node: [{node.id}]. State: ({room.route.state}). "
-                    f"Triggered by: ({event_id}). Sender: ({sender}). Timestamp: ({timestamp}). "
-                    f"Type evt: ({event_type}). "
-                )
+        # The whole run uses the same flow, a reload during the run only affects the next ones
+        flow = self.flow.snapshot()
 
-            try:
-                if type(node) in (Input, InteractiveInput, FormInput, GPTAssistant, Webhook):
-                    if run_input_node:
-                        await node.run(evt)
-                        node.reentry_counter(room=room, executed_node_id=node.id)
-                    run_input_node = True  # one-time reset to True
-                    if room.route.state == RouteState.INPUT:
-                        evt = await self.get_input_response(room=room, node=node)
-                        _msg = "Message received in algorithm"
+        # The route writes deferred by the pure nodes are written also if the run is
+        # cancelled or fails, otherwise the room would keep deferring them
+        try:
+            while (
+                (node := flow.node(room=room))
+                and room.route.state not in (RouteState.END, RouteState.DELAY)
+                and not room.room_events.leave
+                and room.reentry_node_attempts <= self.MAX_NODE_ATTEMPTS
+            ):
+                if self.log.isEnabledFor(logging.DEBUG):
+                    trigger_evt = evt if evt is not None else state_event
+                    event_id, sender, timestamp, event_type = self._get_event_info(evt=trigger_evt)
+
+                    self.log.debug(
+                        f"[{room.room_id}] Executing node: [{node.id}]. State: ({room.route.state}). "
+                        f"Triggered by: ({event_id}). Sender: ({sender}). Timestamp: ({timestamp}). "
+                        f"Type evt: ({event_type}). "
+                    )
 
-                        if not evt or evt is QueueSignal.CANCELLED:
-                            self.log.info(
-                                f"[{room.room_id}] Stopping the flow until a new message arrives"
-                            )
-                            break
+                # Consecutive pure nodes only change the route in memory, it is written once
+                # before the next effectful node, so a crash resumes at the last written node.
+                if flow.is_pure_node(node.id):
+                    room.defer_route_writes = True
+                else:
+                    await room.flush_route_writes()
 
-                        if evt is QueueSignal.LEAVE:
-                            _msg = "Leave detected in algorithm."
-                        elif evt is QueueSignal.TIMEOUT:
-                            _msg = "Timeout detected in algorithm."
-                        elif isinstance(node, GPTAssistant):
-                            if timeout := getattr(node, "group_messages_timeout", 0):
-                                # TODO: Review this logic when all input nodes can receive a list of messages.
-                                grouped_messages = await self.group_message(
-                                    room=room, timeout=timeout
+                try:
+                    if type(node) in (Input, InteractiveInput, FormInput, GPTAssistant, Webhook):
+                        if run_input_node:
+                            await node.run(evt)
+                            self.ack_messages(room=room, evt=evt)
+                            node.reentry_counter(room=room, executed_node_id=node.id)
+                        run_input_node = True  # one-time reset to True
+                        if room.route.state == RouteState.INPUT:
+                            evt = await self.get_input_response(room=room, node=node)
+                            _msg = "Message received in algorithm"
+
+                            if not evt or evt is QueueSignal.CANCELLED:
+                                self.log.info(
+                                    f"[{room.room_id}] Stopping the flow until a new message arrives"
                                 )
-                                _msg = f"{len(grouped_messages)} message(s) received in algorithm"
-                                evt = [evt, *grouped_messages]
-                            else:
-                                evt = [evt]
+                                break
+
+                            if evt is QueueSignal.LEAVE:
+                                _msg = "Leave detected in algorithm."
+                            elif evt is QueueSignal.TIMEOUT:
+                                _msg = "Timeout detected in algorithm."
+                            elif isinstance(node, GPTAssistant):
+                                if timeout := getattr(node, "group_messages_timeout", 0):
+                                    # TODO: Review this logic when all input nodes can receive a list of messages.
+                                    grouped_messages = await self.group_message(
+                                        room=room, timeout=timeout
+                                    )
+                                    _msg = (
+                                        f"{len(grouped_messages)} message(s) received in algorithm"
+                                    )
+                                    evt = [evt, *grouped_messages]
+                                else:
+                                    evt = [evt]
+
+                            self.log.info(f"[{room.room_id}] {_msg}")
+                    else:
+                        # TODO: This is to fix the problem where path constants are not stored. Possible removal.
+                        if (
+                            isinstance(node, Message)
+                            and node.id == RouteState.START.value
+                            and room.route.state == RouteState.START
+                        ):
+                            self.log.info(
+                                f"[{room.room_id}] Checking if room constants are loaded..."
+                            )
+                            await self.load_room_constants(room_id=room.room_id, room=room)
 
-                        self.log.info(f"[{room.room_id}] {_msg}")
-                else:
-                    # TODO: This is to fix the problem where path constants are not stored. Possible removal.
-                    if (
-                        isinstance(node, Message)
-                        and node.id == RouteState.START.value
-                        and room.route.state == RouteState.START
-                    ):
-                        self.log.info(f"[{room.room_id}] Checking if room constants are loaded...")
-                        await self.load_room_constants(room_id=room.room_id, room=room)
-
-                    await node.run()
-                    node.reentry_counter(room=room, executed_node_id=node.id)
-                    if room.route.state == RouteState.INVITE:
-                        self.log.debug(
-                            f"[{room.room_id}] Invite state detected. Breaking out of the loop"
-                        )
-                        break
-            except MLimitExceeded as e:
-                self.log.error(
-                    f"[{room.room_id}] MLimitExceeded exception has occurred in the pipeline [{node.id}]: {e}\n"
-                    f"please check your flow configuration to prevent this."
-                )
-                break
-            except Exception as e:
-                self.log.exception(
-                    f"[{room.room_id}] Exception has occurred in the algorithm: \n{e}"
-                )
-                room.route.state = RouteState.ERROR
-                break
+                        await node.run()
+                        node.reentry_counter(room=room, executed_node_id=node.id)
+                        if room.route.state == RouteState.INVITE:
+                            self.log.debug(
+                                f"[{room.room_id}] Invite state detected. Breaking out of the loop"
+                            )
+                            break
+                except MLimitExceeded as e:
+                    self.log.error(
+                        f"[{room.room_id}] MLimitExceeded exception has occurred in the pipeline [{node.id}]: {e}\n"
+                        f"please check your flow configuration to prevent this."
+                    )
+                    break
+                except Exception as e:
+                    self.log.exception(
+                        f"[{room.room_id}] Exception has occurred in the algorithm: \n{e}"
+                    )
+                    room.route.state = RouteState.ERROR
+                    break
+        finally:
+            await room.flush_route_writes()
 
         attempts_exceeded = room.reentry_node_attempts > self.MAX_NODE_ATTEMPTS
         if (
@@ -637,12 +696,62 @@ class MatrixHandler(MatrixClient):
             self.log.info(f"[{room.room_id}] {msg}. Updating to start")
             await room.update_menu(node_id="start")
 
+        # The messages left in the queue are dropped with it
         self.QUEUE_MESSAGE.pop(room.room_id, None)
+        self.message_store.discard(room_id=room.room_id)
         self.unlock_room(room_id=room.room_id, evt=evt)
 
-    async def create_inactivity_tasks(self) -> None:
+    async def resume_delayed_flow(self, room_id: RoomID) -> None:
+        """Resume the flow of a room stopped in a delay node, called by the delay scheduler.
+
+        Parameters
+        ----------
+        room_id : RoomID
+            The room ID.
+        """
+        if room_id in self.LOCKED_ROOMS:
+            # The run that stopped in the delay node has not finished yet
+            self.delay_scheduler.schedule(room_id=room_id, wake_at=now_ms() + 1000)
+            return
+
+        room: Room = await Room.get_by_room_id(room_id=room_id, bot_mxid=self.mxid, create=False)
+        if not room or room.route.state != RouteState.DELAY:
+            return
+
+        self.log.debug(f"[{room_id}] Resuming the delayed flow in [{room.route.node_id}]")
+        room.room_events = RoomEvents.deserialize(room._events)
+        room.config = self.config
+        room.matrix_client = self
+        await self.algorithm(room=room)
+
+    def ack_messages(self, room: Room, evt: MessageEvent | list[MessageEvent] | None) -> None:
+        """Acknowledge the enqueued messages consumed by an input node,
+        so they are removed from the message store.
+
+        Parameters
+        ----------
+        room : Room
+            The room object.
+        evt : MessageEvent | list[MessageEvent] | None
+            The message or messages consumed by the node.
+        """
+        for message in evt if isinstance(evt, list) else [evt]:
+            if isinstance(message, MessageEvent):
+                self.message_store.ack(room_id=room.room_id, event_id=message.event_id)
+
+    async def create_inactivity_tasks(self, restore_queues: bool = False) -> None:
         """This function creates tasks for rooms that are in the input state
-        and in an inactive state after the last system reboot or flow save."""
+        and in an inactive state after the last system reboot or flow save.
+
+        Parameters
+        ----------
+        restore_queues : bool, optional
+            If True, the message queues of the recreated rooms are rebuilt from the
+            message store, and the stored messages of the other rooms are dropped.
+            It must only be used on startup, before the rooms receive new messages.
+        """
+
+        queued_messages = await self.message_store.load() if restore_queues else {}
 
         inactivity_rooms: list[DBRoom] = await DBRoom.get_node_var_by_state(
             state=RouteState.INPUT.value, variable_name="inactivity", menuflow_bot_mxid=self.mxid
@@ -662,6 +771,12 @@ class MatrixHandler(MatrixClient):
                 if room.matrix_client is None:
                     room.matrix_client = self
 
+                if messages := queued_messages.pop(room.room_id, None):
+                    self.log.info(f"[{room.room_id}] Restoring {len(messages)} enqueued messages")
+                    queue = self.QUEUE_MESSAGE.setdefault(room.room_id, asyncio.Queue())
+                    for message in messages:
+                        queue.put_nowait(message)
+
                 task = asyncio.create_task(
                     self.algorithm(
                         room=room,
@@ -678,6 +793,9 @@ class MatrixHandler(MatrixClient):
                     lambda _task, _room=room: self._on_inactivity_done(_task, _room)
                 )  # _task is required because add_done_callback always passes the completed task as the first argument.
 
+        for room_id in queued_messages:
+            self.message_store.discard(room_id=room_id)
+
         if recreate_rooms:
             self.log.info(
                 f"[{len(recreate_rooms)} rooms] inactivity_option tasks that were in progress "
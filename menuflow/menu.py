@@ -5,7 +5,7 @@ import logging
 from collections import defaultdict
 from typing import TYPE_CHECKING, Any, AsyncGenerator, Awaitable, Callable, Optional, cast
 
-from aiohttp import ClientSession, TraceConfig
+from aiohttp import ClientSession
 from mautrix.client import Client, InternalEventType
 from mautrix.errors import MatrixInvalidToken
 from mautrix.types import (
@@ -25,7 +25,6 @@ from mautrix.util.logging import TraceLogger
 
 from .db import Client as DBClient
 from .flow import Flow
-from .http_middlewares import end_auth_middleware, start_auth_middleware
 from .matrix import MatrixHandler
 
 if TYPE_CHECKING:
@@ -97,18 +96,17 @@ class MenuClient(DBClient):
         self._postinited = True
         self.cache[self.id] = self
         self.log = self.log.getChild(self.id)
-        trace_config = TraceConfig()
-        trace_config.on_request_start.append(start_auth_middleware)
-        trace_config.on_request_end.append(end_auth_middleware)
-        self.http_client = ClientSession(loop=self.menuflow.loop, trace_configs=[trace_config])
+        self.http_client = ClientSession(loop=self.menuflow.loop)
         self.started = False
         self.sync_ok = True
         self.flow_cls = Flow()
-        await self.flow_cls.load_flow(flow_mxid=self.id, config=self.menuflow.config)
+        await self.flow_cls.load_flow(flow_mxid=self.id, config=self.menuflow.config, reload=False)
         self.matrix_handler: MatrixHandler = self._make_client()
         asyncio.create_task(self.matrix_handler.load_all_room_constants())
         if self.menuflow.config["menuflow.inactivity_options.recreate_on_startup"]:
-            await self.matrix_handler.create_inactivity_tasks()
+            await self.matrix_handler.create_inactivity_tasks(restore_queues=True)
+        else:
+            await self.matrix_handler.message_store.clear()
         # if self.enable_crypto:
         #     self._prepare_crypto()
         # else:
@@ -125,11 +123,13 @@ class MenuClient(DBClient):
         )
 
         self.matrix_handler.add_event_handler(
-            EventType.ROOM_MESSAGE, self.matrix_handler.handle_message
+            EventType.ROOM_MESSAGE,
+            self.matrix_handler.room_dispatcher.ordered(self.matrix_handler.handle_message),
         )
 
         self.matrix_handler.add_event_handler(
-            EventType.ROOM_MEMBER, self.matrix_handler.handle_member
+            EventType.ROOM_MEMBER,
+            self.matrix_handler.room_dispatcher.ordered(self.matrix_handler.handle_member),
         )
 
     def _set_sync_ok(self, ok: bool) -> Callable[[dict[str, Any]], Awaitable[None]]:
@@ -197,6 +197,9 @@ class MenuClient(DBClient):
         # if self.crypto:
         #     await self._start_crypto()
         self.start_sync()
+        # The delayed flows are resumed while the client is started
+        await self.matrix_handler.delay_scheduler.load()
+        self.matrix_handler.delay_scheduler.start()
         self.started = True
         self.log.info("Client started")
         self.matrix_handler.config = self.menuflow.config
@@ -211,6 +214,8 @@ class MenuClient(DBClient):
         if self.started:
             self.started = False
             self.stop_sync()
+            self.matrix_handler.delay_scheduler.stop()
+            await self.matrix_handler.message_store.flush()
 
     async def clear_cache(self) -> None:
         self.stop_sync()
@@ -237,6 +242,8 @@ class MenuClient(DBClient):
             del self.cache[self.id]
         except KeyError:
             pass
+        if getattr(self, "flow_cls", None):
+            self.flow_cls.release()
         await super().delete()
 
     async def leave_rooms(self) -> None:
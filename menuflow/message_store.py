@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+from logging import getLogger
+
+from mautrix.types import EventID, MessageEvent, RoomID, UserID
+from mautrix.util import background_task
+from mautrix.util.logging import TraceLogger
+
+from .db.message_queue import MessageQueue as DBMessageQueue
+
+log: TraceLogger = getLogger("menuflow.message_store")
+
+
+class MessageStore:
+    """Durable copy of the room message queues of a bot.
+
+    The messages enqueued while an input node waits for them are written to the
+    `message_queue` table, and deleted when the input node consumes them or the flow stops
+    waiting for them. The writes are buffered and flushed in batches every `flush_interval`
+    seconds, so the message handlers never wait for the database.
+    A message consumed before its batch is flushed is never written.
+    """
+
+    def __init__(
+        self, bot_mxid: UserID, enabled: bool = True, flush_interval: float = 0.5
+    ) -> None:
+        self.bot_mxid = bot_mxid
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.log = log.getChild(bot_mxid) if bot_mxid else log
+
+        # Event IDs of the stored (or pending to be stored) messages of each room
+        self.stored: dict[RoomID, set[EventID]] = {}
+        self.pending_inserts: dict[tuple[RoomID, EventID], DBMessageQueue] = {}
+        self.pending_deletes: set[tuple[RoomID, EventID]] = set()
+        self.pending_room_deletes: set[RoomID] = set()
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    def append(self, room_id: RoomID, message: MessageEvent) -> None:
+        """Store a message that was enqueued in the room queue."""
+        if not self.enabled:
+            return
+
+        self.stored.setdefault(room_id, set()).add(message.event_id)
+        self.pending_inserts[(room_id, message.event_id)] = DBMessageQueue(
+            room_id=room_id,
+            bot_mxid=self.bot_mxid,
+            event_id=message.event_id,
+            event=message.serialize(),
+        )
+        self._schedule_flush()
+
+    def ack(self, room_id: RoomID, event_id: EventID) -> None:
+        """Delete a stored message once it has been consumed by an input node."""
+        event_ids = self.stored.get(room_id)
+        if not event_ids or event_id not in event_ids:
+            return
+
+        event_ids.discard(event_id)
+        if not event_ids:
+            del self.stored[room_id]
+
+        if self.pending_inserts.pop((room_id, event_id), None) is None:
+            self.pending_deletes.add((room_id, event_id))
+            self._schedule_flush()
+
+    def discard(self, room_id: RoomID) -> None:
+        """Delete every stored message of the room, used when its queue is dropped."""
+        if self.stored.pop(room_id, None) is None:
+            return
+
+        for key in [key for key in self.pending_inserts if key[0] == room_id]:
+            del self.pending_inserts[key]
+        self.pending_deletes = {key for key in self.pending_deletes if key[0] != room_id}
+        self.pending_room_deletes.add(room_id)
+        self._schedule_flush()
+
+    async def load(self) -> dict[RoomID, list[MessageEvent]]:
+        """Get the stored messages of the bot grouped by room, in the order they were enqueued."""
+        if not self.enabled:
+            return {}
+
+        messages: dict[RoomID, list[MessageEvent]] = {}
+        for row in await DBMessageQueue.get_by_bot_mxid(bot_mxid=self.bot_mxid):
+            try:
+                message = MessageEvent.deserialize(row.event)
+            except Exception as e:
+                self.log.warning(f"[{row.room_id}] Invalid stored message ({row.event_id}): {e}")
+                self.pending_deletes.add((row.room_id, row.event_id))
+                continue
+
+            self.stored.setdefault(row.room_id, set()).add(row.event_id)
+            messages.setdefault(row.room_id, []).append(message)
+
+        self._schedule_flush()
+        return messages
+
+    async def clear(self) -> None:
+        """Delete every stored message of the bot."""
+        self.stored.clear()
+        self.pending_inserts.clear()
+        self.pending_deletes.clear()
+        self.pending_room_deletes.clear()
+        async with self._flush_lock:
+            await DBMessageQueue.delete_by_bot_mxid(bot_mxid=self.bot_mxid)
+
+    async def flush(self) -> None:
+        """Write the pending changes to the database."""
+        async with self._flush_lock:
+            room_deletes, self.pending_room_deletes = self.pending_room_deletes, set()
+            deletes, self.pending_deletes = self.pending_deletes, set()
+            inserts, self.pending_inserts = self.pending_inserts, {}
+
+            if not (room_deletes or deletes or inserts):
+                return
+
+            # The room deletes go first, a message enqueued after its room queue was dropped
+            # is in the inserts of the same batch.
+            try:
+                if room_deletes:
+                    await DBMessageQueue.delete_by_rooms(
+                        bot_mxid=self.bot_mxid, room_ids=list(room_deletes)
+                    )
+                if deletes:
+                    await DBMessageQueue.delete_many(bot_mxid=self.bot_mxid, events=list(deletes))
+                if inserts:
+                    await DBMessageQueue.insert_many(messages=list(inserts.values()))
+            except Exception as e:
+                self.log.error(f"Error storing the message queues, retrying: {e}")
+                # Retry on the next flush, skipping the messages consumed or dropped meanwhile
+                for key, message in inserts.items():
+                    if key in self.pending_deletes:
+                        self.pending_deletes.discard(key)
+                    elif key[0] not in self.pending_room_deletes:
+                        self.pending_inserts.setdefault(key, message)
+                self.pending_room_deletes |= room_deletes
+                self.pending_deletes |= deletes
+                self._schedule_flush()
+                return
+
+            self.log.debug(
+                f"Message queues stored: {len(inserts)} inserted, {len(deletes)} deleted, "
+                f"{len(room_deletes)} rooms dropped"
+            )
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = background_task.create(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        # The changes made while flushing schedule a new flush
+        self._flush_task = None
+        await self.flush()
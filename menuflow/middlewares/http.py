@@ -1,4 +1,4 @@
-from typing import Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from aiohttp import ClientTimeout, ContentTypeError
 from mautrix.util.config import RecursiveDict
@@ -7,6 +7,7 @@ from ruamel.yaml.comments import CommentedMap
 from ..nodes import Base
 from ..repository import HTTPMiddleware as HTTPMiddlewareModel
 from ..room import Room
+from ..utils.circuit_breaker import CircuitBreakers, CircuitOpenError
 
 
 class HTTPMiddleware(Base):
@@ -50,6 +51,11 @@ class HTTPMiddleware(Base):
     def middleware_variables(self) -> Dict:
         return self.render_data(self.auth.get("variables", {}))
 
+    @property
+    def token_variable(self) -> Optional[str]:
+        """The middleware variable that has the token, the first one."""
+        return next(iter(self.auth.get("variables") or {}), None)
+
     @property
     def method(self) -> Dict:
         return self.render_data(self.auth.get("method", ""))
@@ -78,17 +84,13 @@ class HTTPMiddleware(Base):
     def basic_auth(self) -> Dict:
         return self.render_data(self.auth.get("basic_auth", {}))
 
-    async def auth_request(self) -> Tuple[int, str]:
-        """Make the auth request to refresh api token
-
-        Parameters
-        ----------
-        session : ClientSession
-            ClientSession
+    async def request_token(self) -> Optional[Tuple[int, Dict, Any]]:
+        """Make the auth request and extract the middleware variables from the response
 
         Returns
         -------
-            The status code and the response text.
+            The status code, the middleware variables and the response data,
+            or None if the request failed.
 
         """
 
@@ -108,9 +110,15 @@ class HTTPMiddleware(Base):
 
         try:
             timeout = ClientTimeout(total=self.config["menuflow.timeouts.middlewares"])
-            response = await self.session.request(
-                self.method, self.token_url, timeout=timeout, **request_body
+            response = await CircuitBreakers.call(
+                self.token_url,
+                lambda: self.session.request(
+                    self.method, self.token_url, timeout=timeout, **request_body
+                ),
             )
+        except CircuitOpenError as e:
+            self.log.warning(f"{e}, auth request of middleware {self.id} not sent")
+            return
         except Exception as e:
             self.log.exception(f"Error in middleware: {e}")
             return
@@ -151,7 +159,23 @@ class HTTPMiddleware(Base):
 
                     break
 
+        return response.status, variables, response_data
+
+    async def auth_request(self) -> Optional[Tuple[int, Dict]]:
+        """Make the auth request to refresh api token, the middleware variables
+        are set in the room
+
+        Returns
+        -------
+            The status code and the middleware variables.
+
+        """
+        result = await self.request_token()
+        if not result:
+            return
+
+        status, variables, _ = result
         if variables:
             await self.room.set_variables(variables=variables)
 
-        return response.status, await response.text()
+        return status, variables
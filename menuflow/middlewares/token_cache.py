@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+from collections import defaultdict
+from itertools import count
+from logging import getLogger
+from time import time
+from typing import TYPE_CHECKING, Any, Optional
+
+from mautrix.util.logging import TraceLogger
+
+if TYPE_CHECKING:
+    from .http import HTTPMiddleware
+
+log: TraceLogger = getLogger("menuflow.token_cache")
+
+
+class CachedToken:
+    __slots__ = ("variables", "token", "refresh_at", "generation")
+
+    def __init__(
+        self, variables: dict, token: str, refresh_at: Optional[float], generation: int
+    ) -> None:
+        # All the middleware variables of the auth response, they are set in the rooms
+        self.variables = variables
+        self.token = token
+        # Epoch time when the token is refreshed, None if its expiration is unknown
+        self.refresh_at = refresh_at
+        # Number of the token, the requests that get a 401 invalidate only the token they used
+        self.generation = generation
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.refresh_at is None or time() < self.refresh_at
+
+
+def token_expiration(token: str, response_data: Any) -> Optional[float]:
+    """Get the expiration time of a token, from its `exp` claim if it is a JWT
+    or from the `expires_in` field of the auth response."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        pass
+
+    if isinstance(response_data, dict) and response_data.get("expires_in"):
+        try:
+            return time() + float(response_data["expires_in"])
+        except (TypeError, ValueError):
+            pass
+
+    return None
+
+
+class TokenCache:
+    """The tokens of the JWT middlewares, shared by all the rooms.
+
+    A token is requested once per middleware and rendered credentials, and it is requested
+    again shortly before it expires. The concurrent refreshes of the same token are done by
+    a single auth request. A 401 invalidates the token used by the request, so a burst of
+    401s with the same token refreshes it once.
+    """
+
+    # Seconds before the expiration of the tokens when they are refreshed
+    refresh_margin: float = 30
+    tokens: dict[str, CachedToken] = {}
+    locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+    _generations = count(1)
+
+    @staticmethod
+    def key(middleware: HTTPMiddleware) -> str:
+        """Key of the token of a middleware, its ID and its rendered credentials."""
+        credentials = json.dumps(
+            [middleware.token_url, middleware.auth], sort_keys=True, default=str
+        )
+        return f"{middleware.id}:{hashlib.sha256(credentials.encode()).hexdigest()}"
+
+    @classmethod
+    async def get_token(cls, middleware: HTTPMiddleware) -> Optional[CachedToken]:
+        """Get the token of a middleware, it is requested if there is no fresh one."""
+        key = cls.key(middleware)
+        token = cls.tokens.get(key)
+        if token and token.is_fresh:
+            return token
+
+        async with cls.locks[key]:
+            # Another room may have refreshed it while this one was waiting
+            token = cls.tokens.get(key)
+            if token and token.is_fresh:
+                return token
+            return await cls._refresh(key, middleware)
+
+    @classmethod
+    async def invalidate(cls, middleware: HTTPMiddleware, generation: Optional[int]) -> None:
+        """Refresh the token of a middleware after a 401, if it wasn't refreshed yet."""
+        key = cls.key(middleware)
+        async with cls.locks[key]:
+            token = cls.tokens.get(key)
+            if token and generation is not None and token.generation != generation:
+                log.debug(f"The token of {middleware.id} was already refreshed")
+                return
+            await cls._refresh(key, middleware)
+
+    @classmethod
+    async def _refresh(cls, key: str, middleware: HTTPMiddleware) -> Optional[CachedToken]:
+        cls.tokens.pop(key, None)
+        result = await middleware.request_token()
+        if not result:
+            return None
+
+        status, variables, response_data = result
+        token_variable = middleware.token_variable
+        token_str = variables.get(token_variable) if token_variable else None
+        if not token_str:
+            log.warning(f"The auth request of {middleware.id} didn't return a token ({status})")
+            return None
+
+        refresh_at = None
+        if expires_at := token_expiration(token_str, response_data):
+            # The short-lived tokens are refreshed in the second half of their life
+            now = time()
+            refresh_at = expires_at - min(cls.refresh_margin, max(expires_at - now, 0) / 2)
+
+        token = CachedToken(
+            variables=variables,
+            token=token_str,
+            refresh_at=refresh_at,
+            generation=next(cls._generations),
+        )
+        cls.tokens[key] = token
+        log.info(f"New token for middleware {middleware.id} (generation {token.generation})")
+        return token
@@ -66,11 +66,43 @@ class Base:
     session: ClientSession
 
     content: dict
+    # Parts of the content compiled once, shared by the nodes created from the same node data
+    _compiled: dict | None = None
 
     def __init__(self, room: Room, default_variables: dict) -> None:
         self.room = room
         self.default_variables = default_variables
 
+    @classmethod
+    def compile_content(cls, content: dict) -> dict:
+        """Compile the static parts of the content of a node.
+
+        It is called once per node when the flow is loaded, the node types that have
+        something to precompile override it.
+
+        Parameters
+        ----------
+        content : dict
+            The content of the node.
+
+        Returns
+        -------
+            A dictionary with the compiled parts of the content.
+        """
+        return {}
+
+    @property
+    def compiled(self) -> dict:
+        """The compiled parts of the content, compiled here if the node wasn't created
+        from a compiled flow."""
+        if self._compiled is None:
+            self._compiled = self.compile_content(self.content)
+        return self._compiled
+
+    @compiled.setter
+    def compiled(self, compiled: dict) -> None:
+        self._compiled = compiled
+
     @property
     def id(self) -> str:
         return self.content.get("id", "")
@@ -1,4 +1,7 @@
-from datetime import datetime
+from __future__ import annotations
+
+from datetime import datetime, tzinfo
+from functools import lru_cache
 from typing import Any, Dict, List
 
 import pytz
@@ -8,8 +11,123 @@ from ..events.event_generator import send_node_event
 from ..repository import CheckTime as CheckTimeModel
 from ..room import Room
 from ..utils import Nodes, Util
+from ..utils.flags import RenderFlags
 from .switch import Switch
 
+MINUTES_PER_DAY = 24 * 60
+SCHEDULE_FIELDS = ("timezone", "time_ranges", "days_of_week", "days_of_month", "months")
+
+
+def _range_mask(start: int, end: int) -> int:
+    """Bits from `start` to `end`, both inclusive."""
+    return ((1 << (end - start + 1)) - 1) << start if start <= end else 0
+
+
+class Schedule:
+    """The ranges of a check time node compiled into bitmaps.
+
+    The months and the days of the month are bitmaps of their numbers, the days of the week
+    and the time ranges are combined into a bitmap of the minutes of the week. The ranges
+    have a resolution of a minute: a time range includes its start minute and excludes its
+    end minute.
+    """
+
+    __slots__ = ("timezone", "months", "days_of_month", "minutes_of_week")
+
+    def __init__(
+        self, timezone: tzinfo, months: int, days_of_month: int, minutes_of_week: int
+    ) -> None:
+        self.timezone = timezone
+        self.months = months
+        self.days_of_month = days_of_month
+        self.minutes_of_week = minutes_of_week
+
+    @staticmethod
+    def _name_ranges(ranges: tuple[str, ...], names: dict[str, int], size: int) -> int:
+        if ranges[0] == "*":
+            return _range_mask(1, size)
+
+        mask = 0
+        for _range in ranges:
+            start, end = _range.split("-")
+            start, end = names.get(start), names.get(end)
+            # Unknown names never match, as in Util.is_within_range
+            if start and end:
+                mask |= _range_mask(start, end)
+        return mask
+
+    @classmethod
+    def compile(
+        cls,
+        timezone: str,
+        time_ranges: tuple[str, ...],
+        days_of_week: tuple[str, ...],
+        days_of_month: tuple[str, ...],
+        months: tuple[str, ...],
+    ) -> Schedule:
+        months_mask = cls._name_ranges(months, Util.MONTHS, 12)
+        week_days_mask = cls._name_ranges(days_of_week, Util.WEEK_DAYS, 7)
+
+        if days_of_month[0] == "*":
+            days_mask = _range_mask(1, 31)
+        else:
+            days_mask = 0
+            for days_range in days_of_month:
+                day_start, day_end = map(int, days_range.split("-"))
+                if day_start and day_end:
+                    days_mask |= _range_mask(day_start, day_end)
+
+        if time_ranges[0] == "*":
+            day_minutes = _range_mask(0, MINUTES_PER_DAY - 1)
+        else:
+            day_minutes = 0
+            for time_range in time_ranges:
+                time_start, time_end = time_range.split("-")
+                start = datetime.strptime(time_start, "%H:%M")
+                end = datetime.strptime(time_end, "%H:%M")
+                day_minutes |= _range_mask(
+                    start.hour * 60 + start.minute, end.hour * 60 + end.minute - 1
+                )
+
+        minutes_of_week = 0
+        for week_day in range(1, 8):
+            if week_days_mask >> week_day & 1:
+                minutes_of_week |= day_minutes << (week_day - 1) * MINUTES_PER_DAY
+
+        return cls(pytz.timezone(timezone), months_mask, days_mask, minutes_of_week)
+
+    def contains(self, now: datetime) -> bool:
+        minute_of_week = (now.isoweekday() - 1) * MINUTES_PER_DAY + now.hour * 60 + now.minute
+        return bool(
+            self.months >> now.month & 1
+            and self.days_of_month >> now.day & 1
+            and self.minutes_of_week >> minute_of_week & 1
+        )
+
+
+@lru_cache(maxsize=256)
+def _parse_schedule(*fields: Any) -> Schedule | None:
+    try:
+        return Schedule.compile(*fields)
+    except Exception:
+        # The node is evaluated field by field, so the error is raised as before
+        return None
+
+
+def parse_schedule(fields: dict[str, Any]) -> Schedule | None:
+    """Compile the rendered fields of a check time node, the results are cached.
+
+    Returns None if the fields are not valid.
+    """
+    try:
+        return _parse_schedule(
+            fields["timezone"],
+            *(tuple(fields[field]) for field in SCHEDULE_FIELDS[1:]),
+        )
+    except TypeError:
+        # The fields are not lists of strings
+        return None
+
 
 class CheckTime(Switch):
     def __init__(
@@ -39,7 +157,47 @@ class CheckTime(Switch):
     def timezone(self) -> str:
         return self.render_data(self.content.get("timezone", str))
 
+    @classmethod
+    def compile_content(cls, content: dict) -> dict:
+        compiled = super().compile_content(content)
+        fields = {field: content.get(field, []) for field in SCHEDULE_FIELDS}
+
+        # Templated schedules are rendered and parsed on each run
+        if not Util.has_jinja_delims(list(fields.values())):
+            flags = (
+                RenderFlags.CONVERT_TO_TYPE | RenderFlags.LITERAL_EVAL | RenderFlags.REMOVE_QUOTES
+            )
+            compiled["schedule"] = parse_schedule(
+                {
+                    field: Util.recursive_render(value, flags=flags) if value else value
+                    for field, value in fields.items()
+                }
+            )
+
+        return compiled
+
+    @property
+    def schedule(self) -> Schedule | None:
+        """The compiled schedule of the node, None if its fields are not valid."""
+        if "schedule" in self.compiled:
+            return self.compiled["schedule"]
+
+        return parse_schedule(
+            {
+                "timezone": self.timezone,
+                "time_ranges": self.time_ranges,
+                "days_of_week": self.days_of_week,
+                "days_of_month": self.days_of_month,
+                "months": self.months,
+            }
+        )
+
     async def validate_connection(self) -> None:
+        if schedule := self.schedule:
+            return await self.get_case_by_id(
+                "True" if schedule.contains(datetime.now(schedule.timezone)) else "False"
+            )
+
         time_zone = pytz.timezone(self.timezone)
         now = datetime.now(time_zone)
         week_day: str = now.strftime("%a").lower()
@@ -1,6 +1,7 @@
-from asyncio import sleep
 from typing import Dict
 
+from ..db.route import RouteState
+from ..delay_scheduler import now_ms
 from ..repository import Delay as DelayModel
 from ..room import Room
 from .base import Base
@@ -23,7 +24,21 @@ class Delay(Base):
         return self.render_data(data=o_connection)
 
     async def run(self):
+        """Move the route to the next node and stop the flow until the delay ends.
+
+        The wake up time is written in the route, the delay scheduler of the client resumes
+        the flow when it is reached, even after a restart.
+        """
         self.log.debug(f"[{self.room.room_id}] Entering delay node {self.id}")
-        await sleep(self.time)
+        delay = self.time
         o_connection = await self.o_connection
-        await self.room.update_menu(node_id=o_connection, state=None)
+
+        if delay <= 0:
+            await self.room.update_menu(node_id=o_connection, state=None)
+            return
+
+        self.room.route.wake_at = now_ms() + int(delay * 1000)
+        await self.room.update_menu(node_id=o_connection, state=RouteState.DELAY)
+        self.room.matrix_client.delay_scheduler.schedule(
+            room_id=self.room.room_id, wake_at=self.room.route.wake_at
+        )
@@ -1,4 +1,6 @@
-import asyncio
+from __future__ import annotations
+
+from functools import partial
 from typing import Dict, List
 
 from ..email_client import Email as EmailMessage
@@ -42,6 +44,25 @@ class Email(Message):
     def encode_type(self) -> str:
         return self.render_data(self.content.get("encode_type", ""))
 
+    async def report_delivery(
+        self, room: Room, recipients: List[str], sent: bool, attempts: int, error: str | None
+    ):
+        """Send the result of the delivery of an email of the node as a node event"""
+        await send_node_event(
+            config=room.config,
+            send_event=self.content.get("send_event"),
+            event_type=MenuflowNodeEvents.EmailDelivery,
+            room_id=room.room_id,
+            sender=room.matrix_client.mxid,
+            node_id=self.id,
+            server_id=self.email_client.server_id,
+            recipients=recipients,
+            sent=sent,
+            attempts=attempts,
+            error=error,
+            conversation_uuid=room.conversation_uuid,
+        )
+
     async def run(self):
         if not self.email_client:
             self.email_client = EmailClient.get_by_server_id(self.server_id)
@@ -56,9 +77,11 @@ class Email(Message):
             attachments=self.attachments,
             format=self.format,
             encode_type=self.encode_type,
+            on_delivery=partial(self.report_delivery, self.room, _recipients),
         )
 
-        asyncio.create_task(self.email_client.send_email(email=email))
+        # The email is sent in the background, the flow does not wait for the SMTP server
+        await self.email_client.send_email(email=email)
 
         o_connection = await self.get_o_connection()
         await self._update_node(o_connection)
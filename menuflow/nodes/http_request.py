@@ -1,8 +1,11 @@
 import asyncio
+import copy
 import json
+import re
+from http.cookies import SimpleCookie
 from typing import TYPE_CHECKING
 
-from aiohttp import BasicAuth, ClientTimeout, ContentTypeError
+from aiohttp import BasicAuth, ClientResponse, ClientTimeout
 
 from ..db.route import RouteState
 from ..events import MenuflowNodeEvents
@@ -10,13 +13,43 @@ from ..events.event_generator import send_node_event
 from ..repository import HTTPRequest as HTTPRequestModel
 from ..room import Room
 from ..utils import Nodes, Util
+from ..utils.circuit_breaker import CircuitBreakers, CircuitOpenError
 from ..utils.flags import RenderFlags
+from ..utils.request_coalescer import CoalesceOptions, RequestCoalescer
+from ..utils.response_cache import CacheOptions, ResponseCache
 from ..utils.types import Scopes
 from .switch import Switch
 
 if TYPE_CHECKING:
     from ..middlewares import HTTPMiddleware
 
+# Methods whose failed requests can be sent again
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# The same content types that aiohttp parses as JSON
+JSON_CONTENT_TYPE = re.compile(r"^application/(?:[\w.+-]+?\+)?json")
+DEFAULT_MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+class ResponseTooLargeError(Exception):
+    """The body of the response is bigger than the max body size of the node."""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__(f"The response body is bigger than {max_size} bytes")
+        self.max_size = max_size
+
+
+class FetchedResponse:
+    """A response read completely, detached from its connection."""
+
+    __slots__ = ("status", "text", "data", "cookies")
+
+    def __init__(self, status: int, text: str, data: dict | list | str, cookies: SimpleCookie):
+        self.status = status
+        self.text = text
+        # The JSON of the response, or its text if it is not JSON
+        self.data = data
+        self.cookies = cookies
+
 
 class HTTPRequest(Switch):
     HTTP_ATTEMPTS: dict = {}
@@ -32,6 +65,29 @@ class HTTPRequest(Switch):
         self.log = self.log.getChild(http_request_node_data.get("id"))
         self.content: dict = http_request_node_data
 
+    @classmethod
+    def compile_content(cls, content: dict) -> dict:
+        compiled = super().compile_content(content)
+        compiled["cache"] = CacheOptions.from_content(content.get("cache"))
+        compiled["coalesce"] = CoalesceOptions.from_content(content.get("coalesce"))
+        return compiled
+
+    @property
+    def cache_options(self) -> CacheOptions | None:
+        return self.compiled.get("cache")
+
+    @property
+    def coalesce_options(self) -> CoalesceOptions | None:
+        return self.compiled.get("coalesce")
+
+    @property
+    def max_body_size(self) -> int:
+        return int(
+            self.content.get("max_body_size")
+            or self.config["menuflow.http_client.max_body_size"]
+            or DEFAULT_MAX_BODY_SIZE
+        )
+
     @property
     def method(self) -> str:
         return self.content.get("method", "")
@@ -125,17 +181,68 @@ class HTTPRequest(Switch):
             request_params_ctx = {}
 
         _url = self.url
+        cache_key = None
+        cache_options = self.cache_options
+        if cache_options and self.middleware and not cache_options.vary_by:
+            # The token of the middleware is added to the request later, it is not in the key
+            self.log.debug(
+                f"[{_room_id}] node: {self.id} not cached, it has a middleware and no vary_by"
+            )
+            cache_options = None
+
+        if cache_options:
+            vary_by = [self.render_data(template) for template in cache_options.vary_by]
+            cache_key = ResponseCache.make_key(self.method, _url, request_body, vary_by)
+            if cached := ResponseCache.get(self.id, cache_key):
+                self.log.debug(f"[{_room_id}] node: {self.id} using the cached response")
+                return await self.apply_response(
+                    cached.status, cached.text, copy.deepcopy(cached.variables)
+                )
+
         try:
             exception, status = None, 500
             timeout_config = self.config["menuflow.timeouts.http_request"]
-            timeout = ClientTimeout(total=timeout_config)
-            response = await self.session.request(
-                self.method,
-                _url,
-                **request_body,
-                trace_request_ctx=request_params_ctx,
-                timeout=timeout,
-            )
+            retry = self.method.upper() in IDEMPOTENT_METHODS
+
+            def send():
+                # The body size and the JSON decoding depend on the node, not on the host
+                return CircuitBreakers.call(
+                    _url,
+                    lambda: self.fetch(_url, request_body, request_params_ctx),
+                    retry=retry,
+                    exclude=(ResponseTooLargeError, json.JSONDecodeError),
+                )
+
+            coalesce_options = self.coalesce_options
+            if coalesce_options and (
+                # The shared response would give the cookies of one room to the others
+                self.cookies
+                # The token of the middleware is not in the default key
+                or (self.middleware and not coalesce_options.key)
+            ):
+                coalesce_options = None
+
+            if coalesce_options:
+                coalesce_key = (
+                    self.id
+                    + ":"
+                    + (
+                        self.render_data(coalesce_options.key)
+                        if coalesce_options.key
+                        else ResponseCache.make_key(self.method, _url, request_body, [])
+                    )
+                )
+                response = await RequestCoalescer.run(
+                    coalesce_key, send, max_bytes=coalesce_options.max_response_bytes
+                )
+            else:
+                response = await send()
+        except ResponseTooLargeError as e:
+            exception, status = e, 413
+            self.log.warning(f"[{_room_id}] {e} [url: {_url}]")
+        except CircuitOpenError as e:
+            exception, status = e, 503
+            self.log.warning(f"[{_room_id}] {e}, request not sent [url: {_url}]")
         except asyncio.TimeoutError:
             exception, status = "TimeoutError", 408
             self.log.warning(
@@ -156,7 +263,7 @@ class HTTPRequest(Switch):
         )
 
         if response.status >= 400:
-            self.log.debug(f"[{_room_id}] Response: {await response.text()}")
+            self.log.debug(f"[{_room_id}] Response: {response.text}")
 
         if response.status == 401:
             o_connection = None
@@ -175,49 +282,105 @@ class HTTPRequest(Switch):
                 )
             return response.status, None, o_connection
 
-        variables = {}
-        o_connection = None
+        variables = self.extract_variables(response.data)
 
+        if cache_key and 200 <= response.status < 300:
+            ResponseCache.put(
+                self.id, cache_key, cache_options, response.status, response.text, variables
+            )
+
+        # The cookies are the upstream session of this room, they are never cached
         if cookies := self.cookies:
-            for cookie in cookies:
-                variables[cookie] = response.cookies.output(cookie)
+            variables = {
+                **{cookie: response.cookies.output(cookie) for cookie in cookies},
+                **variables,
+            }
 
-        try:
-            response_data: dict = await response.json()
-            if response_data and isinstance(response_data, dict):
-                response_data.update({"status": response.status})
-        except ContentTypeError:
-            response_data = await response.text()
+        return await self.apply_response(response.status, response.text, variables)
+
+    async def fetch(
+        self, url: str, request_body: dict, request_params_ctx: dict
+    ) -> FetchedResponse:
+        """Send the request and read the response.
+
+        The response is read completely, so it can be shared by the rooms whose requests
+        were coalesced.
+        """
+        timeout = ClientTimeout(total=self.config["menuflow.timeouts.http_request"])
+        async with self.session.request(
+            self.method,
+            url,
+            **request_body,
+            trace_request_ctx=request_params_ctx,
+            timeout=timeout,
+        ) as response:
+            body = await self.read_body(response)
+            text = body.decode(response.charset or "utf-8", errors="replace")
+            response_data = text
+            if JSON_CONTENT_TYPE.match(response.content_type or ""):
+                response_data = json.loads(text) if text.strip() else None
+                if response_data and isinstance(response_data, dict):
+                    response_data.update({"status": response.status})
+
+            return FetchedResponse(response.status, text, response_data, response.cookies)
+
+    async def read_body(self, response: ClientResponse) -> bytes:
+        """Read the body of a response once, up to the max body size of the node.
+
+        Raises
+        ------
+        ResponseTooLargeError
+            If the body is bigger than the max body size.
+        """
+        max_size = self.max_body_size
+        if response.content_length and response.content_length > max_size:
+            raise ResponseTooLargeError(max_size)
+
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) > max_size:
+                raise ResponseTooLargeError(max_size)
+
+        return bytes(body)
+
+    def extract_variables(self, response_data: dict | list | str) -> dict:
+        """Extract the variables of the node from the response data with jq."""
+        _room_id = self.room.room_id
+        variables = {}
 
         _http_variables = self.http_variables
-        if isinstance(response_data, (dict, list, str)) and _http_variables:
-            for variable in _http_variables:
-                if isinstance(response_data, str):
-                    try:
-                        variables[variable] = self.render_data(response_data)
-                    except KeyError:
-                        pass
-                    break
-                else:
-                    default_value = None
-                    jq_result: dict = Util.jq_compile(_http_variables[variable], response_data)
-                    if jq_result.get("status") != 200:
-                        self.log.error(
-                            f"[{_room_id}] Error parsing '{self.http_variables[variable]}' with jq "
-                            f"on variable '{variable}'. Set to default value ({default_value}). "
-                            f"Error message: {jq_result.get('error')}, Status: {jq_result.get('status')}"
-                        )
-                    data_match = jq_result.get("result")
-
-                    try:
-                        data_match = default_value if not data_match else data_match
-                        variables[variable] = (
-                            data_match if not data_match or len(data_match) > 1 else data_match[0]
-                        )
-                    except KeyError:
-                        pass
-
-        o_connection = await self.get_case_by_id(id=response.status)
+        if isinstance(response_data, str) and _http_variables:
+            try:
+                variables[next(iter(_http_variables))] = self.render_data(response_data)
+            except KeyError:
+                pass
+        elif isinstance(response_data, (dict, list)) and _http_variables:
+            # The response is passed to jq once for all the variables
+            jq_results = Util.jq_compile_many(_http_variables, response_data)
+            for variable, jq_result in jq_results.items():
+                default_value = None
+                if jq_result.get("status") != 200:
+                    self.log.error(
+                        f"[{_room_id}] Error parsing '{_http_variables[variable]}' with jq "
+                        f"on variable '{variable}'. Set to default value ({default_value}). "
+                        f"Error message: {jq_result.get('error')}, Status: {jq_result.get('status')}"
+                    )
+                data_match = jq_result.get("result")
+
+                try:
+                    data_match = default_value if not data_match else data_match
+                    variables[variable] = (
+                        data_match if not data_match or len(data_match) > 1 else data_match[0]
+                    )
+                except KeyError:
+                    pass
+
+        return variables
+
+    async def apply_response(self, status: int, text: str, variables: dict):
+        """Move the room to the case of the status and set the variables of the response."""
+        o_connection = await self.get_case_by_id(id=status)
         await self.room.update_menu(
             node_id=o_connection, state=RouteState.END if not self.cases else None
         )
@@ -225,7 +388,7 @@ class HTTPRequest(Switch):
         if variables:
             await self.room.set_variables(variables=variables)
 
-        return response.status, await response.text(), o_connection
+        return status, text, o_connection
 
     async def run_middleware(self, status: int):
         """This function check athentication attempts to avoid an infinite try_athentication cicle.
@@ -1,5 +1,4 @@
-from asyncio import Future, create_task, get_running_loop, sleep
-from datetime import datetime
+from asyncio import Future, TimeoutError, create_task, get_running_loop, shield, wait_for
 from typing import Dict
 
 import mautrix.errors.request
@@ -50,26 +49,21 @@ class InviteUser(Switch):
         create_task(self.check_agent_join(pending_invite))
 
     async def check_agent_join(self, pending_invite: Future):
-        # Check if the agent has joined the room.
-        loop = get_running_loop()
-        end_time = loop.time() + float(self.timeout)
-
-        while True:
-            self.log.debug(datetime.now())
-            if pending_invite.done():
-                # when a join event is received, the Future object is resolved
-                self.log.debug("FUTURE IS DONE")
-                case_id = "join" if pending_invite.result() else "reject"
-                break
-            elif (loop.time() + 1.0) >= end_time:
-                self.log.debug("TIMEOUT COMPLETED.")
+        # Wait until the agent joins or rejects the invitation, or the timeout is reached.
+        # The Future is resolved by the join/reject handlers, so there is no polling involved.
+        _timeout = float(self.timeout)
+        try:
+            # shield() keeps the Future alive on timeout, so it can be resolved below
+            joined = await wait_for(shield(pending_invite), timeout=_timeout)
+            self.log.debug(f"[{self.room.room_id}] Invite resolved (joined: {joined})")
+            case_id = "join" if joined else "reject"
+        except TimeoutError:
+            self.log.debug(f"[{self.room.room_id}] Invite timeout ({_timeout}s) completed")
+            if not pending_invite.done():
                 pending_invite.set_result(False)
-                # Remove user invitation from the room.
-                await self.room.matrix_client.kick_user(self.room.room_id, self.invitee)
-                case_id = "timeout"
-                break
-
-            await sleep(1)
+            # Remove user invitation from the room.
+            await self.room.matrix_client.kick_user(self.room.room_id, self.invitee)
+            case_id = "timeout"
 
         if self.room.room_id in self.room.pending_invites:
             del self.room.pending_invites[self.room.room_id]
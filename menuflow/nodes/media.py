@@ -1,14 +1,12 @@
 from __future__ import annotations
 
-import base64
-from io import BytesIO
 from typing import TYPE_CHECKING, Dict
 
 from markdown import markdown
-from mautrix.api import MediaPath, Method
 from mautrix.errors import MUnknown
 from mautrix.types import (
     AudioInfo,
+    ContentURI,
     FileInfo,
     Format,
     ImageInfo,
@@ -17,15 +15,16 @@ from mautrix.types import (
     MessageType,
     VideoInfo,
 )
-from mautrix.util import magic
 from mautrix.util.magic import mimetype
 
+from ..db.media_cache import MediaCache as DBMediaCache
 from ..db.route import RouteState
 from ..events import MenuflowNodeEvents
 from ..events.event_generator import send_node_event
 from ..repository import Media as MediaModel
 from ..room import Room
 from ..utils import Nodes
+from ..utils.media_stream import MediaTooLargeError, SpooledMedia
 from ..utils.types import Scopes
 from .message import Message
 
@@ -38,10 +37,12 @@ except ImportError:
 if TYPE_CHECKING:
     from ..middlewares import HTTPMiddleware
 
+DEFAULT_MAX_MEDIA_SIZE = 100 * 1024 * 1024
+# Bytes of a media kept in memory, the bigger media are written to a temporary file
+DEFAULT_MAX_MEMORY = 1024 * 1024
 
-class Media(Message):
-    media_cache: Dict[str, MediaMessageEventContent] = {}
 
+class Media(Message):
     middleware: "HTTPMiddleware" = None
 
     def __init__(self, media_node_data: MediaModel, room: Room, default_variables: Dict) -> None:
@@ -81,69 +82,92 @@ class Media(Message):
             }
         )
 
-    async def get_content_uri(self, data: bytes) -> str:
+    @property
+    def media_cache_options(self) -> dict:
+        return self.config["menuflow.media_cache"] or {}
+
+    @property
+    def media_options(self) -> dict:
+        return self.config["menuflow.media"] or {}
+
+    async def upload(self, media: SpooledMedia, mime_type: str | None) -> ContentURI:
         """
         Upload the media to synapse and get the mxc from synapse
         Parameters
         ----------
-        data: bytes
-            The data containing the ids of the media that whatsapp cloud api returns
+        media: SpooledMedia
+            The downloaded media, it is streamed to synapse
+        mime_type: str | None
+            The mimetype of the media
         Returns
         -------
             The mxc url of the media
         """
-        # Upload the message media to Matrix
-        path = MediaPath.v1.create
-        method = Method.POST
-        mime_type = None
-        headers = {}
-
-        if isinstance(data, bytes):
-            mime_type = magic.mimetype(data)
-
-        if mime_type:
-            headers["Content-Type"] = mime_type
-
-        response = await self.room.matrix_client.api.request(
-            method, path, content=data, headers=headers
+        return await self.room.matrix_client.upload_media(
+            media.iter_chunks(), mime_type=mime_type, size=media.size
         )
-        attachment = response.get("content_uri")
 
-        return attachment
+    def sniff_info(self, media: SpooledMedia, mime_type: str | None) -> dict:
+        """Get the mimetype, size and dimensions of a media, without reading all of it."""
+        info = {"mimetype": mime_type or mimetype(media.header), "size": media.size}
+        if info["mimetype"].startswith("image/") and Image is not None:
+            try:
+                # Opening an image only reads its header, the pixels are not decoded
+                media.file.seek(0)
+                with Image.open(media.file) as img:
+                    info["width"], info["height"] = img.size
+            except Exception as e:
+                self.log.warning(f"[{self.room.room_id}] Error reading the image size: {e}")
+        return info
+
+    def media_content(
+        self, media: DBMediaCache, media_info: MediaInfo
+    ) -> MediaMessageEventContent:
+        """Build the message of a media uploaded to the homeserver, the info of the node
+        is completed with the info of the media."""
+        for key in ("mimetype", "size", "width", "height"):
+            if hasattr(media_info, key) and not getattr(media_info, key) and media.info.get(key):
+                setattr(media_info, key, media.info[key])
 
-    async def get_media_url(self, data: bytes) -> tuple[str, str]:
-        """
-        Upload the media to synapse and get the mxc from synapse
-        Parameters
-        ----------
-        data: bytes
-            The data containing the ids of the media that whatsapp cloud api returns
-        Returns
-        -------
-            The mxc url of the media and the type of the media
-        """
-        headers = {}
-        if isinstance(data, bytes):
-            message_type = magic.mimetype(data)
-            headers["Content-Type"] = message_type
+        media_name = ""
+        if media_info.mimetype:
+            ext = media_info.mimetype.split("/")[-1]
+            media_name = f"Media.{ext}"
 
-        attachment = await self.get_content_uri(data)
-        server_name, media_matrix_id = self.room.matrix_client.api.parse_mxc_uri(attachment)
-        path = MediaPath.v3.upload[server_name][media_matrix_id]
-        method = Method.PUT
-        await self.room.matrix_client.api.request(method, path, content=data, headers=headers)
+        _text = self.text
 
-        return attachment, message_type
+        return MediaMessageEventContent(
+            msgtype=self.message_type,
+            body=_text,
+            format=Format.HTML,
+            formatted_body=markdown(text=_text, extensions=["nl2br"]),
+            filename=media_name,
+            url=media.mxc,
+            info=media_info,
+        )
 
     async def load_media(self) -> MediaMessageEventContent:
         """It downloads the media from the URL, uploads it to the Matrix server,
         and returns a MediaMessageEventContent object with the URL of the uploaded media
 
+        The uploaded media are cached by URL and by content hash, so a media is downloaded
+        again only when the URL must be revalidated and it is uploaded once.
+
         Returns
         -------
             MediaMessageEventContent
 
         """
+        media_info = self.info
+        if media_info is None:
+            return
+
+        _url = self.url
+        cached = await DBMediaCache.get_by_url(_url)
+        if cached and cached.is_fresh(self.media_cache_options.get("revalidate_after", 3600)):
+            await cached.touch()
+            return self.media_content(cached, media_info)
+
         if self.middleware:
             self.middleware.room = self.room
             request_params_ctx = self.context_params
@@ -151,96 +175,87 @@ class Media(Message):
         else:
             request_params_ctx = {}
 
-        _url = self.url
-        resp = await self.session.get(_url, trace_request_ctx=request_params_ctx)
+        headers = cached.conditional_headers if cached else {}
+        resp = await self.session.get(_url, headers=headers, trace_request_ctx=request_params_ctx)
         content_type = resp.headers.get("Content-Type", "").lower()
 
         self.log.debug(
             f"[{self.room.room_id}] node: {self.id} type: media url: {self.url} status: {resp.status} content_type: {content_type}"
         )
 
-        if content_type.startswith(
-            ("application/json", "application/text", "application/octet-stream")
-        ):
-            if content_type.startswith("application/octet-stream"):
-                base64_data = await resp.read()
-            else:
-                base64_data = await resp.text()
+        if resp.status == 304 and cached:
+            resp.release()
+            await cached.touch(validated=True)
+            return self.media_content(cached, media_info)
 
-            try:
-                data = base64.b64decode(base64_data)
-            except Exception as e:
-                self.log.exception(f"[{self.room.room_id}] error {e}")
-                return
-        else:
-            data = await resp.read()
-
-        media_info = self.info
-        if media_info is None:
+        if resp.status >= 400:
+            # The error responses are not uploaded, they would be cached as the media
+            self.log.error(f"[{self.room.room_id}] Error downloading the media of {_url}")
+            resp.release()
             return
 
-        if not media_info.mimetype:
-            media_info.mimetype = mimetype(data)
-
-        if (
-            media_info.mimetype.startswith("image/")
-            and not media_info.width
-            and not media_info.height
-        ):
-            with BytesIO(data) as inp, Image.open(inp) as img:
-                media_info.width, media_info.height = img.size
-
-        media_info.size = len(data)
-
+        base64_encoded = content_type.startswith(
+            ("application/json", "application/text", "application/octet-stream")
+        )
+        max_size = self.media_options.get("max_size", DEFAULT_MAX_MEDIA_SIZE)
         try:
-            mxc, media_type = await self.get_media_url(data)
-        except MUnknown as e:
-            self.log.exception(f"error {e}")
-            return
+            # The base64 content is bigger than the media, its size is checked once decoded
+            if not base64_encoded and resp.content_length and resp.content_length > max_size:
+                raise MediaTooLargeError(max_size)
+
+            spooled = await SpooledMedia.from_response(
+                resp,
+                base64_encoded=base64_encoded,
+                max_size=max_size,
+                max_memory=self.media_options.get("max_memory", DEFAULT_MAX_MEMORY),
+            )
         except Exception as e:
-            self.log.exception(f"Message not receive :: error {e}")
+            self.log.error(f"[{self.room.room_id}] Error downloading the media of {_url}: {e}")
             return
-
-        media_name = ""
-
-        if media_type:
-            ext = media_type.split("/")[-1]
-            media_name = f"Media.{ext}"
-
-        _text = self.text
-
-        return MediaMessageEventContent(
-            msgtype=self.message_type,
-            body=_text,
-            format=Format.HTML,
-            formatted_body=markdown(text=_text, extensions=["nl2br"]),
-            filename=media_name,
-            url=mxc,
-            info=media_info,
+        finally:
+            resp.release()
+
+        with spooled:
+            media = await DBMediaCache.get_by_content_hash(spooled.content_hash)
+            if media:
+                self.log.debug(f"[{self.room.room_id}] The media of {_url} was already uploaded")
+                info = media.info
+            else:
+                info = self.sniff_info(spooled, media_info.mimetype)
+                try:
+                    mxc = await self.upload(spooled, info["mimetype"])
+                except MUnknown as e:
+                    self.log.exception(f"error {e}")
+                    return
+                except Exception as e:
+                    self.log.exception(f"Message not receive :: error {e}")
+                    return
+
+        media = DBMediaCache(
+            url=_url,
+            content_hash=spooled.content_hash,
+            mxc=media.mxc if media else mxc,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            info=info,
         )
+        await media.upsert()
+        await DBMediaCache.evict(self.media_cache_options.get("max_entries", 10000))
+
+        return self.media_content(media, media_info)
 
     async def run(self):
         """It sends a message to the room with the media attached"""
         self.log.debug(f"[{self.room.room_id}] Entering media node {self.id}")
 
         o_connection = await self.get_o_connection()
-        try:
-            _url = self.url
-            media_message = self.media_cache[_url]
-
-            ext = media_message.body.split(".")[-1] if "." in media_message.body else ""
-            _text = self.text
-            if media_message.body != f"{_text}.{ext}":
-                media_message.body = f"{_text}.{ext}"
-        except KeyError:
-            media_message = await self.load_media()
-            if media_message is None:
-                await self.room.update_menu(
-                    node_id=o_connection,
-                    state=RouteState.END if not o_connection else None,
-                )
-                return
-            self.media_cache[_url] = media_message
+        media_message = await self.load_media()
+        if media_message is None:
+            await self.room.update_menu(
+                node_id=o_connection,
+                state=RouteState.END if not o_connection else None,
+            )
+            return
 
         await self.send_message(room_id=self.room.room_id, content=media_message)
 
@@ -9,6 +9,32 @@ from ..utils.types import Scopes
 from .base import Base, safe_data_convertion
 
 
+class SwitchCases:
+    """The cases of a switch node, indexed once when the flow is loaded."""
+
+    __slots__ = ("by_id", "validations")
+
+    def __init__(self, by_id: dict, validations: tuple[dict, ...]) -> None:
+        # Cases by their converted ID, with their o_connection and variables
+        self.by_id = by_id
+        # Cases validated one by one, in order
+        self.validations = validations
+
+    @classmethod
+    def compile(cls, cases: list[dict]) -> SwitchCases:
+        by_id = {}
+        for case in cases:
+            try:
+                by_id[safe_data_convertion(case.get("id"))] = {
+                    "o_connection": case.get("o_connection"),
+                    "variables": case.get("variables"),
+                }
+            except TypeError:
+                Switch.log.warning(f"The case ID {case.get('id')} is not valid, it is ignored")
+
+        return cls(by_id, tuple(cases))
+
+
 class Switch(Base):
 
     def __init__(self, switch_node_data: SwitchModel, room: Room, default_variables: dict) -> None:
@@ -46,28 +72,25 @@ class Switch(Base):
     def set_variables(self) -> dict:
         return self.render_data(self.content.get("set_variables", {}))
 
-    async def load_cases(self) -> dict[str, str]:
-        """It loads the cases into a dictionary.
+    @classmethod
+    def compile_content(cls, content: dict) -> dict:
+        compiled = super().compile_content(content)
+        compiled["cases"] = SwitchCases.compile(content.get("cases") or [])
+        return compiled
 
-        Parameters
-        ----------
-        room : Room
-            Room = None
+    @property
+    def case_index(self) -> SwitchCases:
+        return self.compiled["cases"]
+
+    async def load_cases(self) -> dict[str, str]:
+        """It gets the cases indexed by their ID.
 
         Returns
         -------
-            A dictionary of cases.
+            A dictionary of cases, it must not be modified.
 
         """
-
-        cases_dict = {}
-
-        for case in self.cases:
-            cases_dict[safe_data_convertion(case.get("id"))] = {
-                "o_connection": case.get("o_connection"),
-                "variables": case.get("variables"),
-            }
-        return cases_dict
+        return self.case_index.by_id
 
     async def _run(self) -> str:
         """It takes a dictionary of variables, runs the rule,
@@ -139,8 +162,7 @@ class Switch(Base):
         id = safe_data_convertion(id)
 
         try:
-            cases = await self.load_cases()
-            case_result: dict = cases[id]
+            case_result: dict = self.case_index.by_id[id]
 
             # Load variables defined in the case into the room
             await self.load_variables(case_result.get("variables", {}))
@@ -164,7 +186,7 @@ class Switch(Base):
 
     async def validate_cases(self) -> str:
         """Used to validate case by case and return the o_connection value
-        for the first valid case.
+        for the first valid case. The cases after it are not rendered.
 
         Returns
         -------
@@ -174,7 +196,7 @@ class Switch(Base):
         case_o_connection = None
         _room_id = self.room.room_id
 
-        for case in self.cases:
+        for case in self.case_index.validations:
             if not case.get("case") and case.get("id"):
                 self.log.warning(
                     f"[{_room_id}] You should use the 'validation' field to use case by ID in [{self.id}]"
@@ -199,6 +221,7 @@ class Switch(Base):
             self.log.debug(
                 f"[{_room_id}] The case [{case_o_connection}] has been obtained in the input node [{self.id}]"
             )
+            break
 
         if not case_o_connection:
             default_case, case_o_connection = await self.manage_case_exceptions()
@@ -249,11 +272,10 @@ class Switch(Base):
             default case dictionary (or "start" if the key is not present).
 
         """
-        cases = await self.load_cases()
         case_to_be_used = await self.manage_attempts()
 
         # Getting the default case
-        default_case = cases.get(case_to_be_used, {})
+        default_case = self.case_index.by_id.get(case_to_be_used, {})
 
         # Load variables defined in the case into the room
         await self.load_variables(default_case.get("variables", {}))
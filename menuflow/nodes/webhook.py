@@ -336,7 +336,9 @@ class Webhook(Input):
 
         return True
 
-    def validate_jq_data(self, data: dict, variable: dict, default_value: dict) -> dict:
+    def validate_jq_data(
+        self, data: dict, variable: dict, default_value: dict, jq_result: dict | None = None
+    ) -> dict:
         """
         This function validates the jq data for the webhook.
 
@@ -348,13 +350,16 @@ class Webhook(Input):
             The variable to validate.
         default_value : dict
             The default value to use if the validation fails.
+        jq_result : dict | None
+            The result of the jq filter of the variable, if it was already applied.
 
         Returns
         -------
         dict
             The validated jq data.
         """
-        jq_result: dict = Util.jq_compile(self.variables[variable], data)
+        if jq_result is None:
+            jq_result = Util.jq_compile(self.variables[variable], data)
         if jq_result.get("status") != 200:
             self.log.error(
                 f"Error parsing '{self.variables[variable]}' with jq "
@@ -377,6 +382,11 @@ class Webhook(Input):
         if not isinstance(data, (dict, list, str)) and not self.variables:
             return variables
 
+        # The data is passed to jq once for all the variables
+        jq_results = (
+            Util.jq_compile_many(self.variables, data) if isinstance(data, (dict, list)) else {}
+        )
+
         for variable in self.variables:
             if isinstance(data, str):
                 try:
@@ -391,6 +401,7 @@ class Webhook(Input):
                 data=data,
                 variable=variable,
                 default_value=None,
+                jq_result=jq_results.get(variable),
             )
 
             try:
@@ -14,6 +14,7 @@ from ..db import Flow as FlowDB
 from ..db import Module as DBModule
 from ..db import Tag as TagDB
 from ..utils import Util
+from ..utils.yaml_loader import load_yaml
 
 log: TraceLogger = logging.getLogger("menuflow.repository.flow")
 
@@ -36,20 +37,66 @@ class Flow(SerializableAttrs):
             tuple[dict, list[dict]]: The flow variables and nodes.
         """
         log.info(f"Loading flow {flow_mxid} from database")
+        tag_db = await cls.get_active_tag(flow_mxid)
+        return await cls.load_tag(tag_db)
+
+    @classmethod
+    async def get_active_tag(cls, flow_mxid: str) -> TagDB:
+        """
+        Get the active tag of the flow of a client.
+
+        Args:
+            flow_mxid (str): The mxid of the flow.
+
+        Returns:
+            TagDB: The active tag.
+        """
         flow_db = await FlowDB.get_by_mxid(flow_mxid)
         tag_db = await TagDB.get_active_tag(flow_db.id)
         if not tag_db:
             log.error(f"No active tag found for flow {flow_mxid}")
             raise ValueError(f"No active tag found for flow {flow_mxid}")
 
+        return tag_db
+
+    @classmethod
+    async def load_tag(cls, tag_db: TagDB) -> tuple[dict, list[dict], dict]:
+        """
+        Load the modules of a tag.
+
+        Args:
+            tag_db (TagDB): The tag to load.
+
+        Returns:
+            tuple[dict, list[dict], dict]: The flow variables, nodes and loaded metadata.
+        """
         modules = await DBModule.get_tag_modules(tag_db.id)
         list_nodes = [node for module in modules for node in module.get("nodes", [])]
-        loaded_metadata = {
-            "tag_info": {"name": tag_db.name, "id": tag_db.id},
-            "loaded_modules_ids": [module.id for module in modules],
-        }
+        loaded_metadata = cls.tag_metadata(tag_db, [module.id for module in modules])
         return tag_db.flow_vars, list_nodes, loaded_metadata
 
+    @staticmethod
+    def tag_metadata(tag_db: TagDB, modules_ids: list[int]) -> dict:
+        """
+        Build the loaded metadata of a tag.
+
+        Args:
+            tag_db (TagDB): The loaded tag.
+            modules_ids (list[int]): The ids of the loaded modules of the tag.
+
+        Returns:
+            dict: The loaded metadata.
+        """
+        return {
+            "tag_info": {"name": tag_db.name, "id": tag_db.id, "flow_id": tag_db.flow_id},
+            "loaded_modules_ids": modules_ids,
+        }
+
+    @staticmethod
+    def yaml_path(flow_mxid: str) -> Path:
+        """Get the path of the YAML file of a flow."""
+        return Path(f"/data/flows/{flow_mxid}.yaml")
+
     @classmethod
     def load_from_yaml(cls, flow_mxid: str) -> tuple[dict, list[dict]]:
         """
@@ -62,7 +109,7 @@ class Flow(SerializableAttrs):
             tuple[dict, list[dict]]: The flow variables and nodes.
         """
         log.info(f"Loading flow {flow_mxid} from YAML file")
-        path = Path(f"/data/flows/{flow_mxid}.yaml")
+        path = cls.yaml_path(flow_mxid)
         if not path.exists():
             log.warning(f"File {flow_mxid}.yaml not found")
             path.write_text(yaml.dump(Util.flow_example()))
@@ -72,7 +119,7 @@ class Flow(SerializableAttrs):
             )
 
         try:
-            flow: dict = yaml.safe_load(path.read_text())
+            flow: dict = load_yaml(path)
             flow_data = flow["menu"]
         except Exception as e:
             log.exception(f"Error loading flow {flow_mxid}.yaml: {e}")
@@ -3,12 +3,12 @@ from __future__ import annotations
 import logging
 from typing import Dict, List
 
-import yaml
 from attr import dataclass, ib
 from mautrix.types import SerializableAttrs
 from mautrix.util.logging import TraceLogger
 
 from ..utils import Middlewares
+from ..utils.yaml_loader import load_yaml
 from .middlewares import (
     ASRMiddleware,
     EmailServer,
@@ -31,9 +31,7 @@ class FlowUtils(SerializableAttrs):
     @classmethod
     def load_flow_utils(cls):
         try:
-            path = f"/data/flow_utils.yaml"
-            with open(path, "r") as file:
-                flow_utils: Dict = yaml.safe_load(file)
+            flow_utils: Dict = load_yaml("/data/flow_utils.yaml")
             return cls.from_dict(flow_utils)
         except FileNotFoundError:
             log.warning("File flow_utils.yaml not found")
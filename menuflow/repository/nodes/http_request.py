@@ -26,6 +26,26 @@ class HTTPRequest(Switch):
       variables:
         news: data
 
+      # Optional, the responses are cached by method, URL, params, headers, basic auth
+      # and body. The nodes with a middleware are only cached if they have vary_by,
+      # e.g. with the customer of the token, because the token is not in the key.
+      cache:
+        ttl: 300
+        vary_by:
+          - "{{ route.language }}"
+        max_entries: 100
+        max_bytes: 1048576
+
+      # Optional, the identical requests sent at the same time share one response. The
+      # requests are identical if they have the same method, URL, params, headers, basic
+      # auth and body, or the same rendered key. The nodes with cookies are not coalesced,
+      # neither the nodes with a middleware and without a key.
+      coalesce:
+        max_response_bytes: 1048576
+
+      # Optional, responses bigger than this go to the 413 case
+      max_body_size: 1048576
+
       cases:
         - id: 200
           o_connection: m1
@@ -44,4 +64,7 @@ class HTTPRequest(Switch):
     basic_auth: Dict[str, Any] = ib(factory=dict)
     data: Dict[str, Any] = ib(factory=dict)
     json: Dict[str, Any] = ib(factory=dict)
+    cache: Dict[str, Any] = ib(factory=dict)
+    coalesce: Any = ib(default=None)
+    max_body_size: int = ib(default=None)
     cases: List[Case] = ib(factory=list)
@@ -3,12 +3,12 @@ from __future__ import annotations
 from asyncio import Future, Lock
 from collections import defaultdict
 from logging import getLogger
-from re import Pattern, compile, match
+from re import Pattern, match
 from typing import TYPE_CHECKING, Any, cast
 
 from glom import Delete, PathAccessError, assign, glom
 from mautrix.errors.request import MNotFound
-from mautrix.types import EventType, Member, RoomID, StateEvent, StateEventContent, UserID
+from mautrix.types import EventType, Member, RoomID, StateEventContent, UserID
 from mautrix.types.util.obj import Obj
 from mautrix.util.async_getter_lock import async_getter_lock
 from mautrix.util.logging import TraceLogger
@@ -17,8 +17,10 @@ from .config import Config
 from .db.room import Room as DBRoom
 from .db.route import Route, RouteState
 from .repository.room_events import RoomEvents
+from .room_state_cache import RoomStateCache
 from .scope import Scope
 from .utils import JQ2Glom, Util
+from .utils.matchers import compile_pattern
 from .utils.types import Scopes
 
 if TYPE_CHECKING:
@@ -50,6 +52,9 @@ class Room(DBRoom):
         self.matrix_client: MatrixHandler | None = None
         self.room_events: RoomEvents = None
         self.scope: Scope = Scope(room=self)
+        # When the route writes are deferred, the route is only written on flush_route_writes
+        self.defer_route_writes: bool = False
+        self.route_dirty: bool = False
 
     @property
     def _customer_pattern(self) -> Pattern:
@@ -59,7 +64,7 @@ class Room(DBRoom):
         -------
             The customer's pattern is being returned as a string.
         """
-        return compile(self.config["menuflow.customer_pattern"])
+        return compile_pattern(self.config["menuflow.customer_pattern"])
 
     @property
     def _ghost_pattern(self) -> Pattern:
@@ -69,7 +74,7 @@ class Room(DBRoom):
         -------
             The ghost's pattern is being returned as a string.
         """
-        return compile(self.config["menuflow.ghost_pattern"])
+        return compile_pattern(self.config["menuflow.ghost_pattern"])
 
     @property
     def _puppet_pattern(self) -> Pattern:
@@ -79,7 +84,59 @@ class Room(DBRoom):
         -------
             The puppet's pattern is being returned as a string.
         """
-        return compile(self.config["menuflow.puppet_pattern"])
+        return compile_pattern(self.config["menuflow.puppet_pattern"])
+
+    async def get_state_event(
+        self, event_type: EventType, state_key: str = ""
+    ) -> StateEventContent | None:
+        """This function retrieves a state event of the room, using the room state cache
+        and querying the homeserver only on a cold miss.
+
+        Parameters
+        ----------
+        event_type : EventType
+            The type of the state event.
+        state_key : str
+            The state key of the state event.
+
+        Returns
+        -------
+            The content of the state event or None if it does not exist.
+        """
+        try:
+            return RoomStateCache.get_state(self.room_id, event_type, state_key)
+        except KeyError:
+            pass
+
+        try:
+            content = await self.matrix_client.get_state_event(
+                room_id=self.room_id, event_type=event_type, state_key=state_key
+            )
+        except MNotFound as e:
+            self.log.error(
+                f"[{self.room_id}] Event {event_type} with state_key '{state_key}' not found: {e}"
+            )
+            content = None
+
+        RoomStateCache.set_state(self.room_id, event_type, state_key, content)
+        return content
+
+    async def get_members(self) -> list[UserID]:
+        """This function retrieves the mxids of the room members, using the room state cache
+        and querying the homeserver only on a cold miss.
+
+        Returns
+        -------
+            The list of the members' Mxids.
+        """
+        try:
+            return RoomStateCache.get_members(self.room_id)
+        except KeyError:
+            pass
+
+        members: list[Member] = await self.matrix_client.get_members(room_id=self.room_id)
+        RoomStateCache.set_members(self.room_id, members)
+        return RoomStateCache.get_members(self.room_id)
 
     @property
     async def get_ghost_number(self) -> str | None:
@@ -93,27 +150,13 @@ class Room(DBRoom):
         # Create the m.bridge event type to filter the state events
         bridge_event: EventType = EventType(t="m.bridge", t_class=EventType.Class.STATE)
         # Get the m.bridge state event and get the customer's Mxid
-        bridge_state_event: list[StateEvent] | None = None
-        try:
-            bridge_state_event = await self.matrix_client.get_state_event(
-                room_id=self.room_id, event_type=bridge_event
-            )
-        except MNotFound as e:
-            self.log.error(f"[{self.room_id}] Event {bridge_event} not found: {e}")
+        bridge_state_event = await self.get_state_event(event_type=bridge_event)
 
         if not bridge_state_event:
-            state_key = self.config["menuflow.mautrix_state_key"]
-
-            try:
-                bridge_state_event = await self.matrix_client.get_state_event(
-                    room_id=self.room_id,
-                    event_type=bridge_event,
-                    state_key=state_key,
-                )
-            except MNotFound as e:
-                self.log.error(
-                    f"[{self.room_id}] Event {bridge_event} with state_key {state_key} not found: {e}"
-                )
+            bridge_state_event = await self.get_state_event(
+                event_type=bridge_event, state_key=self.config["menuflow.mautrix_state_key"]
+            )
+            if bridge_state_event is None:
                 return
 
         # Check if the m.bridge state event has the customer's Mxid
@@ -142,12 +185,8 @@ class Room(DBRoom):
         -------
             The customer's Mxid is being returned as a string or None.
         """
-        # Get the members of the room
-        members: list[Member] = await self.matrix_client.get_members(room_id=self.room_id)
-
         # Get the customer's Mxid using the phone number
-        for member in members:
-            member_mxid: str = member.state_key
+        for member_mxid in await self.get_members():
             match_customer = match(pattern=self._customer_pattern, string=member_mxid)
             if member_mxid and bool(match_customer):
                 # Get the phone number from the customer's Mxid (it is like
@@ -169,12 +208,12 @@ class Room(DBRoom):
 
         """
         # Search the creator in the room's state events
-        created_room_event: StateEventContent = await self.matrix_client.get_state_event(
-            room_id=self.room_id, event_type=EventType.ROOM_CREATE
+        created_room_event: StateEventContent | None = await self.get_state_event(
+            event_type=EventType.ROOM_CREATE
         )
 
         # Get the creator of the room
-        room_creator = created_room_event.get("creator")
+        room_creator = created_room_event.get("creator") if created_room_event else None
 
         # Check if the creator is the customer. This is valid for whatsapp mautrix bridge
         # version < 0.11.0
@@ -199,12 +238,8 @@ class Room(DBRoom):
         -------
             The puppet's Mxid is being returned as a string.
         """
-        # Get the members of the room
-        members: list[Member] = await self.matrix_client.get_members(room_id=self.room_id)
-
         # Get the puppet's Mxid
-        for member in members:
-            member_mxid: str = member.state_key
+        for member_mxid in await self.get_members():
             match_puppet = match(pattern=self._puppet_pattern, string=member_mxid)
             if member_mxid and bool(match_puppet):
                 self.log.debug(f"Member {member_mxid} is a puppet Mxid")
@@ -457,8 +492,25 @@ class Room(DBRoom):
 
         self.route.node_id = node_id.value if isinstance(node_id, RouteState) else node_id
         self.route.state = state
+        if state != RouteState.DELAY:
+            self.route.wake_at = None
+        await self.update_route()
+
+    async def update_route(self) -> None:
+        """Writes the route, or marks it to be written if the route writes are deferred."""
+        if self.defer_route_writes:
+            self.route_dirty = True
+            return
+
         await self.route.update()
 
+    async def flush_route_writes(self) -> None:
+        """Stops deferring the route writes and writes the route if it has pending changes."""
+        self.defer_route_writes = False
+        if self.route_dirty:
+            self.route_dirty = False
+            await self.route.update()
+
     def set_node_var(self, **kwargs) -> None:
         """Updates the node variables.
 
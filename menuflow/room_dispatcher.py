@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from logging import getLogger
+from time import monotonic
+from typing import Awaitable, Callable
+
+from mautrix.types import Event, RoomID
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.room_dispatcher")
+
+RoomEventHandler = Callable[[Event], Awaitable[None]]
+
+
+class SyncBatch:
+    """The events of a sync response that are handled by the room dispatcher.
+
+    It measures the time from the reception of the sync until every room of the batch has
+    handled its events, and the slowest time to handle the first event of a room.
+    """
+
+    def __init__(self, next_batch: str | None = None) -> None:
+        self.next_batch = next_batch
+        self.started_at = monotonic()
+        self.pending = 0
+        self.events = 0
+        self.rooms: set[RoomID] = set()
+        # Latency of the first handled event of each room
+        self.first_event_latency: dict[RoomID, float] = {}
+
+    def add(self, room_id: RoomID) -> None:
+        self.pending += 1
+        self.events += 1
+        self.rooms.add(room_id)
+
+    def done(self, room_id: RoomID) -> bool:
+        """Mark an event of the room as handled and return whether the batch was completed."""
+        self.first_event_latency.setdefault(room_id, monotonic() - self.started_at)
+        self.pending -= 1
+        return self.pending == 0
+
+    @property
+    def latency(self) -> float:
+        return monotonic() - self.started_at
+
+
+class RoomDispatcher:
+    """Runs the room event handlers with a worker per room.
+
+    The rooms of a sync batch are handled concurrently, so a slow room doesn't delay the rest,
+    while the events of a room are handled one at a time, in the order they were received.
+    The workers are created when a room receives events and finish when its queue is empty.
+    """
+
+    def __init__(self, log: TraceLogger = log) -> None:
+        self.log = log
+        self.queues: dict[RoomID, deque[tuple[RoomEventHandler, Event, SyncBatch]]] = {}
+        self.workers: dict[RoomID, asyncio.Task] = {}
+        self.batch: SyncBatch = SyncBatch()
+        self.stats: dict[str, float | int] = {
+            "batches": 0,
+            "last_latency": 0.0,
+            "max_latency": 0.0,
+            "last_first_event_latency": 0.0,
+        }
+
+    def start_batch(self, next_batch: str | None = None) -> SyncBatch:
+        """Start a new sync batch, the events dispatched from now on belong to it."""
+        self.batch = SyncBatch(next_batch=next_batch)
+        return self.batch
+
+    def ordered(self, handler: RoomEventHandler) -> RoomEventHandler:
+        """Wrap an event handler to run it in the worker of the room of the event.
+
+        mautrix runs every event handler in its own task, and the tasks start in the order the
+        events were dispatched. The wrapper enqueues the event without awaiting anything before,
+        so the room queue keeps the order of the sync.
+        """
+
+        async def dispatch(evt: Event) -> None:
+            self.dispatch(room_id=evt.room_id, handler=handler, evt=evt)
+
+        return dispatch
+
+    def dispatch(self, room_id: RoomID, handler: RoomEventHandler, evt: Event) -> None:
+        """Enqueue an event in the room queue and start the room worker if it is not running."""
+        self.batch.add(room_id)
+        self.queues.setdefault(room_id, deque()).append((handler, evt, self.batch))
+
+        if room_id not in self.workers:
+            self.workers[room_id] = asyncio.create_task(
+                self._room_worker(room_id), name=f"room_dispatcher-{room_id}"
+            )
+
+    async def _room_worker(self, room_id: RoomID) -> None:
+        queue = self.queues[room_id]
+        try:
+            while queue:
+                handler, evt, batch = queue.popleft()
+                try:
+                    await handler(evt)
+                except Exception:
+                    self.log.exception(
+                        f"[{room_id}] Error handling event ({getattr(evt, 'event_id', None)})"
+                    )
+                finally:
+                    if batch.done(room_id):
+                        self._on_batch_done(batch)
+        finally:
+            self.workers.pop(room_id, None)
+            if not queue:
+                self.queues.pop(room_id, None)
+
+    def _on_batch_done(self, batch: SyncBatch) -> None:
+        latency = batch.latency
+        first_event_latency = max(batch.first_event_latency.values(), default=0.0)
+
+        self.stats["batches"] += 1
+        self.stats["last_latency"] = latency
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        self.stats["last_first_event_latency"] = first_event_latency
+
+        self.log.debug(
+            f"Sync batch ({batch.next_batch}) with {batch.events} events in {len(batch.rooms)} "
+            f"rooms handled in {latency:.3f}s, slowest first event: {first_event_latency:.3f}s"
+        )
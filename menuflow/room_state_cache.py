@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from logging import getLogger
+
+from mautrix.types import EventType, Membership, RoomID, StateEvent, StateEventContent, UserID
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.room_state_cache")
+
+
+class RoomStateCache:
+    """Per-room cache of the state events used to identify the room participants.
+
+    It is populated and invalidated by the `m.room.create`, `m.bridge` and `m.room.member`
+    events received in the sync, so the homeserver is only queried on a cold miss.
+    A cached `None` means that the state event is known to not exist.
+    """
+
+    state_events: dict[RoomID, dict[tuple[str, str], StateEventContent | None]] = {}
+    members: dict[RoomID, dict[UserID, Membership]] = {}
+
+    STATE_TYPES: set[str] = {str(EventType.ROOM_CREATE), "m.bridge"}
+    MEMBER_TYPE: str = str(EventType.ROOM_MEMBER)
+
+    @classmethod
+    def get_state(
+        cls, room_id: RoomID, event_type: EventType | str, state_key: str = ""
+    ) -> StateEventContent | None:
+        """Get the content of a cached state event.
+
+        Raises
+        ------
+        KeyError
+            If the state event is not cached.
+        """
+        return cls.state_events[room_id][(str(event_type), state_key)]
+
+    @classmethod
+    def set_state(
+        cls,
+        room_id: RoomID,
+        event_type: EventType | str,
+        state_key: str,
+        content: StateEventContent | None,
+    ) -> None:
+        cls.state_events.setdefault(room_id, {})[(str(event_type), state_key)] = content
+
+    @classmethod
+    def get_members(cls, room_id: RoomID) -> list[UserID]:
+        """Get the mxids of the cached room members, in the order they were received.
+
+        Raises
+        ------
+        KeyError
+            If the member list of the room is not cached.
+        """
+        return list(cls.members[room_id])
+
+    @classmethod
+    def set_members(cls, room_id: RoomID, members: list[StateEvent]) -> None:
+        cls.members[room_id] = {
+            member.state_key: member.content.membership for member in members if member.state_key
+        }
+
+    @classmethod
+    def clear(cls, room_id: RoomID) -> None:
+        cls.state_events.pop(room_id, None)
+        cls.members.pop(room_id, None)
+
+    @classmethod
+    def handle_sync_event(cls, room_id: RoomID, evt: dict) -> None:
+        """Update the cache with a raw state event received in the sync.
+
+        Parameters
+        ----------
+        room_id : RoomID
+            The room where the event was sent.
+        evt : dict
+            The raw event, as received in the sync response.
+        """
+        evt_type, state_key = evt.get("type"), evt.get("state_key")
+        if state_key is None:
+            return
+
+        content: dict = evt.get("content") or {}
+
+        if evt_type == cls.MEMBER_TYPE:
+            # The member list is only updated when it was fully loaded before, because the sync
+            # lazy loads the members and a partial list would hide the missing ones.
+            if (members := cls.members.get(room_id)) is None:
+                return
+
+            try:
+                members[state_key] = Membership(content.get("membership"))
+            except ValueError:
+                members.pop(state_key, None)
+        elif evt_type in cls.STATE_TYPES:
+            event_type = EventType.find(evt_type, t_class=EventType.Class.STATE)
+            try:
+                state_content = StateEvent.deserialize_content(
+                    {**content, "__mautrix_event_type": event_type}
+                )
+            except Exception as e:
+                log.warning(f"[{room_id}] Invalid {evt_type} state event in sync: {e}")
+                cls.state_events.get(room_id, {}).pop((evt_type, state_key), None)
+                return
+
+            cls.set_state(room_id, event_type, state_key, state_content)
+
+    @classmethod
+    def handle_sync_room(cls, room_id: RoomID, room_data: dict) -> None:
+        """Update the cache with the state and timeline events of a joined room in the sync."""
+        for section in ("state", "timeline"):
+            for evt in room_data.get(section, {}).get("events", []):
+                cls.handle_sync_event(room_id, evt)
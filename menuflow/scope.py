@@ -32,6 +32,11 @@ class Scope:
 
     async def update(self, scope: Scopes | str) -> None:
         s = self._key(scope)
+        if s in self.ROUTE_SCOPES and getattr(self.room, "defer_route_writes", False):
+            # The variables are written with the route when the deferred writes are flushed
+            self.room.route_dirty = True
+            return
+
         await self._model(s).update_variables()
 
         if s in self.ROUTE_SCOPES:
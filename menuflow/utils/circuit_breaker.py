@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from collections import deque
+from enum import Enum
+from logging import getLogger
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from mautrix.util.logging import TraceLogger
+from yarl import URL
+
+from ..config import Config
+
+log: TraceLogger = getLogger("menuflow.circuit_breaker")
+
+
+class CircuitOpenError(Exception):
+    """The request was not sent because the circuit breaker of its host is open."""
+
+    def __init__(self, host: str) -> None:
+        super().__init__(f"The circuit breaker of {host} is open")
+        self.host = host
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class BreakerOptions:
+    """The options of `menuflow.circuit_breaker`."""
+
+    __slots__ = (
+        "enabled",
+        "window",
+        "min_calls",
+        "failure_rate",
+        "slow_call_duration",
+        "slow_call_rate",
+        "open_timeout",
+        "half_open_probes",
+        "max_retries",
+        "retry_backoff",
+        "retry_budget",
+    )
+
+    def __init__(self, options: dict) -> None:
+        self.enabled: bool = options.get("enabled", False)
+        # Seconds of calls used to compute the failure and slow call rates
+        self.window: float = options.get("window", 60)
+        self.min_calls: int = options.get("min_calls", 10)
+        self.failure_rate: float = options.get("failure_rate", 0.5)
+        self.slow_call_duration: float = options.get("slow_call_duration", 10)
+        self.slow_call_rate: float = options.get("slow_call_rate", 0.8)
+        self.open_timeout: float = options.get("open_timeout", 30)
+        self.half_open_probes: int = options.get("half_open_probes", 1)
+        self.max_retries: int = options.get("max_retries", 0)
+        self.retry_backoff: float = options.get("retry_backoff", 0.5)
+        # Maximum ratio of retries to calls in the window
+        self.retry_budget: float = options.get("retry_budget", 0.2)
+
+
+class CircuitBreaker:
+    """The circuit breaker of an upstream host.
+
+    It opens when the rate of failed or slow calls in the window reaches its threshold, then
+    it rejects the calls until `open_timeout` passes. Then a few probe calls are let through,
+    it closes if they succeed and opens again if they fail.
+    """
+
+    def __init__(self, host: str, options: BreakerOptions) -> None:
+        self.host = host
+        self.options = options
+        self.state = BreakerState.CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        # (time, failed, slow) of each call in the window
+        self.calls: deque[tuple[float, bool, bool]] = deque()
+        self.retries: deque[float] = deque()
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        start = now - self.options.window
+        while self.calls and self.calls[0][0] < start:
+            self.calls.popleft()
+        while self.retries and self.retries[0] < start:
+            self.retries.popleft()
+
+    def allow(self) -> bool:
+        """Check if a call can be sent, the probe calls must be recorded afterwards."""
+        if self.state == BreakerState.OPEN:
+            if monotonic() - self.opened_at < self.options.open_timeout:
+                self.rejected += 1
+                return False
+            self.state = BreakerState.HALF_OPEN
+            self.probes = 0
+
+        if self.state == BreakerState.HALF_OPEN:
+            if self.probes >= self.options.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes += 1
+
+        return True
+
+    def record(self, failed: bool, duration: float) -> None:
+        now = monotonic()
+        slow = duration >= self.options.slow_call_duration
+
+        if self.state == BreakerState.HALF_OPEN:
+            self.probes -= 1
+            if failed or slow:
+                self._open(now, "the probe call failed")
+            else:
+                log.info(f"The circuit breaker of {self.host} is closed")
+                self.state = BreakerState.CLOSED
+                self.calls.clear()
+            return
+
+        self.calls.append((now, failed, slow))
+        self._prune(now)
+        if self.state == BreakerState.CLOSED and len(self.calls) >= self.options.min_calls:
+            failure_rate, slow_rate = self.rates
+            if failure_rate >= self.options.failure_rate:
+                self._open(now, f"failure rate of {failure_rate:.0%}")
+            elif slow_rate >= self.options.slow_call_rate:
+                self._open(now, f"slow call rate of {slow_rate:.0%}")
+
+    def release(self) -> None:
+        """Release the probe of a call that was cancelled before it finished."""
+        if self.state == BreakerState.HALF_OPEN:
+            self.probes = max(self.probes - 1, 0)
+
+    def _open(self, now: float, reason: str) -> None:
+        log.warning(f"The circuit breaker of {self.host} is open: {reason}")
+        self.state = BreakerState.OPEN
+        self.opened_at = now
+        self.calls.clear()
+
+    @property
+    def rates(self) -> tuple[float, float]:
+        """The failure rate and the slow call rate of the window."""
+        if not self.calls:
+            return 0.0, 0.0
+        failed = sum(1 for _, call_failed, _ in self.calls if call_failed)
+        slow = sum(1 for _, _, call_slow in self.calls if call_slow)
+        return failed / len(self.calls), slow / len(self.calls)
+
+    def withdraw_retry(self) -> bool:
+        """Check the retry budget of the host, the retry is counted if it is allowed."""
+        now = monotonic()
+        self._prune(now)
+        if len(self.retries) >= max(1, self.options.retry_budget * len(self.calls)):
+            return False
+        self.retries.append(now)
+        return True
+
+    def serialize(self) -> dict[str, Any]:
+        failure_rate, slow_rate = self.rates
+        return {
+            "state": self.state.value,
+            "calls": len(self.calls),
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+            "retries": len(self.retries),
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakers:
+    """The circuit breakers of the upstream hosts of the http_request nodes and the
+    middlewares, configured in `menuflow.circuit_breaker`."""
+
+    options: BreakerOptions = BreakerOptions({})
+    breakers: dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def init_cls(cls, config: Config) -> None:
+        cls.options = BreakerOptions(config["menuflow.circuit_breaker"] or {})
+
+    @classmethod
+    def get(cls, url: str) -> CircuitBreaker:
+        host = URL(url).host or url
+        if host not in cls.breakers:
+            cls.breakers[host] = CircuitBreaker(host, cls.options)
+        return cls.breakers[host]
+
+    @classmethod
+    async def call(
+        cls,
+        url: str,
+        send: Callable[[], Awaitable[Any]],
+        retry: bool = False,
+        exclude: tuple[type[Exception], ...] = (),
+    ) -> Any:
+        """Send a request through the circuit breaker of its host.
+
+        The failed calls, the ones that raise an exception or return a 5xx status, are retried
+        with a jittered backoff if `retry` is True and the retry budget of the host allows it.
+        The exceptions in `exclude` are errors of the caller, not of the host: the call is
+        recorded as successful and the exception is raised without retrying.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the circuit breaker of the host is open.
+        """
+        if not cls.options.enabled:
+            return await send()
+
+        breaker = cls.get(url)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(breaker.host)
+
+            error: Optional[Exception] = None
+            result = None
+            start = monotonic()
+            try:
+                result = await send()
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except exclude:
+                breaker.record(False, monotonic() - start)
+                raise
+            except Exception as e:
+                error = e
+
+            failed = error is not None or result.status >= 500
+            breaker.record(failed, monotonic() - start)
+            if not failed:
+                return result
+
+            if not retry or attempt >= cls.options.max_retries or not breaker.withdraw_retry():
+                if error:
+                    raise error
+                return result
+
+            attempt += 1
+            delay = random.uniform(0, cls.options.retry_backoff * 2**attempt)
+            log.debug(f"Retrying the request to {breaker.host} in {delay:.2f}s ({attempt})")
+            await asyncio.sleep(delay)
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, Any]]:
+        return {host: breaker.serialize() for host, breaker in cls.breakers.items()}
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import date as Date
+from datetime import datetime
+from logging import getLogger
+from typing import Optional, Tuple
+
+import holidays
+from holidays import HolidayBase
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.holiday_calendars")
+
+# (country code, subdivision code, year)
+CalendarKey = Tuple[str, Optional[str], int]
+
+
+class HolidayCalendars:
+    """The holiday calendars of the countries, shared by all the rooms.
+
+    A calendar is built once per country, subdivision and year. The first time a country and
+    subdivision are used, the calendars of the current and next year are loaded together.
+    The calendars of the past years are dropped when the year changes.
+    """
+
+    max_size: int = 256
+    calendars: OrderedDict[CalendarKey, Optional[HolidayBase]] = OrderedDict()
+    # Year of the calendars that are kept, the older ones are dropped when it changes
+    current_year: int = 0
+
+    @classmethod
+    def _check_year(cls) -> int:
+        year = datetime.now().year
+        if year != cls.current_year:
+            cls.current_year = year
+            for key in [key for key in cls.calendars if key[2] < year]:
+                del cls.calendars[key]
+        return year
+
+    @classmethod
+    def _load(cls, country_code: str, subdivision_code: Optional[str], years: list[int]) -> None:
+        try:
+            calendar = holidays.country_holidays(
+                country_code, subdiv=subdivision_code, years=years, expand=False
+            )
+        except NotImplementedError as e:
+            log.error(
+                f"Error getting holidays for country code '{country_code}' - "
+                f"with subdivision code '{subdivision_code}': {e}"
+            )
+            calendar = None
+
+        for year in years:
+            cls.calendars[(country_code, subdivision_code, year)] = calendar
+
+        while len(cls.calendars) > cls.max_size:
+            cls.calendars.popitem(last=False)
+
+    @classmethod
+    def get(
+        cls, country_code: str, subdivision_code: Optional[str], year: int
+    ) -> Optional[HolidayBase]:
+        """Get the holiday calendar of a country and subdivision for a year.
+
+        Returns None if the country or the subdivision are not supported.
+        """
+        current_year = cls._check_year()
+        key = (country_code, subdivision_code, year)
+        if key not in cls.calendars:
+            years = [year, year + 1] if year == current_year else [year]
+            cls._load(country_code, subdivision_code, years)
+
+        cls.calendars.move_to_end(key)
+        return cls.calendars[key]
+
+    @classmethod
+    def is_holiday(
+        cls, date: Date | datetime, country_code: str, subdivision_code: Optional[str]
+    ) -> bool:
+        calendar = cls.get(country_code, subdivision_code, date.year)
+        return calendar is not None and date in calendar
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from logging import getLogger
+from re import Pattern, compile, error
+
+from mautrix.types import UserID
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.matchers")
+
+# Compiled patterns by their source string. The config values are used as keys,
+# so a reloaded config with new patterns is compiled on its first use.
+_compiled_patterns: dict[str, Pattern] = {}
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    """Compile a regex pattern only once and return the cached compiled pattern.
+
+    Parameters
+    ----------
+    pattern : str
+        The regex pattern to compile.
+
+    Returns
+    -------
+        The compiled pattern.
+    """
+    try:
+        return _compiled_patterns[pattern]
+    except KeyError:
+        pass
+
+    compiled = _compiled_patterns[pattern] = compile(pattern)
+    return compiled
+
+
+class UserMatcher:
+    """It checks if a user ID matches any of a list of user IDs and regex patterns.
+
+    The patterns are combined into a single alternation, so a user ID is checked in one pass
+    instead of running every pattern. The user IDs that are matched by their own pattern
+    (the plain mxids of the list) are checked first with a set lookup.
+    """
+
+    _cache: dict[tuple[str, ...], UserMatcher] = {}
+
+    def __init__(self, patterns: list[str] | tuple[str, ...]) -> None:
+        self.patterns: tuple[str, ...] = tuple(patterns)
+        compiled = [compile_pattern(pattern) for pattern in self.patterns]
+
+        self.exact: frozenset[str] = frozenset(
+            pattern for pattern, regex in zip(self.patterns, compiled) if regex.match(pattern)
+        )
+        self.regex: Pattern | None = None
+        self.regexes: tuple[Pattern, ...] = ()
+
+        if not self.patterns:
+            return
+
+        try:
+            self.regex = compile("|".join(f"(?:{pattern})" for pattern in self.patterns))
+        except error as e:
+            # Patterns with repeated group names or global flags can't be combined
+            log.debug(f"The patterns can't be combined ({e}), they will be checked one by one")
+            self.regexes = tuple(compiled)
+
+    @classmethod
+    def from_patterns(cls, patterns: list[str] | tuple[str, ...] | None) -> UserMatcher:
+        """Get the matcher of a list of patterns, compiling it only once per list.
+
+        Parameters
+        ----------
+        patterns : list[str]
+            The user IDs and regex patterns to match.
+
+        Returns
+        -------
+            The matcher of the patterns.
+        """
+        key = tuple(patterns or ())
+        try:
+            return cls._cache[key]
+        except KeyError:
+            pass
+
+        matcher = cls._cache[key] = cls(key)
+        return matcher
+
+    def match(self, mxid: UserID) -> bool:
+        """It checks if the user ID matches any of the patterns
+
+        Parameters
+        ----------
+        mxid : UserID
+            The user ID to check.
+
+        Returns
+        -------
+            A boolean value.
+        """
+        if mxid in self.exact:
+            return True
+
+        if self.regex is not None:
+            return self.regex.match(mxid) is not None
+
+        return any(regex.match(mxid) for regex in self.regexes)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import re
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator
+
+from aiohttp import ClientResponse
+
+CHUNK_SIZE = 64 * 1024
+# Bytes kept to sniff the mimetype of the media
+HEADER_SIZE = 4096
+
+NOT_BASE64 = re.compile(rb"[^A-Za-z0-9+/]")
+
+
+class MediaTooLargeError(Exception):
+    """The media is bigger than the maximum size of the media."""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__(f"The media is bigger than {max_size} bytes")
+        self.max_size = max_size
+
+
+class Base64Decoder:
+    """Decode a base64 stream chunk by chunk.
+
+    Like `base64.b64decode`, the characters out of the base64 alphabet are discarded,
+    e.g. the quotes of a JSON string or the line breaks.
+    """
+
+    def __init__(self) -> None:
+        self.pending = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self.pending + NOT_BASE64.sub(b"", chunk)
+        end = len(data) - len(data) % 4
+        self.pending = data[end:]
+        return base64.b64decode(data[:end])
+
+    def flush(self) -> bytes:
+        data, self.pending = self.pending, b""
+        if not data:
+            return b""
+        # The padding was discarded with the other characters out of the alphabet
+        return base64.b64decode(data + b"=" * (-len(data) % 4))
+
+
+class SpooledMedia:
+    """A media downloaded to a temporary file, kept in memory while it is small."""
+
+    def __init__(self, max_memory: int) -> None:
+        self.file = SpooledTemporaryFile(max_size=max_memory)
+        self.size = 0
+        self.header = b""
+        self._hash = hashlib.sha256()
+
+    @property
+    def content_hash(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, data: bytes, max_size: int) -> None:
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > max_size:
+            raise MediaTooLargeError(max_size)
+        if len(self.header) < HEADER_SIZE:
+            self.header += data[: HEADER_SIZE - len(self.header)]
+        self._hash.update(data)
+        self.file.write(data)
+
+    @classmethod
+    async def from_response(
+        cls, response: ClientResponse, base64_encoded: bool, max_size: int, max_memory: int
+    ) -> SpooledMedia:
+        """Download the body of a response, decoding it if it is base64.
+
+        Raises
+        ------
+        MediaTooLargeError
+            If the media is bigger than `max_size`.
+        """
+        media = cls(max_memory)
+        decoder = Base64Decoder() if base64_encoded else None
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                media.write(decoder.feed(chunk) if decoder else chunk, max_size)
+            if decoder:
+                media.write(decoder.flush(), max_size)
+        except BaseException:
+            media.close()
+            raise
+
+        media.file.seek(0)
+        return media
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        self.file.seek(0)
+        while chunk := self.file.read(CHUNK_SIZE):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> SpooledMedia:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
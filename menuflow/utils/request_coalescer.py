@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Optional
+
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.request_coalescer")
+
+
+class CoalesceOptions:
+    """The `coalesce` block of an http_request node.
+
+    ```
+    coalesce:
+      # Optional, by default the rendered method, URL, params and body
+      key: "{{ route.category }}"
+      max_response_bytes: 1048576
+    ```
+
+    `coalesce: true` enables it with the default options.
+    """
+
+    __slots__ = ("key", "max_response_bytes")
+
+    def __init__(self, key: Optional[str], max_response_bytes: int) -> None:
+        self.key = key
+        self.max_response_bytes = max_response_bytes
+
+    @classmethod
+    def from_content(cls, coalesce: dict | bool | None) -> Optional[CoalesceOptions]:
+        """Parse the coalesce block of a node, returns None if it is not enabled."""
+        if coalesce is True:
+            coalesce = {}
+        elif not isinstance(coalesce, dict) or not coalesce.get("enabled", True):
+            return None
+
+        return cls(
+            key=coalesce.get("key"),
+            max_response_bytes=int(coalesce.get("max_response_bytes", 1024 * 1024)),
+        )
+
+
+class RequestCoalescer:
+    """Share one in-flight request between the rooms that send the same request at
+    the same time.
+
+    The first room sends the request, the others wait for its response. The responses
+    bigger than `max_bytes` are not shared, the waiting rooms send their own request.
+    """
+
+    in_flight: dict[str, asyncio.Future] = {}
+    # Number of requests that didn't go out because they waited for another one
+    coalesced: int = 0
+
+    @classmethod
+    async def run(cls, key: str, fetch: Callable[[], Awaitable[Any]], max_bytes: int) -> Any:
+        """Run `fetch`, or wait for the result of the one in flight with the same key.
+
+        The result of `fetch` must have a `text` attribute, used to check its size.
+        """
+        if future := cls.in_flight.get(key):
+            cls.coalesced += 1
+            # The waiting rooms can't cancel the request of the other rooms
+            result = await asyncio.shield(future)
+            if result is not None:
+                return result
+            return await fetch()
+
+        future = asyncio.get_running_loop().create_future()
+        cls.in_flight[key] = future
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, there may be nobody waiting for it
+            future.exception()
+            raise
+        finally:
+            cls.in_flight.pop(key, None)
+
+        if len(result.text.encode()) > max_bytes:
+            log.warning(
+                f"The response of {key} is bigger than {max_bytes} bytes, it is not shared"
+            )
+            future.set_result(None)
+        else:
+            future.set_result(result)
+
+        return result
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import OrderedDict
+from logging import getLogger
+from time import monotonic
+from typing import Optional
+
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = getLogger("menuflow.response_cache")
+
+
+class CacheOptions:
+    """The `cache` block of an http_request node.
+
+    ```
+    cache:
+      ttl: 300
+      vary_by:
+        - "{{ route.customer_language }}"
+      max_entries: 100
+      max_bytes: 1048576
+    ```
+    """
+
+    __slots__ = ("ttl", "vary_by", "max_entries", "max_bytes")
+
+    def __init__(self, ttl: float, vary_by: list[str], max_entries: int, max_bytes: int) -> None:
+        self.ttl = ttl
+        # Templates rendered for each request and added to the key, e.g. the language
+        self.vary_by = vary_by
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_content(cls, cache: dict | None) -> Optional[CacheOptions]:
+        """Parse the cache block of a node, returns None if the cache is not enabled."""
+        if not cache or not cache.get("ttl"):
+            return None
+
+        vary_by = cache.get("vary_by") or []
+        return cls(
+            ttl=float(cache["ttl"]),
+            vary_by=[vary_by] if isinstance(vary_by, str) else list(vary_by),
+            max_entries=int(cache.get("max_entries", 100)),
+            max_bytes=int(cache.get("max_bytes", 1024 * 1024)),
+        )
+
+
+class CachedResponse:
+    __slots__ = ("status", "text", "variables", "size", "expires_at")
+
+    def __init__(self, status: int, text: str, variables: dict, expires_at: float) -> None:
+        self.status = status
+        self.text = text
+        # Variables extracted from the response with jq, ready to be set in the room
+        self.variables = variables
+        self.size = len(text.encode()) + len(json.dumps(variables, default=str))
+        self.expires_at = expires_at
+
+
+class ResponseStore:
+    """Responses of an http_request node, bounded by number of entries and bytes."""
+
+    def __init__(self) -> None:
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry and entry.expires_at <= monotonic():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse, options: CacheOptions) -> None:
+        if entry.size > options.max_bytes:
+            log.debug(f"The response of {entry.size} bytes is bigger than the cache, skipping it")
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = entry
+        self.size += entry.size
+        while len(self.entries) > options.max_entries or self.size > options.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: str) -> None:
+        self.size -= self.entries.pop(key).size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "bytes": self.size,
+        }
+
+
+class ResponseCache:
+    """The responses cached by the http_request nodes, one store per node ID."""
+
+    stores: dict[str, ResponseStore] = {}
+
+    @staticmethod
+    def make_key(method: str, url: str, request_body: dict, vary_by: list) -> str:
+        """Build the key of a request from its rendered method, URL, params, headers, basic
+        auth and body. The key is a hash, the credentials of the requests are not kept."""
+        key = [
+            method.upper(),
+            url,
+            request_body.get("params"),
+            request_body.get("headers"),
+            request_body.get("auth"),
+            request_body.get("data"),
+            request_body.get("json"),
+            vary_by,
+        ]
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    @classmethod
+    def get(cls, node_id: str, key: str) -> Optional[CachedResponse]:
+        return cls.stores.setdefault(node_id, ResponseStore()).get(key)
+
+    @classmethod
+    def put(
+        cls,
+        node_id: str,
+        key: str,
+        options: CacheOptions,
+        status: int,
+        text: str,
+        variables: dict,
+    ) -> None:
+        entry = CachedResponse(status, text, variables, expires_at=monotonic() + options.ttl)
+        cls.stores.setdefault(node_id, ResponseStore()).put(key, entry, options)
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, int]]:
+        """Get the hits, misses and size of the cache of each node."""
+        return {node_id: store.stats() for node_id, store in cls.stores.items()}
@@ -4,8 +4,10 @@ import traceback
 from asyncio import Task, all_tasks
 from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 from logging import getLogger
-from re import compile, match, sub
+from re import compile, sub
+from typing import Callable
 
 import holidays
 import jq
@@ -19,6 +21,8 @@ from ..config import Config
 from ..jinja.env import jinja_env
 from ..utils.flags import RenderFlags
 from ..utils.types import Scopes
+from .holiday_calendars import HolidayCalendars
+from .matchers import UserMatcher
 
 log: TraceLogger = getLogger("menuflow.util")
 
@@ -45,6 +49,8 @@ def convert_to_bool(item) -> dict | list | str:
 class Util:
     config: Config
     _main_matrix_regex = "[\\w-]+:[\\w.-]"
+    _user_id_re = compile(f"^@{_main_matrix_regex}+$")
+    _room_id_re = compile(f"^!{_main_matrix_regex}+$")
     _jinja_open_delims = ["{{", "{%", "{#"]
     _jinja_close_delims = ["}}", "%}", "#}"]
     _escape_tokens = {
@@ -56,37 +62,41 @@ class Util:
     }  # fmt: skip
     _jinja_marker_re = compile(r"¬¬¬")
 
+    MONTHS: dict[str, int] = {
+        "jan": 1,
+        "feb": 2,
+        "mar": 3,
+        "apr": 4,
+        "may": 5,
+        "jun": 6,
+        "jul": 7,
+        "aug": 8,
+        "sep": 9,
+        "oct": 10,
+        "nov": 11,
+        "dec": 12,
+    }
+
+    WEEK_DAYS: dict[str, int] = {
+        "mon": 1,
+        "tue": 2,
+        "wed": 3,
+        "thu": 4,
+        "fri": 5,
+        "sat": 6,
+        "sun": 7,
+    }
+
     def __init__(self, config: Config):
         self.config = config
 
     @property
     def months(self) -> dict[str, int]:
-        return {
-            "jan": 1,
-            "feb": 2,
-            "mar": 3,
-            "apr": 4,
-            "may": 5,
-            "jun": 6,
-            "jul": 7,
-            "aug": 8,
-            "sep": 9,
-            "oct": 10,
-            "nov": 11,
-            "dec": 12,
-        }
+        return self.MONTHS
 
     @property
     def week_days(self) -> dict[str, int]:
-        return {
-            "mon": 1,
-            "tue": 2,
-            "wed": 3,
-            "thu": 4,
-            "fri": 5,
-            "sat": 6,
-            "sun": 7,
-        }
+        return self.WEEK_DAYS
 
     @classmethod
     def is_user_id(cls, user_id: UserID) -> bool:
@@ -102,7 +112,7 @@ class Util:
             A boolean value.
 
         """
-        return False if not user_id else bool(match(f"^@{cls._main_matrix_regex}+$", user_id))
+        return False if not user_id else bool(cls._user_id_re.match(user_id))
 
     @classmethod
     def is_room_id(cls, room_id: RoomID) -> bool:
@@ -118,7 +128,7 @@ class Util:
             A boolean value.
 
         """
-        return False if not room_id else bool(match(f"^!{cls._main_matrix_regex}+$", room_id))
+        return False if not room_id else bool(cls._room_id_re.match(room_id))
 
     @classmethod
     def get_tasks_by_name(self, task_name: str) -> Task:
@@ -194,6 +204,37 @@ class Util:
         with open(f"menuflow/utils/sample_flows/{flows[flow_index]}", "r") as f:
             return json.loads(f.read())
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def compile_template(source: str) -> Template:
+        """Compile a Jinja template, each source is compiled once and the template is reused.
+
+        Parameters
+        ----------
+        source : str
+            The source of the template.
+
+        Returns
+        -------
+            The compiled template.
+        """
+        return jinja_env.from_string(source)
+
+    @classmethod
+    def has_jinja_delims(cls, data: dict | list | str) -> bool:
+        """Check if a string, or any string in a dict or list, is a Jinja template."""
+        if isinstance(data, dict):
+            return any(cls.has_jinja_delims(value) for value in data.values())
+        elif isinstance(data, list):
+            return any(cls.has_jinja_delims(item) for item in data)
+        elif isinstance(data, str):
+            return any(
+                open in data and close in data
+                for open, close in zip(cls._jinja_open_delims, cls._jinja_close_delims)
+            )
+
+        return False
+
     @classmethod
     def jinja_render(
         cls,
@@ -221,11 +262,7 @@ class Util:
 
         """
         temp_rendered = template
-        has_jinja_delims = any(
-            open in template and close in template
-            for open, close in zip(cls._jinja_open_delims, cls._jinja_close_delims)
-        )
-        if has_jinja_delims:
+        if cls.has_jinja_delims(template):
             # TODO: Remove when the old variables have been fully migrated to the new scopes.
             _variables = deepcopy(variables)
             _route = _variables.setdefault("route", {})
@@ -255,7 +292,7 @@ class Util:
             # TODO: End of TODO
 
             try:
-                template: Template = jinja_env.from_string(template)
+                template: Template = cls.compile_template(template)
                 temp_rendered = template.render(_variables)
             except TemplateSyntaxError as e:
                 txt_error = f"func_name: {e.name}, \nline: {e.lineno}, \nerror: {e.message}"
@@ -405,9 +442,8 @@ class Util:
         )
 
         if self.is_user_id(mxid):
-            for pattern in self.config[user_regex]:
-                if match(pattern, mxid):
-                    return True
+            # The matcher is compiled once per list of patterns
+            return UserMatcher.from_patterns(self.config[user_regex]).match(mxid)
 
         return False
 
@@ -426,7 +462,8 @@ class Util:
     @classmethod
     def is_holiday(cls, date: datetime, country_code: str, subdivision_code: str) -> bool:
         """
-        Verify if the date is a holiday in the country and subdivision.
+        Verify if the date is a holiday in the country and subdivision,
+        using the cached holiday calendars.
 
         Parameters
         ----------
@@ -442,13 +479,9 @@ class Util:
         -------
             A boolean value.
         """
-        try:
-            return date in holidays.country_holidays(country_code, prov=subdivision_code)
-        except NotImplementedError as e:
-            log.error(
-                f"Error getting holidays for country code '{country_code}' - with subdivision code '{subdivision_code}': {e}"
-            )
-            return False
+        return HolidayCalendars.is_holiday(
+            date=date, country_code=country_code, subdivision_code=subdivision_code
+        )
 
     @staticmethod
     def _resolve_country(country_code: str) -> tuple[str, dict | None]:
@@ -579,7 +612,44 @@ class Util:
         )
 
     @staticmethod
-    def jq_compile(filter: str, json_data: dict | list) -> dict:
+    @lru_cache(maxsize=1024)
+    def compile_jq(filter: str) -> jq._Program | Exception:
+        """Compile a jq filter, each filter is compiled once and the program is reused.
+
+        Parameters
+        ----------
+        filter : str
+            The jq filter to be compiled.
+
+        Returns
+        -------
+            The compiled program, or the compile error. The errors are cached too,
+            so an invalid filter is not compiled again.
+        """
+        try:
+            return jq.compile(filter)
+        except Exception as error:
+            return error.with_traceback(None)
+
+    @classmethod
+    def _jq_run(cls, filter: str, run: Callable[[jq._Program], list]) -> dict:
+        try:
+            program = cls.compile_jq(filter)
+        except TypeError as error:
+            # The filter is not a string
+            program = error
+        if isinstance(program, Exception):
+            return {"result": [], "error": str(program), "status": 400}
+
+        try:
+            filtered_result = run(program)
+        except Exception as error:
+            return {"result": [], "error": str(error), "status": 421}
+
+        return {"result": filtered_result, "error": None, "status": 200}
+
+    @classmethod
+    def jq_compile(cls, filter: str, json_data: dict | list) -> dict:
         """
         It compiles a jq filter and json data into a jq command.
         Parameters
@@ -592,16 +662,27 @@ class Util:
         -------
             A dictionary containing the filtered result, error message if any, and status code.
         """
+        return cls._jq_run(filter, lambda program: program.input_value(json_data).all())
 
-        try:
-            status = 400
-            compiled = jq.compile(filter)
-            status = 421
-            filtered_result = compiled.input(json_data).all()
-        except Exception as error:
-            return {"result": [], "error": str(error), "status": status}
-
-        return {"result": filtered_result, "error": None, "status": 200}
+    @classmethod
+    def jq_compile_many(cls, filters: dict[str, str], json_data: dict | list) -> dict[str, dict]:
+        """
+        It applies several jq filters to the same json data, the data is serialized once.
+        Parameters
+        ----------
+        filters : dict[str, str]
+            The jq filters to be applied, by name.
+        json_data : dict | list
+            The JSON data to be filtered.
+        Returns
+        -------
+            The result of each filter by name, like the ones of `jq_compile`.
+        """
+        json_text = json.dumps(json_data)
+        return {
+            name: cls._jq_run(filter, lambda program: program.input_text(json_text).all())
+            for name, filter in filters.items()
+        }
 
     @staticmethod
     def convert_to_type(value: str) -> str | int | float | bool | None:
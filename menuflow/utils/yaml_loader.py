@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import marshal
+import os
+from pathlib import Path
+from typing import Any
+
+import yaml
+from mautrix.util.logging import TraceLogger
+
+log: TraceLogger = logging.getLogger("menuflow.utils.yaml_loader")
+
+# The C loader of libyaml is much faster, the pure Python one is used if it is not available
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Increase it when the format of the snapshots changes, so the old ones are ignored
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_path(path: Path) -> Path:
+    """Get the path of the snapshot of a YAML file, a hidden file next to it."""
+    return path.with_name(f".{path.name}.snapshot")
+
+
+def _read_snapshot(path: Path) -> tuple[tuple, Any] | None:
+    try:
+        with open(snapshot_path(path), "rb") as file:
+            header = marshal.load(file)
+            if not isinstance(header, tuple) or header[0] != SNAPSHOT_VERSION:
+                return None
+            return header, marshal.load(file)
+    except FileNotFoundError:
+        return None
+    except (EOFError, ValueError, TypeError, IndexError, OSError) as e:
+        log.warning(f"Invalid snapshot of {path}, it will be created again: {e}")
+        return None
+
+
+def _write_snapshot(path: Path, stat: os.stat_result, digest: str, data: Any) -> None:
+    header = (SNAPSHOT_VERSION, stat.st_mtime_ns, stat.st_size, digest)
+    target = snapshot_path(path)
+    tmp = target.with_name(f"{target.name}.tmp")
+    try:
+        with open(tmp, "wb") as file:
+            marshal.dump(header, file)
+            marshal.dump(data, file)
+        os.replace(tmp, target)
+    except ValueError as e:
+        # The data has types that can't be marshalled, like dates
+        log.debug(f"The snapshot of {path} can't be created: {e}")
+        tmp.unlink(missing_ok=True)
+    except OSError as e:
+        log.warning(f"Error writing the snapshot of {path}: {e}")
+
+
+def load_yaml(path: Path | str, use_snapshot: bool = True) -> Any:
+    """Load a YAML file using a binary snapshot of its content.
+
+    The snapshot is used without reading the YAML file if its modification time and size
+    didn't change, or if the hash of the file is the same, e.g. after a touch or a copy.
+    Otherwise, the file is parsed and the snapshot is written again.
+
+    Parameters
+    ----------
+    path : Path | str
+        The path of the YAML file.
+    use_snapshot : bool, optional
+        If False, the file is always parsed and no snapshot is written.
+
+    Returns
+    -------
+        The content of the file. Each call returns a new object.
+    """
+    path = Path(path)
+    if not use_snapshot:
+        with open(path, "rb") as file:
+            return yaml.load(file, Loader=SafeLoader)
+
+    stat = path.stat()
+    snapshot = _read_snapshot(path)
+    if snapshot:
+        (_, mtime_ns, size, digest), data = snapshot
+        if (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size):
+            return data
+
+    content = path.read_bytes()
+    new_digest = hashlib.sha256(content).hexdigest()
+    if snapshot and digest == new_digest:
+        # Same content with a new modification time, only the header is updated
+        _write_snapshot(path, stat, new_digest, data)
+        return data
+
+    log.debug(f"Parsing {path}")
+    data = yaml.load(content, Loader=SafeLoader)
+    _write_snapshot(path, stat, new_digest, data)
+    return data
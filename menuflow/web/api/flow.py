@@ -312,12 +312,12 @@ async def publish_flow(request: web.Request) -> web.Response:
 
     await DBTag.deactivate_tags(flow_id)
     await DBTag.activate_tag(tag_id)
+    await FlowSync.notify_active_tag(flow_id, tag_id)
 
     config: Config = get_config()
     if config["menuflow.load_flow_from"] == "database":
         flow_sync = FlowSync(config)
-        content = await flow_sync.build_active_tag_content(int(tag_id))
-        await flow_sync.update_flow_db_clients(flow_id, content, uuid)
+        await flow_sync.reload_active_tag(flow_id, int(tag_id), uuid)
 
     return resp.success(message=f"Flow published successfully with tag '{name}'", uuid=uuid)
 
@@ -13,16 +13,25 @@ from ...config import Config
 from ...db.flow import Flow as DBFlow
 from ...db.room import Room as DBRoom
 from ...db.route import Route as DBRoute
+from ...email_client import AttachmentCache, EmailClient
 from ...flow_utils import FlowUtils
+from ...http_session import OutboundSession
 from ...jinja.env import jinja_env
+from ...utils.circuit_breaker import CircuitBreakers
 from ...utils.errors import GettingDataError
 from ...utils.flags import RenderFlags
+from ...utils.request_coalescer import RequestCoalescer
+from ...utils.response_cache import ResponseCache
 from ...utils.util import Util as Utils
 from ..base import get_config, get_flow_utils, routes
 from ..docs.misc import (
     check_jinja_template_doc,
+    get_circuit_breakers_doc,
     get_countries_doc,
+    get_email_queues_doc,
     get_email_servers_doc,
+    get_http_cache_doc,
+    get_http_pool_doc,
     get_middlewares_doc,
     get_task_doc,
     render_data_doc,
@@ -258,3 +267,49 @@ async def get_task(request: web.Request) -> web.Response:
             )
     response = {"tasks": task_list}
     return resp.success(log_msg=f"Returning {len(task_list)} tasks", data=response, uuid=trace_id)
+
+
+@routes.get("/v1/mis/http_pool", allow_head=False)
+@UtilWeb.docstring(get_http_pool_doc)
+async def get_http_pool(request: web.Request) -> web.Response:
+    trace_id = UtilWeb.generate_uuid()
+    log.info(f"({trace_id}) -> '{request.method}' '{request.path}' Getting HTTP pool stats")
+
+    return resp.success(data=OutboundSession.pool_stats(), uuid=trace_id)
+
+
+@routes.get("/v1/mis/http_cache", allow_head=False)
+@UtilWeb.docstring(get_http_cache_doc)
+async def get_http_cache(request: web.Request) -> web.Response:
+    trace_id = UtilWeb.generate_uuid()
+    log.info(f"({trace_id}) -> '{request.method}' '{request.path}' Getting HTTP cache stats")
+
+    data = {"nodes": ResponseCache.stats(), "coalesced_requests": RequestCoalescer.coalesced}
+    return resp.success(data=data, uuid=trace_id)
+
+
+@routes.get("/v1/mis/circuit_breakers", allow_head=False)
+@UtilWeb.docstring(get_circuit_breakers_doc)
+async def get_circuit_breakers(request: web.Request) -> web.Response:
+    trace_id = UtilWeb.generate_uuid()
+    log.info(f"({trace_id}) -> '{request.method}' '{request.path}' Getting circuit breakers")
+
+    return resp.success(data={"hosts": CircuitBreakers.stats()}, uuid=trace_id)
+
+
+@routes.get("/v1/mis/email_queues", allow_head=False)
+@UtilWeb.docstring(get_email_queues_doc)
+async def get_email_queues(request: web.Request) -> web.Response:
+    trace_id = UtilWeb.generate_uuid()
+    log.info(f"({trace_id}) -> '{request.method}' '{request.path}' Getting email queues")
+
+    data = {
+        "servers": {
+            server_id: client.stats() for server_id, client in EmailClient.servers.items()
+        },
+        "attachment_cache": {
+            "entries": len(AttachmentCache.entries),
+            "size": AttachmentCache.size,
+        },
+    }
+    return resp.success(data=data, uuid=trace_id)
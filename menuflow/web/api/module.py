@@ -8,6 +8,8 @@ from aiohttp import web
 from ...config import Config
 from ...db.flow import Flow as DBFlow
 from ...db.module import Module as DBModule
+from ...db.tag import Tag as DBTag
+from ...flow_sync import FlowSync
 from ..base import get_config, routes
 from ..docs.module import (
     create_module_doc,
@@ -262,6 +264,13 @@ async def update_module(request: web.Request) -> web.Response:
 
             await module.update()
 
+            # Only the updated module is compiled again if its tag is the active one
+            config: Config = get_config()
+            if "nodes" in new_data and config["menuflow.load_flow_from"] == "database":
+                tag = await DBTag.get_by_id(module.tag_id)
+                if tag and tag.active:
+                    await FlowSync(config).reload_active_tag(flow_id, tag.id, uuid)
+
         except Exception as e:
             return resp.server_error(str(e), uuid)
 
@@ -194,6 +194,7 @@ async def restore_tag(request: web.Request) -> web.Response:
     log.info(f"({uuid}) -> Deleting current_temp tag")
     await DBModule.delete_modules_by_tag(current_tag.id)
     await current_tag.delete()
+    await FlowSync.notify_active_tag(flow_id)
 
     return resp.ok({"message": "Tag restored successfully"}, uuid)
 
@@ -217,14 +218,14 @@ async def publish_tag(request: web.Request) -> web.Response:
 
         await DBTag.deactivate_tags(flow_id)
         await DBTag.activate_tag(tag_id)
+        await FlowSync.notify_active_tag(flow_id, tag_id)
 
         # Restart flow
         config: Config = get_config()
         if config["menuflow.load_flow_from"] == "database":
 
             flow_sync = FlowSync(config)
-            content = await flow_sync.build_active_tag_content(tag_id)
-            await flow_sync.update_flow_db_clients(flow_id, content, uuid)
+            await flow_sync.reload_active_tag(flow_id, tag_id, uuid)
 
         log.info(f"({uuid}) -> Tag {tag_id} published successfully for flow {flow_id}")
         return resp.ok({"message": "Tag published successfully"}, uuid)
@@ -148,3 +148,51 @@ get_task_doc = """
         '200':
             $ref: '#/components/responses/GetTaskSuccess'
 """
+
+get_http_pool_doc = """
+    ---
+    summary: Get the stats of the outbound HTTP connection pool
+    description: Get the connection limits of the pool used by the http_request nodes, the media
+        nodes and the middlewares, and the usage of each upstream host.
+    tags:
+        - Mis
+    responses:
+        '200':
+            description: The limits of the pool and the stats of each host.
+"""
+
+get_http_cache_doc = """
+    ---
+    summary: Get the stats of the response cache of the http_request nodes
+    description: Get the hits, misses, entries and bytes of the cache of each node ID, and the
+        number of requests that were coalesced with an identical request in flight.
+    tags:
+        - Mis
+    responses:
+        '200':
+            description: The stats of the cache of each node.
+"""
+
+get_circuit_breakers_doc = """
+    ---
+    summary: Get the circuit breakers of the upstream hosts
+    description: Get the state, the failure and slow call rates, the retries and the rejected
+        requests of the circuit breaker of each host.
+    tags:
+        - Mis
+    responses:
+        '200':
+            description: The circuit breaker of each host.
+"""
+
+get_email_queues_doc = """
+    ---
+    summary: Get the send queues of the email servers
+    description: Get the queued, sent and failed emails and the retries of each email server,
+        and the size of the attachment cache.
+    tags:
+        - Mis
+    responses:
+        '200':
+            description: The send queue of each email server.
+"""
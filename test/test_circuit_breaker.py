@@ -0,0 +1,95 @@
+"""Tests for the circuit breakers of the upstream hosts."""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.utils.circuit_breaker import (
+    BreakerOptions,
+    BreakerState,
+    CircuitBreakers,
+    CircuitOpenError,
+)
+
+URL = "https://crm.example.com/api/customers"
+
+
+@pytest.fixture(autouse=True)
+def breakers(mocker: MockerFixture):
+    options = BreakerOptions(
+        {
+            "enabled": True,
+            "min_calls": 4,
+            "failure_rate": 0.5,
+            "open_timeout": 0,
+            "max_retries": 2,
+            "retry_backoff": 0,
+            "retry_budget": 0.5,
+        }
+    )
+    mocker.patch.object(CircuitBreakers, "options", options)
+    mocker.patch.object(CircuitBreakers, "breakers", {})
+
+
+def response(status: int) -> SimpleNamespace:
+    return SimpleNamespace(status=status)
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_fails_fast(mocker: MockerFixture):
+    mocker.patch.object(CircuitBreakers.options, "open_timeout", 60)
+    send = AsyncMock(side_effect=ConnectionError("refused"))
+
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            await CircuitBreakers.call(URL, send)
+
+    with pytest.raises(CircuitOpenError):
+        await CircuitBreakers.call(URL, send)
+
+    assert send.await_count == 4
+    assert CircuitBreakers.stats()["crm.example.com"]["state"] == "open"
+    assert CircuitBreakers.stats()["crm.example.com"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_the_breaker():
+    breaker = CircuitBreakers.get(URL)
+    for _ in range(4):
+        breaker.record(failed=True, duration=0.1)
+    assert breaker.state == BreakerState.OPEN
+
+    # The open timeout passed, the next call is a probe
+    assert (await CircuitBreakers.call(URL, AsyncMock(return_value=response(200)))).status == 200
+    assert breaker.state == BreakerState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_retried():
+    for _ in range(4):
+        CircuitBreakers.get(URL).record(failed=False, duration=0.1)
+
+    send = AsyncMock(side_effect=[response(503), response(502), response(200)])
+    assert (await CircuitBreakers.call(URL, send, retry=True)).status == 200
+    assert send.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_retries_are_limited_by_the_budget():
+    send = AsyncMock(return_value=response(503))
+    assert (await CircuitBreakers.call(URL, send, retry=True)).status == 503
+
+    # Two calls in the window allow a single retry
+    assert send.await_count == 2
+    assert CircuitBreakers.stats()["crm.example.com"]["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_calls_are_not_retried_without_retry():
+    send = AsyncMock(return_value=response(500))
+    assert (await CircuitBreakers.call(URL, send)).status == 500
+    send.assert_awaited_once()
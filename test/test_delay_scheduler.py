@@ -0,0 +1,77 @@
+"""Tests for the durable continuation of the delay nodes."""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.db.route import Route, RouteState
+from menuflow.delay_scheduler import DelayScheduler, now_ms
+from menuflow.nodes import Base, Delay
+from menuflow.room import Room
+
+ROOM_ID = "!foo:foo.com"
+
+
+@pytest.mark.asyncio
+async def test_flows_are_resumed_in_order():
+    resumed = []
+    scheduler = DelayScheduler(
+        bot_mxid="@menu:foo.com", resume=AsyncMock(side_effect=resumed.append)
+    )
+    scheduler.start()
+    try:
+        scheduler.schedule("!b:foo.com", now_ms() + 60)
+        scheduler.schedule("!a:foo.com", now_ms() + 20)
+        # Rescheduling replaces the previous wake up
+        scheduler.schedule("!c:foo.com", now_ms() + 10)
+        scheduler.schedule("!c:foo.com", now_ms() + 40)
+        scheduler.schedule("!d:foo.com", now_ms() + 30)
+        scheduler.cancel("!d:foo.com")
+
+        await asyncio.sleep(0.15)
+    finally:
+        scheduler.stop()
+
+    assert resumed == ["!a:foo.com", "!c:foo.com", "!b:foo.com"]
+    assert not scheduler.wake_ups
+
+
+@pytest.mark.asyncio
+async def test_pending_wake_ups_are_loaded(mocker: MockerFixture):
+    mocker.patch.object(Route, "get_delayed", AsyncMock(return_value=[(ROOM_ID, now_ms() - 1000)]))
+    resume = AsyncMock()
+    scheduler = DelayScheduler(bot_mxid="@menu:foo.com", resume=resume)
+
+    await scheduler.load()
+    scheduler.start()
+    await asyncio.sleep(0.01)
+    scheduler.stop()
+
+    resume.assert_awaited_once_with(ROOM_ID)
+
+
+@pytest.mark.asyncio
+async def test_delay_node_writes_the_wake_up_time(base: Base, room: Room):
+    room.matrix_client.delay_scheduler = DelayScheduler(
+        bot_mxid="@menu:foo.com", resume=AsyncMock()
+    )
+    delay = Delay(
+        {"id": "delay-1", "type": "delay", "time": 60, "o_connection": "next"},
+        room=room,
+        default_variables=base.default_variables,
+    )
+
+    await delay.run()
+
+    assert room.route.node_id == "next"
+    assert room.route.state == RouteState.DELAY
+    assert room.route.wake_at >= now_ms() + 59_000
+    assert room.matrix_client.delay_scheduler.wake_ups[ROOM_ID] == room.route.wake_at
+
+    # Leaving the delay state clears the wake up time
+    await room.update_menu(node_id="next", state=None)
+    assert room.route.wake_at is None
@@ -0,0 +1,144 @@
+"""Tests for the send queue and the SMTP connection pool of the email servers."""
+
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from aiosmtplib.errors import SMTPRecipientsRefused, SMTPServerDisconnected
+from pytest_mock import MockerFixture
+
+from menuflow.email_client import Attachment, AttachmentCache, Email, EmailClient, EmailOptions
+
+
+def make_smtp() -> MagicMock:
+    smtp = MagicMock(is_connected=True)
+    smtp.sendmail = AsyncMock()
+    smtp.quit = AsyncMock()
+    return smtp
+
+
+@pytest_asyncio.fixture
+async def client(mocker: MockerFixture):
+    options = EmailOptions({"pool_size": 1, "batch_size": 5, "retry_backoff": 0})
+    mocker.patch.object(EmailClient, "options", options)
+    mocker.patch.object(EmailClient, "http_session", MagicMock())
+    client = EmailClient("smtp-1", "smtp.example.com", 587, "bot@example.com", "secret")
+    smtp = make_smtp()
+    mocker.patch.object(client, "connect", AsyncMock(return_value=smtp))
+    await client.login()
+    client.connect.reset_mock()
+    yield client
+    await client.stop(timeout=1)
+
+
+def make_email(results: list, recipient: str = "foo@example.com") -> Email:
+    async def on_delivery(sent: bool, attempts: int, error: str | None):
+        results.append((sent, attempts, error))
+
+    return Email("Subject", "Hello", [recipient], on_delivery=on_delivery)
+
+
+@pytest.mark.asyncio
+async def test_queued_emails_share_a_connection(client: EmailClient):
+    results = []
+    for _ in range(3):
+        await client.send_email(make_email(results))
+    await client.queue.join()
+
+    assert results == [(True, 1, None)] * 3
+    client.connect.assert_awaited_once()
+    assert client.connect.return_value.sendmail.await_count == 3
+    assert client.stats()["sent"] == 3
+
+
+@pytest.mark.asyncio
+async def test_disconnected_emails_are_retried(client: EmailClient):
+    first, second = make_smtp(), make_smtp()
+    first.sendmail.side_effect = SMTPServerDisconnected("bye")
+    client.connect.side_effect = [first, second]
+    results = []
+
+    await client.send_email(make_email(results))
+    await client.queue.join()
+
+    assert results == [(True, 2, None)]
+    second.sendmail.assert_awaited_once()
+    assert client.stats()["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refused_recipients_are_not_retried(client: EmailClient):
+    smtp = client.connect.return_value
+    smtp.sendmail.side_effect = SMTPRecipientsRefused([])
+    results = []
+
+    await client.send_email(make_email(results, "nobody@example.com"))
+    await client.queue.join()
+
+    assert [(sent, attempts) for sent, attempts, _ in results] == [(False, 1)]
+    assert client.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_attachments_are_downloaded_in_parallel_once():
+    AttachmentCache.clear()
+    urls = [f"https://cdn.example.com/file-{i}.pdf" for i in range(3)]
+    running, max_running = 0, 0
+
+    def get(url: str, raise_for_status: bool):
+        async def read():
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return url.encode()
+
+        response = MagicMock(content_type="application/pdf", read=read)
+        context = MagicMock()
+        context.__aenter__ = AsyncMock(return_value=response)
+        context.__aexit__ = AsyncMock(return_value=False)
+        return context
+
+    http_session = MagicMock(get=MagicMock(side_effect=get))
+    email = Email("Subject", "Hello", ["foo@example.com"], attachments=urls)
+
+    await email.build(http_session)
+    message = await email.build(http_session)
+
+    assert max_running == 3
+    assert http_session.get.call_count == 3
+    assert 'filename="file-2.pdf"' in message
+
+
+def test_attachment_cache_is_bounded(mocker: MockerFixture):
+    AttachmentCache.clear()
+    mocker.patch.object(AttachmentCache, "max_bytes", 10)
+
+    AttachmentCache.put("a", Attachment(b"1234", "text/plain"))
+    AttachmentCache.put("b", Attachment(b"1234", "text/plain"))
+    AttachmentCache.get("a")
+    AttachmentCache.put("c", Attachment(b"1234", "text/plain"))
+    AttachmentCache.put("d", Attachment(b"x" * 11, "text/plain"))
+
+    assert list(AttachmentCache.entries) == ["a", "c"]
+    assert AttachmentCache.size == 8
+
+
+@pytest.mark.asyncio
+async def test_full_queue_reports_a_failed_delivery(mocker: MockerFixture):
+    mocker.patch.object(EmailClient, "options", EmailOptions({"max_queue": 1}))
+    client = EmailClient("smtp-1", "smtp.example.com", 587, "bot@example.com", "secret")
+    results = []
+
+    # Without senders, e.g. while the server is down, the queue is not drained
+    await asyncio.wait_for(client.send_email(make_email(results)), 1)
+    await asyncio.wait_for(client.send_email(make_email(results)), 1)
+
+    assert client.queue.qsize() == 1
+    assert [(sent, attempts) for sent, attempts, _ in results] == [(False, 0)]
+    assert "is full" in results[0][2]
+    assert client.stats()["failed"] == 1
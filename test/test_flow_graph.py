@@ -0,0 +1,52 @@
+"""Tests for the compiled flow graph."""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+
+from menuflow.flow_graph import FlowGraph, MiddlewareSpec
+from menuflow.middlewares import HTTPMiddleware
+from menuflow.nodes import HTTPRequest, Message, Switch
+
+NODES = [
+    {"id": "start", "type": "message", "text": "Hello", "o_connection": "switch-1"},
+    {"id": "switch-1", "type": "switch", "validation": "{{ route.option }}", "cases": []},
+    {"id": "request-1", "type": "http_request", "middleware": "api_jwt", "url": "http://foo"},
+    {"id": "start", "type": "switch", "validation": "repeated", "cases": []},
+    {"id": "unknown-1", "type": "unknown"},
+]
+
+
+def _get_middleware(middleware_id: str) -> SimpleNamespace | None:
+    if middleware_id == "api_jwt":
+        return SimpleNamespace(id="api_jwt", type="jwt")
+
+
+def test_compile_builds_the_id_index():
+    graph = FlowGraph.compile(NODES, get_middleware=_get_middleware)
+
+    assert graph.get("start").cls is Message
+    assert graph.get("start").data is NODES[0]
+    assert graph.get("switch-1").cls is Switch
+    assert graph.get("request-1").cls is HTTPRequest
+    assert graph.get("unknown-1").cls is None
+    assert graph.get("missing") is None
+
+    with pytest.raises(TypeError):
+        graph.by_id["new"] = graph.get("start")
+
+
+def test_compile_resolves_the_middlewares():
+    graph = FlowGraph.compile(NODES, get_middleware=_get_middleware)
+    middleware = graph.get("request-1").middleware
+
+    assert isinstance(middleware, MiddlewareSpec)
+    assert middleware.cls is HTTPMiddleware
+    assert middleware.data_arg == "http_middleware_data"
+
+
+def test_unknown_middlewares_are_not_resolved():
+    graph = FlowGraph.compile(NODES, get_middleware=lambda _: None)
+    assert graph.get("request-1").middleware is None
@@ -0,0 +1,139 @@
+"""Tests for the compiled flows shared across clients."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.config import Config
+from menuflow.db import Module as DBModule
+from menuflow.flow import Flow
+from menuflow.flow_registry import FlowRegistry
+from menuflow.repository import Flow as FlowModel
+
+NODES = [{"id": "start", "type": "message", "text": "Hello"}]
+CONTENT = {
+    "flow_variables": {},
+    "nodes": NODES,
+    "loaded_metadata": {"tag_info": {"name": "v1", "id": 10, "flow_id": 1}},
+}
+
+
+@pytest.fixture(autouse=True)
+def _clear_registry():
+    FlowRegistry.flows.clear()
+    yield
+    FlowRegistry.flows.clear()
+
+
+@pytest.fixture
+def database_config(config: Config) -> Config:
+    config["menuflow.load_flow_from"] = "database"
+    yield config
+    config["menuflow.load_flow_from"] = "yaml"
+
+
+@pytest.mark.asyncio
+async def test_clients_share_the_compiled_flow():
+    flows = [Flow(), Flow()]
+    for flow in flows:
+        await flow.load_flow(content=CONTENT)
+
+    assert flows[0].compiled is not flows[1].compiled
+    assert FlowRegistry.flows[(1, 10)] is flows[1].compiled
+
+    # A bulk reload compiles once and swaps the references
+    compiled = FlowRegistry.from_content(CONTENT)
+    for flow in flows:
+        flow.set_compiled(compiled)
+
+    assert compiled.refs == 2
+    assert flows[0].get_node_by_id("start") is NODES[0]
+
+    flows[0].release()
+    assert (1, 10) in FlowRegistry.flows
+    flows[1].release()
+    assert (1, 10) not in FlowRegistry.flows
+
+
+def _tag(tag_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=tag_id, flow_id=1, name=f"v{tag_id}", flow_vars={})
+
+
+@pytest.fixture
+def modules(mocker: MockerFixture) -> dict[int, DBModule]:
+    """The modules in the database, by id. Their nodes hash is the id of their nodes."""
+    modules: dict[int, DBModule] = {}
+
+    async def get_tag_module_hashes(tag_id: int) -> list[tuple[int, str]]:
+        await asyncio.sleep(0.01)
+        return [
+            (module.id, ",".join(node["id"] for node in module.nodes))
+            for module in modules.values()
+            if module.tag_id == tag_id
+        ]
+
+    async def get_by_ids(ids: list[int]) -> list[DBModule]:
+        return [modules[module_id] for module_id in ids]
+
+    mocker.patch.object(DBModule, "get_tag_module_hashes", side_effect=get_tag_module_hashes)
+    mocker.patch.object(DBModule, "get_by_ids", side_effect=get_by_ids)
+    return modules
+
+
+@pytest.mark.asyncio
+async def test_tag_is_loaded_once(
+    mocker: MockerFixture, database_config: Config, modules: dict[int, DBModule]
+):
+    modules[1] = DBModule(id=1, flow_id=1, tag_id=10, name="main", nodes=NODES)
+    mocker.patch.object(FlowModel, "get_active_tag", AsyncMock(return_value=_tag(10)))
+
+    flows = [Flow() for _ in range(3)]
+    await asyncio.gather(
+        *(
+            flow.load_flow(flow_mxid=f"@menu{i}:foo.com", config=database_config, reload=False)
+            for i, flow in enumerate(flows)
+        )
+    )
+
+    assert DBModule.get_tag_module_hashes.call_count == 1
+    assert flows[0].compiled is flows[1].compiled is flows[2].compiled
+    assert flows[0].compiled.refs == 3
+
+    # An explicit reload loads the tag again
+    await flows[0].load_flow(flow_mxid="@menu0:foo.com", config=database_config)
+    assert DBModule.get_tag_module_hashes.call_count == 2
+    assert flows[0].compiled is not flows[1].compiled
+    assert FlowRegistry.flows[(1, 10)] is flows[0].compiled
+
+
+@pytest.mark.asyncio
+async def test_only_the_changed_modules_are_compiled(modules: dict[int, DBModule]):
+    modules[1] = DBModule(id=1, flow_id=1, tag_id=10, name="main", nodes=NODES)
+    modules[2] = DBModule(
+        id=2, flow_id=1, tag_id=10, name="other", nodes=[{"id": "a", "type": "message"}]
+    )
+    previous = await FlowRegistry.load_tag(_tag(10))
+    assert DBModule.get_by_ids.call_args.args == ([1, 2],)
+
+    # The published tag copies the modules, the second one is changed
+    modules[3] = DBModule(id=3, flow_id=1, tag_id=11, name="main", nodes=NODES)
+    modules[4] = DBModule(
+        id=4, flow_id=1, tag_id=11, name="other", nodes=[{"id": "b", "type": "switch"}]
+    )
+    compiled = await FlowRegistry.load_tag(_tag(11))
+
+    assert DBModule.get_by_ids.call_args.args == ([4],)
+    assert compiled.modules[0].specs is previous.modules[0].specs
+    assert compiled.graph.get("start") is previous.graph.get("start")
+    assert compiled.graph.get("a") is None
+    assert compiled.graph.get("b").type == "switch"
+    assert [node["id"] for node in compiled.data.nodes] == ["start", "b"]
+    assert compiled.data.loaded_metadata["loaded_modules_ids"] == [3, 4]
+
+    # The previous compiled flow is not modified, the runs using it finish with it
+    assert previous.graph.get("a").type == "message"
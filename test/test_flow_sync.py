@@ -0,0 +1,128 @@
+"""Tests for the cached active tag check of the flow sync."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.config import Config
+from menuflow.db.flow import Flow as DBFlow
+from menuflow.db.tag import Tag as DBTag
+from menuflow.flow_sync import FlowSync
+
+MXID = "@menu:foo.com"
+
+
+@pytest.fixture
+def flow_sync(mocker: MockerFixture, config: Config) -> FlowSync:
+    FlowSync.active_tags.clear()
+    flow_sync = FlowSync(config=config)
+    mocker.patch(
+        "menuflow.flow_sync.DBFlow.get_by_mxid", AsyncMock(return_value=SimpleNamespace(id=1))
+    )
+    mocker.patch(
+        "menuflow.flow_sync.DBTag.get_active_tag", AsyncMock(return_value=SimpleNamespace(id=10))
+    )
+    mocker.patch.object(flow_sync, "compile_active_tag", AsyncMock(return_value=None))
+    mocker.patch.object(flow_sync, "update_flow_db_clients", AsyncMock())
+    yield flow_sync
+    FlowSync.active_tags.clear()
+
+
+@pytest.mark.asyncio
+async def test_active_tag_is_cached(flow_sync: FlowSync):
+    loaded_metadata = {"tag_info": {"id": 10}}
+
+    await flow_sync.check_active_tag("!foo:foo.com", MXID, loaded_metadata)
+    await flow_sync.check_active_tag("!foo:foo.com", MXID, loaded_metadata)
+
+    assert DBFlow.get_by_mxid.await_count == 1
+    assert DBTag.get_active_tag.await_count == 1
+    flow_sync.update_flow_db_clients.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_notification_reloads_the_flow(flow_sync: FlowSync):
+    loaded_metadata = {"tag_info": {"id": 10}}
+    await flow_sync.check_active_tag("!foo:foo.com", MXID, loaded_metadata)
+
+    FlowSync._on_active_tag_notification(
+        None, 1, FlowSync.NOTIFY_CHANNEL, json.dumps({"flow_id": 1, "tag_id": 11})
+    )
+    await flow_sync.check_active_tag("!foo:foo.com", MXID, loaded_metadata)
+
+    flow_sync.compile_active_tag.assert_awaited_once_with(11)
+    flow_sync.update_flow_db_clients.assert_awaited_once_with(1, None, None)
+
+
+@pytest.mark.asyncio
+async def test_expired_and_invalidated_entries_are_reloaded(flow_sync: FlowSync):
+    await flow_sync.get_active_tag(MXID)
+
+    FlowSync._on_active_tag_notification(None, 1, FlowSync.NOTIFY_CHANNEL, "not json")
+    assert FlowSync.get_cached_active_tag(MXID) == (1, 10)
+
+    FlowSync.set_active_tag(flow_id=1, tag_id=None)
+    assert FlowSync.get_cached_active_tag(MXID) is None
+
+    await flow_sync.get_active_tag(MXID)
+    FlowSync.ttl = 0
+    try:
+        assert FlowSync.get_cached_active_tag(MXID) is None
+    finally:
+        FlowSync.ttl = 30
+    assert DBTag.get_active_tag.await_count == 2
+
+
+class FakeConnection:
+    def __init__(self):
+        self.termination_listeners = []
+        self.listeners = {}
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+        for callback in self.termination_listeners:
+            callback(self)
+
+
+@pytest.mark.asyncio
+async def test_listener_reconnects_out_of_the_pool(flow_sync: FlowSync, mocker: MockerFixture):
+    connections = [FakeConnection(), FakeConnection()]
+    connect = mocker.patch(
+        "menuflow.flow_sync.asyncpg.connect", AsyncMock(side_effect=connections)
+    )
+    mocker.patch.object(FlowSync, "reconnect_delay", 0)
+    listener = asyncio.create_task(FlowSync.listen_active_tag("postgresql://foo/menuflow"))
+    await asyncio.sleep(0.01)
+    await flow_sync.get_active_tag(MXID)
+
+    connections[0].terminate()
+    await asyncio.sleep(0.01)
+
+    # The notifications sent while disconnected are lost, so the cache is cleared
+    assert FlowSync.get_cached_active_tag(MXID) is None
+    assert connect.await_count == 2
+    assert FlowSync.NOTIFY_CHANNEL in connections[1].listeners
+
+    listener.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await listener
+    assert connections[1].closed
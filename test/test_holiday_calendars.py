@@ -0,0 +1,55 @@
+"""Tests for the cached holiday calendars."""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+
+import holidays
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.utils import Util
+from menuflow.utils.holiday_calendars import HolidayCalendars
+
+
+@pytest.fixture(autouse=True)
+def _clear_calendars():
+    HolidayCalendars.calendars.clear()
+    HolidayCalendars.current_year = 0
+    yield
+    HolidayCalendars.calendars.clear()
+
+
+def test_calendars_are_built_once(mocker: MockerFixture):
+    country_holidays = mocker.spy(holidays, "country_holidays")
+    year = datetime.now().year
+
+    assert Util.is_holiday(date(year, 1, 1), "CO", None)
+    assert not Util.is_holiday(date(year, 1, 2), "CO", None)
+    # The next year is preloaded with the current one
+    assert Util.is_holiday(date(year + 1, 12, 25), "CO", None)
+
+    assert country_holidays.call_count == 1
+    assert HolidayCalendars.get("CO", None, year) is HolidayCalendars.get("CO", None, year + 1)
+
+
+def test_unsupported_countries_are_cached(mocker: MockerFixture):
+    country_holidays = mocker.spy(holidays, "country_holidays")
+
+    assert not Util.is_holiday(date(2020, 1, 1), "XX", None)
+    assert not Util.is_holiday(date(2020, 1, 1), "XX", None)
+    assert country_holidays.call_count == 1
+
+
+def test_calendars_are_bounded_and_reset_on_year_change(mocker: MockerFixture):
+    mocker.patch.object(HolidayCalendars, "max_size", 2)
+    year = datetime.now().year
+
+    HolidayCalendars.get("CO", None, year - 1)
+    HolidayCalendars.get("US", None, year)
+    assert set(HolidayCalendars.calendars) == {("US", None, year), ("US", None, year + 1)}
+
+    HolidayCalendars.get("CO", None, year - 2)
+    HolidayCalendars.current_year = year - 1
+    HolidayCalendars.get("US", None, year)
+    assert ("CO", None, year - 2) not in HolidayCalendars.calendars
@@ -0,0 +1,60 @@
+"""Tests for the outbound HTTP session of the nodes."""
+
+from __future__ import annotations
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from menuflow.config import Config
+from menuflow.http_session import OutboundSession
+
+
+@pytest_asyncio.fixture
+async def server():
+    async def handler(request: web.Request) -> web.Response:
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def outbound_session(config: Config):
+    config["menuflow.http_client"] = {
+        "limit": 10,
+        "limit_per_host": 2,
+        "dns_cache_ttl": 60,
+        "keepalive_timeout": 30,
+    }
+    OutboundSession.stats = {}
+    yield OutboundSession.get(config)
+    await OutboundSession.close()
+
+
+@pytest.mark.asyncio
+async def test_session_is_shared_and_configured(config: Config, outbound_session):
+    assert OutboundSession.get(config) is outbound_session
+    assert outbound_session.connector.limit == 10
+    assert outbound_session.connector.limit_per_host == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_per_host(server: TestServer, outbound_session):
+    for _ in range(3):
+        async with outbound_session.get(server.make_url("/")) as response:
+            assert response.status == 200
+
+    stats = OutboundSession.pool_stats()
+    host_stats = stats["hosts"][f"{server.host}:{server.port}"]
+    assert stats["limit_per_host"] == 2
+    assert host_stats["requests"] == 3
+    assert host_stats["in_flight"] == 0
+    assert host_stats["utilization"] == 0
+    assert host_stats["connections_created"] == 1
+    assert host_stats["connections_reused"] == 2
@@ -0,0 +1,48 @@
+import re
+
+import pytest
+
+from menuflow.utils.matchers import UserMatcher, compile_pattern
+
+PATTERNS = [
+    "@whatsappbot:example.com",
+    "@admin:example.com",
+    "^@acd[0-9]+:.+$",
+    "^@(?P<user_prefix>.+)_(?P<customer_phone>[0-9]{8,}):.+$",
+]
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        PATTERNS,
+        # Repeated group names can't be combined in a single regex
+        PATTERNS + ["^@(?P<user_prefix>.+)bot:.+$"],
+        [],
+    ],
+)
+@pytest.mark.parametrize(
+    "mxid",
+    [
+        "@whatsappbot:example.com",
+        "@whatsappbot:example.com.co",
+        "@admin:exampleXcom",
+        "@acd12:example.com",
+        "@whatsapp_573001234567:example.com",
+        "@customer:example.com",
+    ],
+)
+def test_user_matcher_matches_like_the_patterns(patterns: list[str], mxid: str):
+    expected = any(re.match(pattern, mxid) for pattern in patterns)
+    assert UserMatcher.from_patterns(patterns).match(mxid) == expected
+
+
+def test_user_matcher_is_compiled_once_per_patterns():
+    matcher = UserMatcher.from_patterns(PATTERNS)
+    assert UserMatcher.from_patterns(list(PATTERNS)) is matcher
+    assert UserMatcher.from_patterns(PATTERNS[:2]) is not matcher
+    assert matcher.exact == {"@whatsappbot:example.com", "@admin:example.com"}
+
+
+def test_compile_pattern_is_cached():
+    assert compile_pattern(PATTERNS[2]) is compile_pattern(PATTERNS[2])
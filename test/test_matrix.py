@@ -0,0 +1,40 @@
+"""Tests for the flow algorithm of the matrix handler."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from menuflow.matrix import MatrixHandler
+from menuflow.repository.room_events import RoomEvents
+from menuflow.room import Room
+
+
+@pytest.mark.asyncio
+async def test_deferred_route_writes_are_flushed_when_the_run_is_cancelled(room: Room):
+    room.room_events = RoomEvents()
+    handler = MatrixHandler.__new__(MatrixHandler)
+    handler.log = logging.getLogger("menuflow.test")
+    handler._mxid = "@menu:foo.com"
+    handler.LOCKED_ROOMS = set()
+    handler.MAX_NODE_ATTEMPTS = 5
+    handler.flow_sync = MagicMock(check_active_tag=AsyncMock())
+
+    async def run():
+        await room.update_menu(node_id="switch-1")
+        raise asyncio.CancelledError
+
+    node = MagicMock(id="set-vars-1", run=AsyncMock(side_effect=run))
+    flow = handler.flow = MagicMock()
+    flow.snapshot.return_value.node.return_value = node
+    flow.snapshot.return_value.is_pure_node.return_value = True
+
+    with pytest.raises(asyncio.CancelledError):
+        await handler.algorithm(room=room)
+
+    # The pending route was written, and the next writes of the room are not deferred
+    room.route.update.assert_awaited_once()
+    assert not room.defer_route_writes
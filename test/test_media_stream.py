@@ -0,0 +1,55 @@
+"""Tests for the spooled download of the media."""
+
+from __future__ import annotations
+
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from menuflow.utils.media_stream import Base64Decoder, MediaTooLargeError, SpooledMedia
+
+
+def make_response(*chunks: bytes) -> SimpleNamespace:
+    async def iter_chunked(size: int):
+        for chunk in chunks:
+            yield chunk
+
+    return SimpleNamespace(content=SimpleNamespace(iter_chunked=iter_chunked))
+
+
+def test_base64_decoder_splits_the_chunks_anywhere():
+    data = bytes(range(256)) * 10
+    encoded = b'"' + base64.encodebytes(data) + b'"'
+    decoder = Base64Decoder()
+
+    decoded = b"".join(decoder.feed(encoded[i : i + 7]) for i in range(0, len(encoded), 7))
+
+    assert decoded + decoder.flush() == data
+
+
+@pytest.mark.asyncio
+async def test_large_media_are_spooled_to_disk():
+    with await SpooledMedia.from_response(
+        make_response(b"a" * 3000, b"b" * 3000),
+        base64_encoded=False,
+        max_size=10000,
+        max_memory=1024,
+    ) as media:
+        assert media.size == 6000
+        assert media.header == b"a" * 3000 + b"b" * 1096
+        assert media.file._rolled
+        assert (
+            b"".join([chunk async for chunk in media.iter_chunks()]) == b"a" * 3000 + b"b" * 3000
+        )
+
+
+@pytest.mark.asyncio
+async def test_download_stops_at_the_max_size():
+    with pytest.raises(MediaTooLargeError):
+        await SpooledMedia.from_response(
+            make_response(b"a" * 600, b"b" * 600),
+            base64_encoded=False,
+            max_size=1000,
+            max_memory=1024,
+        )
@@ -0,0 +1,124 @@
+"""Tests for the durable copy of the room message queues."""
+
+from __future__ import annotations
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from mautrix.types import MessageEvent
+from pytest_mock import MockerFixture
+
+from menuflow.db.message_queue import MessageQueue as DBMessageQueue
+from menuflow.message_store import MessageStore
+
+ROOM_ID = "!foo:foo.com"
+BOT_MXID = "@menu:foo.com"
+
+
+def _message(event_id: str) -> MessageEvent:
+    return MessageEvent.deserialize(
+        {
+            "type": "m.room.message",
+            "room_id": ROOM_ID,
+            "event_id": event_id,
+            "sender": "@customer:foo.com",
+            "origin_server_ts": 1,
+            "content": {"msgtype": "m.text", "body": "hello"},
+        }
+    )
+
+
+@pytest.fixture
+def db(mocker: MockerFixture) -> dict[str, AsyncMock]:
+    return {
+        method: mocker.patch.object(DBMessageQueue, method, new_callable=AsyncMock)
+        for method in ("insert_many", "delete_many", "delete_by_rooms", "get_by_bot_mxid")
+    }
+
+
+@pytest.fixture
+def store() -> MessageStore:
+    return MessageStore(bot_mxid=BOT_MXID, flush_interval=60)
+
+
+@pytest.mark.asyncio
+async def test_messages_are_written_in_batches(store: MessageStore, db: dict[str, AsyncMock]):
+    store.append(ROOM_ID, _message("$1"))
+    store.append(ROOM_ID, _message("$2"))
+    await store.flush()
+
+    db["insert_many"].assert_awaited_once()
+    messages = db["insert_many"].call_args.kwargs["messages"]
+    assert [message.event_id for message in messages] == ["$1", "$2"]
+
+    store.ack(ROOM_ID, "$1")
+    await store.flush()
+    db["delete_many"].assert_awaited_once_with(bot_mxid=BOT_MXID, events=[(ROOM_ID, "$1")])
+
+
+@pytest.mark.asyncio
+async def test_consumed_messages_are_not_written(store: MessageStore, db: dict[str, AsyncMock]):
+    store.append(ROOM_ID, _message("$1"))
+    store.ack(ROOM_ID, "$1")
+    # Messages that were never enqueued are ignored
+    store.ack(ROOM_ID, "$unknown")
+    await store.flush()
+
+    db["insert_many"].assert_not_called()
+    db["delete_many"].assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_discard_drops_the_room_queue(store: MessageStore, db: dict[str, AsyncMock]):
+    store.append(ROOM_ID, _message("$1"))
+    await store.flush()
+
+    store.append(ROOM_ID, _message("$2"))
+    store.discard(ROOM_ID)
+    await store.flush()
+
+    db["insert_many"].assert_awaited_once()
+    db["delete_by_rooms"].assert_awaited_once_with(bot_mxid="@menu:foo.com", room_ids=[ROOM_ID])
+
+
+@pytest.mark.asyncio
+async def test_failed_writes_are_retried(store: MessageStore, db: dict[str, AsyncMock]):
+    db["insert_many"].side_effect = [ConnectionError("Database unavailable"), None]
+
+    store.append(ROOM_ID, _message("$1"))
+    await store.flush()
+    await store.flush()
+
+    assert db["insert_many"].await_count == 2
+    assert db["insert_many"].call_args.kwargs["messages"][0].event_id == "$1"
+
+
+@pytest.mark.asyncio
+async def test_load_restores_the_messages(store: MessageStore, db: dict[str, AsyncMock]):
+    db["get_by_bot_mxid"].return_value = [
+        DBMessageQueue(
+            room_id=ROOM_ID,
+            bot_mxid="@menu:foo.com",
+            event_id=event_id,
+            event=_message(event_id).serialize(),
+        )
+        for event_id in ("$1", "$2")
+    ]
+
+    messages = await store.load()
+
+    assert [message.event_id for message in messages[ROOM_ID]] == ["$1", "$2"]
+    store.ack(ROOM_ID, "$1")
+    await store.flush()
+    db["delete_many"].assert_awaited_once_with(bot_mxid=BOT_MXID, events=[(ROOM_ID, "$1")])
+
+
+@pytest.mark.asyncio
+async def test_deletes_only_touch_the_copy_of_the_bot(mocker: MockerFixture):
+    database = mocker.patch.object(DBMessageQueue, "db", MagicMock(executemany=AsyncMock()))
+
+    await DBMessageQueue.delete_many(bot_mxid=BOT_MXID, events=[(ROOM_ID, "$1")])
+
+    query, args = database.executemany.call_args.args
+    assert "bot_mxid = $1" in query
+    assert args == [(BOT_MXID, ROOM_ID, "$1")]
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from menuflow.nodes import Base, CheckTime
+
+CONTENT = {
+    "id": "check-time-1",
+    "type": "check_time",
+    "timezone": "America/Bogota",
+    "time_ranges": ["08:00-12:00", "13:00-18:00"],
+    "days_of_week": ["mon-fri"],
+    "days_of_month": ["1-15", "20-20"],
+    "months": ["jan-mar", "dec-dec"],
+    "cases": [{"id": "True", "o_connection": "open"}, {"id": "False", "o_connection": "closed"}],
+}
+
+
+@pytest.fixture
+def check_time(base: Base) -> CheckTime:
+    return CheckTime(CONTENT, room=base.room, default_variables=base.default_variables)
+
+
+def _legacy(node: CheckTime, now: datetime) -> bool:
+    return (
+        node.check_month(now.month)
+        and node.check_month_days(now.day)
+        and node.check_week_day(now.strftime("%a").lower())
+        and node.check_hours(now.time())
+    )
+
+
+def test_static_schedule_is_compiled(check_time: CheckTime):
+    compiled = CheckTime.compile_content(CONTENT)
+    assert compiled["schedule"] is not None
+    assert check_time.schedule is check_time.compiled["schedule"]
+
+
+def test_schedule_matches_the_field_checks(check_time: CheckTime):
+    schedule = check_time.schedule
+    now = datetime(2024, 1, 1, 0, 0, 30)
+    # Every 7 hours and 13 minutes during more than a year
+    for _ in range(1300):
+        assert schedule.contains(now) == _legacy(check_time, now), now
+        now += timedelta(hours=7, minutes=13)
+
+
+@pytest.mark.asyncio
+async def test_templated_schedule_is_rendered(base: Base):
+    content = CONTENT | {"time_ranges": "{{ route.time_ranges }}"}
+    node = CheckTime(content, room=base.room, default_variables=base.default_variables)
+    assert "schedule" not in node.compiled
+
+    await node.room.set_variable("route.time_ranges", ["00:00-23:59"])
+    schedule = node.schedule
+    assert schedule.contains(datetime(2024, 1, 2, 10, 0))
+
+    # The parsed schedules are cached
+    assert node.schedule is schedule
+
+
+def test_invalid_schedule_uses_the_field_checks(base: Base):
+    node = CheckTime(
+        CONTENT | {"days_of_week": ["monday"]},
+        room=base.room,
+        default_variables=base.default_variables,
+    )
+    assert node.schedule is None
+    with pytest.raises(ValueError):
+        node.check_week_day("mon")
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from unittest.mock import AsyncMock, MagicMock
+
+import jq
+import pytest
+import pytest_asyncio
+from pytest_mock import MockerFixture
+
+from menuflow.config import Config
+from menuflow.db import Route
+from menuflow.nodes import HTTPRequest
+from menuflow.room import Room
+from menuflow.utils import Util
+from menuflow.utils.circuit_breaker import BreakerOptions, CircuitBreakers
+from menuflow.utils.request_coalescer import RequestCoalescer
+from menuflow.utils.response_cache import ResponseCache
+
+NODE = {
+    "id": "request-1",
+    "type": "http_request",
+    "method": "GET",
+    "url": "https://catalog.example.com/items",
+    "query_params": {"category": "{{ route.category }}"},
+    "variables": {"item_name": ".items[0].name"},
+    "cache": {"ttl": 60, "max_entries": 2},
+    "cases": [{"id": 200, "o_connection": "m1"}, {"id": "default", "o_connection": "m2"}],
+}
+
+
+def make_response(data: dict, status: int = 200, content_length: int | None = None) -> MagicMock:
+    body = json.dumps(data).encode()
+
+    async def iter_chunked(size: int):
+        for start in range(0, len(body), size):
+            yield body[start : start + size]
+
+    response = MagicMock(status=status, content_length=content_length)
+    response.charset = "utf-8"
+    response.content_type = "application/json"
+    response.content.iter_chunked = iter_chunked
+    response.__aenter__ = AsyncMock(return_value=response)
+    response.__aexit__ = AsyncMock(return_value=None)
+    return response
+
+
+@pytest_asyncio.fixture
+async def request_mock(mocker: MockerFixture, config: Config) -> MagicMock:
+    ResponseCache.stores = {}
+    session = MagicMock()
+    session.request = MagicMock(return_value=make_response({"items": [{"name": "Pizza"}]}))
+    mocker.patch.object(HTTPRequest, "session", session, create=True)
+    mocker.patch.object(HTTPRequest, "config", config, create=True)
+    return session.request
+
+
+def http_request(room: Room, content: dict = NODE) -> HTTPRequest:
+    return HTTPRequest(content, room=room, default_variables={})
+
+
+class TestResponseCache:
+    @pytest.mark.asyncio
+    async def test_repeated_requests_use_the_cache(self, room: Room, request_mock: MagicMock):
+        await room.set_variable("route.category", "food")
+
+        for _ in range(3):
+            status, _, o_connection = await http_request(room).make_request()
+            assert (status, o_connection) == (200, "m1")
+            assert await room.get_variable("route.item_name") == "Pizza"
+
+        request_mock.assert_called_once()
+        assert ResponseCache.stats()["request-1"]["hits"] == 2
+        assert ResponseCache.stats()["request-1"]["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_rendered_params_are_part_of_the_key(self, room: Room, request_mock: MagicMock):
+        for category in ("food", "drinks", "drinks", "toys", "food"):
+            await room.set_variable("route.category", category)
+            await http_request(room).make_request()
+
+        # The least recently used entry is evicted when there are more than max_entries
+        assert request_mock.call_count == 4
+        assert ResponseCache.stats()["request-1"]["entries"] == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_are_not_cached(self, room: Room, request_mock: MagicMock):
+        request_mock.return_value = make_response({"error": "Unavailable"}, status=503)
+
+        for _ in range(2):
+            assert (await http_request(room).make_request())[0] == 503
+
+        assert request_mock.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_nodes_without_cache(self, room: Room, request_mock: MagicMock):
+        content = {key: value for key, value in NODE.items() if key != "cache"}
+
+        for _ in range(2):
+            await http_request(room, content).make_request()
+
+        assert request_mock.call_count == 2
+        assert not ResponseCache.stats()
+
+    @pytest.mark.asyncio
+    async def test_cookies_are_not_shared_between_rooms(
+        self, room: Room, route: Route, request_mock: MagicMock
+    ):
+        content = {**NODE, "cookies": {"session": ""}}
+        request_mock.return_value.cookies = SimpleCookie("session=alice")
+        other_room = Room(room_id="!bar:foo.com")
+        other_room.matrix_client = room.matrix_client
+        other_room.route = Route(
+            room=2, node_id="start", client="@foo:foo.com", variables={"route": {}}
+        )
+        other_room.config = room.config
+
+        await http_request(room, content).make_request()
+        await http_request(other_room, content).make_request()
+
+        request_mock.assert_called_once()
+        assert "session=alice" in await room.get_variable("route.session")
+        assert await other_room.get_variable("route.item_name") == "Pizza"
+        assert await other_room.get_variable("route.session") is None
+
+    @pytest.mark.asyncio
+    async def test_credentials_are_part_of_the_key(self, room: Room, request_mock: MagicMock):
+        content = {**NODE, "headers": {"Authorization": "Bearer {{ route.token }}"}}
+
+        for token in ("alice", "bob", "alice"):
+            await room.set_variable("route.token", token)
+            await http_request(room, content).make_request()
+
+        assert request_mock.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_nodes_with_middleware_need_vary_by(self, room: Room, request_mock: MagicMock):
+        for vary_by, calls in (([], 2), (["{{ route.customer }}"], 1)):
+            ResponseCache.stores = {}
+            request_mock.reset_mock()
+            content = {**NODE, "cache": {**NODE["cache"], "vary_by": vary_by}}
+            for _ in range(2):
+                node = http_request(room, content)
+                node.middleware = MagicMock()
+                await node.make_request()
+
+            assert request_mock.call_count == calls
+
+
+class TestCoalescing:
+    @pytest_asyncio.fixture
+    async def slow_request_mock(self, request_mock: MagicMock) -> MagicMock:
+        response = request_mock.return_value
+
+        async def slow_enter():
+            await asyncio.sleep(0.05)
+            return response
+
+        response.__aenter__ = AsyncMock(side_effect=slow_enter)
+        return request_mock
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(
+        self, room: Room, slow_request_mock: MagicMock
+    ):
+        content = {**NODE, "cache": None, "coalesce": True}
+
+        results = await asyncio.gather(
+            *(http_request(room, content).make_request() for _ in range(5))
+        )
+
+        slow_request_mock.assert_called_once()
+        assert all(result[:1] == (200,) for result in results)
+        assert await room.get_variable("route.item_name") == "Pizza"
+        assert not RequestCoalescer.in_flight
+
+    @pytest.mark.asyncio
+    async def test_requests_with_cookies_are_not_coalesced(
+        self, room: Room, slow_request_mock: MagicMock
+    ):
+        content = {**NODE, "cache": None, "coalesce": True, "cookies": {"session": ""}}
+        slow_request_mock.return_value.cookies = SimpleCookie("session=alice")
+
+        await asyncio.gather(*(http_request(room, content).make_request() for _ in range(3)))
+
+        assert slow_request_mock.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_requests_with_other_credentials_are_not_coalesced(
+        self, room: Room, slow_request_mock: MagicMock
+    ):
+        def node(token: str, middleware: bool = False, key: str | None = None) -> HTTPRequest:
+            coalesce = {"key": key} if key else True
+            content = {**NODE, "cache": None, "coalesce": coalesce, "headers": {"X-Token": token}}
+            request = http_request(room, content)
+            request.middleware = MagicMock() if middleware else None
+            return request
+
+        await asyncio.gather(node("alice").make_request(), node("bob").make_request())
+        assert slow_request_mock.call_count == 2
+
+        await asyncio.gather(*(node("alice", middleware=True).make_request() for _ in range(2)))
+        assert slow_request_mock.call_count == 4
+
+        await asyncio.gather(
+            *(node("alice", middleware=True, key="catalog").make_request() for _ in range(2))
+        )
+        assert slow_request_mock.call_count == 5
+
+    @pytest.mark.asyncio
+    async def test_big_responses_are_not_shared(self, room: Room, slow_request_mock: MagicMock):
+        content = {**NODE, "cache": None, "coalesce": {"max_response_bytes": 10}}
+
+        await asyncio.gather(*(http_request(room, content).make_request() for _ in range(3)))
+
+        assert slow_request_mock.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared(self):
+        fetch = AsyncMock(side_effect=ValueError("Unavailable"))
+
+        async def slow_fetch():
+            await asyncio.sleep(0.01)
+            return await fetch()
+
+        results = await asyncio.gather(
+            *(RequestCoalescer.run("key", slow_fetch, max_bytes=10) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+        fetch.assert_awaited_once()
+        assert all(isinstance(result, ValueError) for result in results)
+
+
+class TestCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_open_breaker_fails_fast(
+        self, room: Room, request_mock: MagicMock, mocker: MockerFixture
+    ):
+        mocker.patch.object(CircuitBreakers, "options", BreakerOptions({"enabled": True}))
+        mocker.patch.object(CircuitBreakers, "breakers", {})
+        CircuitBreakers.get(NODE["url"])._open(now=time.monotonic(), reason="test")
+
+        content = {**NODE, "cache": None}
+        status, _, o_connection = await http_request(room, content).make_request()
+
+        assert (status, o_connection) == (503, "m2")
+        request_mock.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_node_errors_are_not_host_failures(
+        self, room: Room, request_mock: MagicMock, mocker: MockerFixture
+    ):
+        options = BreakerOptions(
+            {"enabled": True, "min_calls": 2, "max_retries": 2, "retry_backoff": 0}
+        )
+        mocker.patch.object(CircuitBreakers, "options", options)
+        mocker.patch.object(CircuitBreakers, "breakers", {})
+        content = {**NODE, "cache": None, "max_body_size": 20}
+        request_mock.return_value = make_response({"items": [{"name": "Pizza" * 10}]})
+
+        for _ in range(3):
+            assert (await http_request(room, content).make_request())[0] == 413
+
+        # Neither retried nor counted as failures, the breaker stays closed for the other nodes
+        assert request_mock.call_count == 3
+        stats = CircuitBreakers.stats()["catalog.example.com"]
+        assert (stats["state"], stats["failure_rate"], stats["retries"]) == ("closed", 0, 0)
+
+
+class TestBodySize:
+    @pytest.mark.asyncio
+    async def test_big_bodies_go_to_the_413_case(self, room: Room, request_mock: MagicMock):
+        content = {
+            **NODE,
+            "cache": None,
+            "max_body_size": 20,
+            "cases": [{"id": 413, "o_connection": "too-big"}, *NODE["cases"]],
+        }
+        request_mock.return_value = make_response({"items": [{"name": "Pizza" * 10}]})
+
+        status, _, o_connection = await http_request(room, content).make_request()
+        assert (status, o_connection) == (413, "too-big")
+
+    @pytest.mark.asyncio
+    async def test_the_content_length_is_checked_first(self, room: Room, request_mock: MagicMock):
+        content = {**NODE, "cache": None, "max_body_size": 20}
+        request_mock.return_value = make_response({}, content_length=10**9)
+
+        status, _, o_connection = await http_request(room, content).make_request()
+        assert (status, o_connection) == (413, "m2")
+
+    @pytest.mark.asyncio
+    async def test_non_json_bodies_are_kept_as_text(self, room: Room, request_mock: MagicMock):
+        response = make_response({"items": []})
+        response.content_type = "text/plain"
+        request_mock.return_value = response
+
+        status, text, _ = await http_request(room, {**NODE, "cache": None}).make_request()
+        assert (status, text) == (200, '{"items": []}')
+
+
+class TestJq:
+    def test_programs_and_errors_are_compiled_once(self, mocker: MockerFixture):
+        Util.compile_jq.cache_clear()
+        jq_compile = mocker.spy(jq, "compile")
+
+        for _ in range(3):
+            assert Util.jq_compile(".items[0].name", {"items": [{"name": "Pizza"}]}) == {
+                "result": ["Pizza"],
+                "error": None,
+                "status": 200,
+            }
+            assert Util.jq_compile(".items[", {})["status"] == 400
+
+        assert jq_compile.call_count == 2
+
+    def test_several_programs_are_applied_to_the_same_data(self):
+        results = Util.jq_compile_many(
+            {"name": ".items[0].name", "total": ".items | length", "invalid": ".[", "bad": {}},
+            {"items": [{"name": "Pizza"}, {"name": "Pasta"}]},
+        )
+
+        assert results["name"]["result"] == ["Pizza"]
+        assert results["total"]["result"] == [2]
+        assert results["invalid"]["status"] == 400
+        assert results["bad"]["status"] == 400
@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import nest_asyncio
+import pytest
+from pytest_mock import MockerFixture
+
+from menuflow.nodes import InviteUser
+from menuflow.room import Room
+
+nest_asyncio.apply()
+
+
+@pytest.fixture
+def invite_user(room: Room) -> InviteUser:
+    invite_node_data = {
+        "id": "invite-1",
+        "type": "invite_user",
+        "invitee": "@agent:foo.com",
+        "timeout": 0.2,
+        "cases": [
+            {"id": "join", "o_connection": "joined"},
+            {"id": "reject", "o_connection": "rejected"},
+            {"id": "timeout", "o_connection": "timed-out"},
+        ],
+    }
+    room.matrix_client.kick_user = AsyncMock()
+    return InviteUser(invite_node_data, room=room, default_variables={})
+
+
+class TestInviteUserNode:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("joined, case_id", [(True, "join"), (False, "reject")])
+    async def test_check_agent_join_resolved(
+        self, invite_user: InviteUser, mocker: MockerFixture, joined: bool, case_id: str
+    ):
+        update_menu = mocker.patch.object(InviteUser, "_update_menu", side_effect=AsyncMock())
+        pending_invite = asyncio.get_running_loop().create_future()
+        invite_user.room.pending_invites[invite_user.room.room_id] = pending_invite
+
+        task = asyncio.create_task(invite_user.check_agent_join(pending_invite))
+        await asyncio.sleep(0)
+        pending_invite.set_result(joined)
+        await asyncio.wait_for(task, timeout=0.1)
+
+        update_menu.assert_called_once_with(case_id)
+        invite_user.room.matrix_client.kick_user.assert_not_called()
+        assert invite_user.room.room_id not in invite_user.room.pending_invites
+
+    @pytest.mark.asyncio
+    async def test_check_agent_join_timeout(self, invite_user: InviteUser, mocker: MockerFixture):
+        update_menu = mocker.patch.object(InviteUser, "_update_menu", side_effect=AsyncMock())
+        pending_invite = asyncio.get_running_loop().create_future()
+        invite_user.room.pending_invites[invite_user.room.room_id] = pending_invite
+
+        await invite_user.check_agent_join(pending_invite)
+
+        assert pending_invite.result() is False
+        update_menu.assert_called_once_with("timeout")
+        invite_user.room.matrix_client.kick_user.assert_called_once_with(
+            invite_user.room.room_id, "@agent:foo.com"
+        )
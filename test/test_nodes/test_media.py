@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import base64
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+import pytest_asyncio
+from pytest_mock import MockerFixture
+
+from menuflow.config import Config
+from menuflow.db.media_cache import MediaCache
+from menuflow.nodes import Media
+from menuflow.room import Room
+
+NODE = {
+    "id": "media-1",
+    "type": "media",
+    "message_type": "m.file",
+    "text": "Our catalog",
+    "url": "https://cdn.example.com/catalog.pdf",
+    "info": {"mimetype": "application/pdf"},
+}
+DATA = b"%PDF-1.4 catalog"
+
+
+def make_response(status: int = 200, headers: dict | None = None, body: bytes = DATA) -> MagicMock:
+    async def iter_chunked(size: int):
+        for start in range(0, len(body), size):
+            yield body[start : start + size]
+
+    response = MagicMock(status=status, content_length=len(body))
+    response.headers = {"Content-Type": "application/pdf", **(headers or {})}
+    response.content.iter_chunked = iter_chunked
+    return response
+
+
+@pytest_asyncio.fixture
+async def media_cache(mocker: MockerFixture, room: Room, config: Config) -> dict[str, MediaCache]:
+    """The media cache table, in memory."""
+    rows: dict[str, MediaCache] = {}
+
+    async def upsert(self: MediaCache) -> None:
+        rows[self.url] = self
+
+    async def get_by_content_hash(content_hash: str) -> MediaCache | None:
+        return next((row for row in rows.values() if row.content_hash == content_hash), None)
+
+    mocker.patch.object(MediaCache, "upsert", upsert)
+    mocker.patch.object(MediaCache, "touch", AsyncMock())
+    mocker.patch.object(MediaCache, "evict", AsyncMock())
+    mocker.patch.object(MediaCache, "get_by_url", AsyncMock(side_effect=rows.get))
+    mocker.patch.object(MediaCache, "get_by_content_hash", get_by_content_hash)
+
+    session = MagicMock()
+    session.get = AsyncMock(return_value=make_response(headers={"ETag": '"v1"'}))
+    mocker.patch.object(Media, "session", session, create=True)
+    mocker.patch.object(Media, "config", config, create=True)
+    uploads = []
+
+    async def upload_media(data, mime_type: str, size: int) -> str:
+        # The chunks are read while uploading, the spooled file is closed afterwards
+        uploads.append(b"".join([chunk async for chunk in data]))
+        return "mxc://foo.com/catalog"
+
+    room.matrix_client.upload_media = AsyncMock(side_effect=upload_media)
+    room.matrix_client.uploads = uploads
+    return rows
+
+
+def media(room: Room, url: str = NODE["url"]) -> Media:
+    return Media({**NODE, "url": url}, room=room, default_variables={})
+
+
+class TestMediaCache:
+    @pytest.mark.asyncio
+    async def test_media_is_uploaded_once(self, room: Room, media_cache: dict):
+        content = await media(room).load_media()
+
+        assert content.url == "mxc://foo.com/catalog"
+        assert content.info.size == len(DATA)
+        room.matrix_client.upload_media.assert_awaited_once()
+        assert room.matrix_client.upload_media.call_args.kwargs == {
+            "mime_type": "application/pdf",
+            "size": len(DATA),
+        }
+        assert room.matrix_client.uploads == [DATA]
+        assert media_cache[NODE["url"]].etag == '"v1"'
+
+        # Fresh entries are used without downloading the media
+        assert (await media(room).load_media()).url == "mxc://foo.com/catalog"
+        media(room).session.get.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_same_content_from_another_url_is_not_uploaded(
+        self, room: Room, media_cache: dict
+    ):
+        await media(room).load_media()
+        content = await media(room, "https://cdn.example.com/copy.pdf").load_media()
+
+        assert content.url == "mxc://foo.com/catalog"
+        room.matrix_client.upload_media.assert_awaited_once()
+        assert set(media_cache) == {NODE["url"], "https://cdn.example.com/copy.pdf"}
+
+    @pytest.mark.asyncio
+    async def test_stale_entries_are_revalidated(self, room: Room, media_cache: dict):
+        await media(room).load_media()
+        media_cache[NODE["url"]].validated_at = 0
+        session = media(room).session
+        session.get.return_value = make_response(status=304)
+
+        assert (await media(room).load_media()).url == "mxc://foo.com/catalog"
+        assert session.get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+        MediaCache.touch.assert_awaited_once_with(validated=True)
+        room.matrix_client.upload_media.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_error_responses_are_not_uploaded(self, room: Room, media_cache: dict):
+        media(room).session.get.return_value = make_response(status=404)
+
+        assert await media(room).load_media() is None
+        room.matrix_client.upload_media.assert_not_awaited()
+        assert not media_cache
+
+
+class TestMediaStream:
+    @pytest.mark.asyncio
+    async def test_base64_media_is_decoded_while_downloading(self, room: Room, media_cache: dict):
+        body = b'"' + base64.b64encode(DATA * 5000) + b'"'
+        media(room).session.get.return_value = make_response(
+            headers={"Content-Type": "application/json"}, body=body
+        )
+
+        content = await media(room).load_media()
+
+        assert content.info.size == len(DATA) * 5000
+        assert room.matrix_client.uploads == [DATA * 5000]
+
+    @pytest.mark.asyncio
+    async def test_media_bigger_than_the_max_size_is_not_uploaded(
+        self, room: Room, media_cache: dict, mocker: MockerFixture
+    ):
+        mocker.patch.dict(Media.config["menuflow.media"], {"max_size": 1024})
+        media(room).session.get.return_value = make_response(body=b"x" * 2048)
+
+        assert await media(room).load_media() is None
+        room.matrix_client.upload_media.assert_not_awaited()
+        assert not media_cache
@@ -65,3 +65,41 @@ class TestSwitchNode:
     async def test_get_case_by_id(self, switch: Switch):
         assert await switch.get_case_by_id("ok") == "request-1"
         assert await switch.get_case_by_id("ko") == "request-1"
+
+    @pytest.mark.asyncio
+    async def test_validate_cases_stops_at_the_first_match(self, switch: Switch):
+        content = {
+            "id": "switch-2",
+            "type": "switch",
+            "cases": [
+                {"case": "{{ 1 == 2 }}", "o_connection": "m1"},
+                {"case": "{{ 1 == 1 }}", "o_connection": "m2"},
+                {"case": "{{ undefined_function() }}", "o_connection": "m3"},
+                {"id": "default", "o_connection": "m4"},
+            ],
+        }
+        switch_2 = Switch(content, room=switch.room, default_variables=switch.default_variables)
+        render_data = switch_2.render_data
+        rendered = []
+
+        def spy(data, *args, **kwargs):
+            rendered.append(data)
+            return render_data(data, *args, **kwargs)
+
+        switch_2.render_data = spy
+
+        assert await switch_2.validate_cases() == "m2"
+        assert "{{ undefined_function() }}" not in rendered
+
+    @pytest.mark.asyncio
+    async def test_cases_are_compiled_once(self, switch: Switch):
+        compiled = Switch.compile_content(switch.content)
+        other = Switch(
+            switch.content, room=switch.room, default_variables=switch.default_variables
+        )
+        other.compiled = compiled
+
+        assert other.case_index is compiled["cases"]
+        assert await other.get_case_by_id("ok") == "request-1"
+        # A missing case falls back to the default case, or the o_connection of the node
+        assert await other.get_case_by_id("missing") == await other.get_o_connection()
@@ -79,3 +79,23 @@ async def test_set_variable_syncs_cache_for_custom_scope_billing(
 
     assert other_room.variables == "{}"
     assert not hasattr(other_room, "_vars_cache") or other_room._variables == {}
+
+
+@pytest.mark.asyncio
+async def test_deferred_route_writes_are_coalesced(room: Room):
+    room.defer_route_writes = True
+
+    await room.update_menu(node_id="switch-1")
+    await room.set_variable("route.option", "1")
+    await room.update_menu(node_id="message-1")
+
+    room.route.update.assert_not_called()
+    assert room.route.node_id == "message-1"
+
+    await room.flush_route_writes()
+    room.route.update.assert_awaited_once()
+    assert not room.defer_route_writes
+
+    # Without pending changes nothing is written
+    await room.flush_route_writes()
+    room.route.update.assert_awaited_once()
@@ -0,0 +1,81 @@
+"""Tests for the per-room ordered dispatch of the sync events."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from menuflow.room_dispatcher import RoomDispatcher
+
+
+def _event(room_id: str, event_id: str) -> SimpleNamespace:
+    return SimpleNamespace(room_id=room_id, event_id=event_id)
+
+
+@pytest.mark.asyncio
+async def test_events_of_a_room_are_handled_in_order():
+    dispatcher = RoomDispatcher()
+    handled = []
+
+    async def handler(evt):
+        # The first event is the slowest, it must still be handled first
+        await asyncio.sleep(0.02 if evt.event_id == "$1" else 0)
+        handled.append(evt.event_id)
+
+    dispatcher.start_batch()
+    for event_id in ("$1", "$2", "$3"):
+        await dispatcher.ordered(handler)(_event("!room:foo.com", event_id))
+
+    await asyncio.gather(*dispatcher.workers.values())
+
+    assert handled == ["$1", "$2", "$3"]
+    assert not dispatcher.queues
+    assert not dispatcher.workers
+
+
+@pytest.mark.asyncio
+async def test_slow_room_does_not_delay_other_rooms():
+    dispatcher = RoomDispatcher()
+    slow_room_released = asyncio.Event()
+    handled = []
+
+    async def handler(evt):
+        if evt.room_id == "!slow:foo.com":
+            await slow_room_released.wait()
+        handled.append(evt.event_id)
+
+    batch = dispatcher.start_batch(next_batch="s1")
+    dispatcher.dispatch("!slow:foo.com", handler, _event("!slow:foo.com", "$slow"))
+    dispatcher.dispatch("!fast:foo.com", handler, _event("!fast:foo.com", "$fast"))
+
+    await asyncio.wait_for(dispatcher.workers["!fast:foo.com"], timeout=1)
+    assert handled == ["$fast"]
+    assert batch.pending == 1
+
+    slow_room_released.set()
+    await asyncio.gather(*dispatcher.workers.values())
+
+    assert handled == ["$fast", "$slow"]
+    assert dispatcher.stats["batches"] == 1
+    assert batch.first_event_latency["!fast:foo.com"] < batch.first_event_latency["!slow:foo.com"]
+
+
+@pytest.mark.asyncio
+async def test_handler_errors_do_not_stop_the_room():
+    dispatcher = RoomDispatcher()
+    handled = []
+
+    async def handler(evt):
+        if evt.event_id == "$1":
+            raise ValueError("Boom")
+        handled.append(evt.event_id)
+
+    dispatcher.start_batch()
+    dispatcher.dispatch("!room:foo.com", handler, _event("!room:foo.com", "$1"))
+    dispatcher.dispatch("!room:foo.com", handler, _event("!room:foo.com", "$2"))
+    await asyncio.gather(*dispatcher.workers.values())
+
+    assert handled == ["$2"]
+    assert dispatcher.stats["batches"] == 1
@@ -0,0 +1,100 @@
+"""Tests for the room state cache fed by the sync and used by the Room participant lookups."""
+
+from __future__ import annotations
+
+from unittest.mock import AsyncMock
+
+import pytest
+from mautrix.errors.request import MNotFound
+from mautrix.types import EventType, Membership, StateEvent
+
+from menuflow.room import Room
+from menuflow.room_state_cache import RoomStateCache
+
+BRIDGE_EVENT = EventType(t="m.bridge", t_class=EventType.Class.STATE)
+
+
+def _member_event(room_id: str, mxid: str, membership: str) -> dict:
+    return {
+        "type": "m.room.member",
+        "room_id": room_id,
+        "event_id": f"$member-{mxid}",
+        "sender": mxid,
+        "state_key": mxid,
+        "origin_server_ts": 1,
+        "content": {"membership": membership},
+    }
+
+
+@pytest.fixture(autouse=True)
+def _clear_room_state_cache():
+    RoomStateCache.state_events.clear()
+    RoomStateCache.members.clear()
+    yield
+    RoomStateCache.state_events.clear()
+    RoomStateCache.members.clear()
+
+
+@pytest.mark.asyncio
+async def test_customer_mxid_is_served_from_sync(room: Room):
+    room.matrix_client.get_state_event = AsyncMock()
+    room.matrix_client.get_members = AsyncMock()
+    RoomStateCache.handle_sync_room(
+        room.room_id,
+        {
+            "state": {
+                "events": [
+                    {
+                        "type": "m.room.create",
+                        "state_key": "",
+                        "content": {"creator": "@whatsapp_573001234567:foo.com"},
+                    }
+                ]
+            }
+        },
+    )
+
+    assert await room.customer_mxid == "@whatsapp_573001234567:foo.com"
+    room.matrix_client.get_state_event.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_state_event_cold_miss_is_cached(room: Room):
+    room.matrix_client.get_state_event = AsyncMock(side_effect=MNotFound(404, "Not found"))
+
+    assert await room.get_state_event(BRIDGE_EVENT) is None
+    assert await room.get_state_event(BRIDGE_EVENT) is None
+    assert room.matrix_client.get_state_event.call_count == 1
+
+    # A new m.bridge event in the sync replaces the cached miss
+    RoomStateCache.handle_sync_event(
+        room.room_id,
+        {"type": "m.bridge", "state_key": "", "content": {"channel": {"id": "573001234567@s.wa"}}},
+    )
+    assert await room.get_ghost_number == "573001234567"
+    assert room.matrix_client.get_state_event.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_members_are_updated_by_sync(room: Room):
+    room.matrix_client.get_members = AsyncMock(
+        return_value=[
+            StateEvent.deserialize(_member_event(room.room_id, "@foo:foo.com", "join")),
+        ]
+    )
+
+    assert await room.get_puppet_mxid is None
+
+    RoomStateCache.handle_sync_event(
+        room.room_id, _member_event(room.room_id, "@acd1:foo.com", "join")
+    )
+    assert await room.get_puppet_mxid == "@acd1:foo.com"
+    assert room.matrix_client.get_members.call_count == 1
+    assert RoomStateCache.members[room.room_id]["@acd1:foo.com"] == Membership.JOIN
+
+
+def test_member_events_are_ignored_without_member_list(room: Room):
+    RoomStateCache.handle_sync_event(
+        room.room_id, _member_event(room.room_id, "@acd1:foo.com", "join")
+    )
+    assert room.room_id not in RoomStateCache.members
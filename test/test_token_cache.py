@@ -0,0 +1,94 @@
+"""Tests for the shared tokens of the JWT middlewares."""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+from collections import defaultdict
+from time import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from menuflow.middlewares.token_cache import TokenCache, token_expiration
+
+
+def make_jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def make_middleware(*tokens: str, user: str = "foo") -> SimpleNamespace:
+    async def request_token():
+        await asyncio.sleep(0.01)
+        return 200, {"token": next(responses)}, {}
+
+    responses = iter(tokens)
+    return SimpleNamespace(
+        id="api_jwt",
+        token_url="https://api.example.com/login",
+        auth={"data": {"username": user}, "variables": {"token": "token"}},
+        token_variable="token",
+        request_token=AsyncMock(side_effect=request_token),
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    TokenCache.tokens = {}
+    TokenCache.locks = defaultdict(asyncio.Lock)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_rooms_share_one_token():
+    middleware = make_middleware("a", "b")
+
+    tokens = await asyncio.gather(*(TokenCache.get_token(middleware) for _ in range(5)))
+
+    middleware.request_token.assert_awaited_once()
+    assert {token.token for token in tokens} == {"a"}
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_cached_by_credentials():
+    foo, bar = make_middleware("a", user="foo"), make_middleware("b", user="bar")
+
+    assert (await TokenCache.get_token(foo)).token == "a"
+    assert (await TokenCache.get_token(bar)).token == "b"
+    assert len(TokenCache.tokens) == 2
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_refreshed_before_they_expire():
+    middleware = make_middleware(make_jwt(time() - 1), make_jwt(time() + 3600))
+
+    first = await TokenCache.get_token(middleware)
+    second = await TokenCache.get_token(middleware)
+    third = await TokenCache.get_token(middleware)
+
+    assert first.token != second.token
+    assert second is third
+    # Refreshed in the last 30 seconds, or in the second half of the short-lived tokens
+    assert second.refresh_at == pytest.approx(time() + 3570, abs=1)
+    assert middleware.request_token.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_a_401_refreshes_each_token_once():
+    middleware = make_middleware("a", "b", "c")
+    token = await TokenCache.get_token(middleware)
+
+    await asyncio.gather(
+        *(TokenCache.invalidate(middleware, generation=token.generation) for _ in range(5))
+    )
+
+    assert (await TokenCache.get_token(middleware)).token == "b"
+    assert middleware.request_token.await_count == 2
+
+
+def test_token_expiration():
+    assert token_expiration(make_jwt(1700000000), {}) == 1700000000
+    assert token_expiration("opaque", {"expires_in": 60}) == pytest.approx(time() + 60, abs=1)
+    assert token_expiration("opaque", {}) is None
@@ -0,0 +1,62 @@
+"""Tests for the YAML loader with binary snapshots."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+from pytest_mock import MockerFixture
+
+from menuflow.utils.yaml_loader import load_yaml, snapshot_path
+
+CONTENT = "menu:\n  flow_variables: {}\n  nodes:\n    - id: start\n      type: message\n"
+
+
+@pytest.fixture
+def path(tmp_path: Path) -> Path:
+    path = tmp_path / "@menu:foo.com.yaml"
+    path.write_text(CONTENT)
+    return path
+
+
+def test_unchanged_files_are_loaded_from_the_snapshot(path: Path, mocker: MockerFixture):
+    data = load_yaml(path)
+    assert data["menu"]["nodes"] == [{"id": "start", "type": "message"}]
+    assert snapshot_path(path).exists()
+
+    yaml_load = mocker.spy(yaml, "load")
+    snapshot = load_yaml(path)
+
+    yaml_load.assert_not_called()
+    assert snapshot == data
+    assert snapshot is not data
+
+
+def test_changed_files_are_parsed_again(path: Path, mocker: MockerFixture):
+    load_yaml(path)
+    yaml_load = mocker.spy(yaml, "load")
+
+    # Same content with a new modification time
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_yaml(path)["menu"]["flow_variables"] == {}
+    yaml_load.assert_not_called()
+
+    path.write_text(CONTENT.replace("{}", "{foo: bar}"))
+    assert load_yaml(path)["menu"]["flow_variables"] == {"foo": "bar"}
+    yaml_load.assert_called_once()
+
+
+def test_invalid_snapshots_are_ignored(path: Path):
+    snapshot_path(path).write_bytes(b"invalid")
+    assert load_yaml(path)["menu"]["flow_variables"] == {}
+
+
+def test_unmarshallable_data_is_not_snapshotted(tmp_path: Path):
+    path = tmp_path / "flow_utils.yaml"
+    path.write_text("date: 2024-01-01\n")
+
+    assert load_yaml(path)["date"].year == 2024
+    assert not snapshot_path(path).exists()